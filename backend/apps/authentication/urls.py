@@ -2,7 +2,6 @@
 Authentication URLs
 """
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 
 urlpatterns = [
@@ -10,5 +9,5 @@ urlpatterns = [
     path('login/', views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('me/', views.me, name='me'),
-    path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('refresh/', views.DailyLoginTokenRefreshView.as_view(), name='token_refresh'),
 ]
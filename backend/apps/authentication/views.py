@@ -6,7 +6,12 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+from rest_framework_simplejwt.exceptions import TokenError
+from bson import ObjectId
+from bson.errors import InvalidId
 from apps.users.models import User
+from apps.gamification.action_tracker import track_daily_login
 from .serializers import (
     UserRegistrationSerializer,
     UserLoginSerializer,
@@ -53,10 +58,14 @@ def login(request):
         refresh['user_id'] = str(user.id)
         refresh['username'] = user.username
         
+        # Daily login XP (one conditional write, no read)
+        daily_login = track_daily_login(user)
+        
         return Response({
             'user': user.to_dict(),
             'access': str(refresh.access_token),
             'refresh': str(refresh),
+            'daily_login_xp': daily_login['xp_result']['xp_gained'] if daily_login['success'] else 0,
         }, status=status.HTTP_200_OK)
     
     print(f"❌ DEBUG Validation errors: {serializer.errors}")
@@ -85,3 +94,20 @@ def me(request):
         }, status=status.HTTP_404_NOT_FOUND)
     
     return Response(user.to_dict(), status=status.HTTP_200_OK)
+
+
+class DailyLoginTokenRefreshView(TokenRefreshView):
+    """Token refresh that also awards the daily login XP"""
+    
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        
+        if response.status_code == status.HTTP_200_OK:
+            try:
+                user_id = RefreshToken(request.data.get('refresh'))['user_id']
+                # Only the id is needed, so no user document is loaded
+                track_daily_login(User(id=ObjectId(user_id)))
+            except (TokenError, KeyError, InvalidId, TypeError):
+                pass  # Refresh already succeeded; XP is best effort
+        
+        return response
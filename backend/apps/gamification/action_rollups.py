@@ -0,0 +1,219 @@
+"""
+UserAction retention - daily rollups over an expiring raw log
+
+Raw UserAction documents older than USER_ACTION_ROLLUP_AFTER_DAYS are
+compacted into one UserActionRollup per user per day. Raw documents
+older than USER_ACTION_TTL_DAYS are then deleted by the same job, but
+only behind the rollup watermark, so nothing is removed before it has been
+rolled up. Statistics read rollups before the watermark plus the raw tail
+after it, so each action is counted once.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo import UpdateOne
+
+from .models import UserAction, UserActionRollup, RollupWatermark, USER_ACTION_TTL_DAYS
+
+
+WATERMARK_NAME = 'user_actions'
+
+
+def _day_start(value):
+    """Truncate a datetime to UTC midnight"""
+    return datetime(value.year, value.month, value.day)
+
+
+def get_watermark():
+    """
+    Get the rollup boundary for user actions
+
+    Returns:
+        datetime or None: Days before this are served from rollups
+    """
+    watermark = RollupWatermark.objects(name=WATERMARK_NAME).first()
+    return watermark.rolled_up_until if watermark else None
+
+
+def rollup_day(day):
+    """
+    Recompute the rollups of every user for one UTC day
+
+    Rollups are fully overwritten, so rerunning a day is harmless.
+
+    Args:
+        day (datetime): UTC midnight of the day to roll up
+
+    Returns:
+        int: Number of per-user rollup documents written
+    """
+    pipeline = [
+        {'$match': {'created_at': {'$gte': day, '$lt': day + timedelta(days=1)}}},
+        {'$group': {
+            '_id': {'user': '$user', 'action_type': '$action_type'},
+            'count': {'$sum': 1},
+            'xp_earned': {'$sum': {'$ifNull': ['$xp_awarded', 0]}},
+        }},
+    ]
+
+    per_user = {}
+    for row in UserAction.objects.aggregate(pipeline):
+        user_id = row['_id']['user']
+        per_user.setdefault(user_id, {})[row['_id']['action_type']] = {
+            'count': row['count'],
+            'xp_earned': row['xp_earned'],
+        }
+
+    operations = [
+        UpdateOne(
+            {'user': user_id, 'day': day},
+            {'$set': {
+                'by_type': by_type,
+                'total_actions': sum(v['count'] for v in by_type.values()),
+                'total_xp': sum(v['xp_earned'] for v in by_type.values()),
+            }},
+            upsert=True
+        )
+        for user_id, by_type in per_user.items()
+    ]
+    if operations:
+        UserActionRollup._get_collection().bulk_write(operations, ordered=False)
+
+    return len(operations)
+
+
+def drop_ttl_index():
+    """
+    Drop the TTL index on UserAction.created_at left by earlier deploys
+
+    Returns:
+        bool: Whether an index was dropped
+    """
+    collection = UserAction._get_collection()
+    for name, info in collection.index_information().items():
+        if info.get('key') == [('created_at', 1)] and 'expireAfterSeconds' in info:
+            collection.drop_index(name)
+            return True
+    return False
+
+
+def expire_raw_actions(ttl_days=None):
+    """
+    Delete raw actions older than the TTL that are already rolled up
+
+    Args:
+        ttl_days (int, optional): Defaults to USER_ACTION_TTL_DAYS
+
+    Returns:
+        int: Number of raw actions deleted
+    """
+    watermark = get_watermark()
+    if watermark is None:
+        return 0  # Nothing rolled up yet
+    if ttl_days is None:
+        ttl_days = USER_ACTION_TTL_DAYS
+    cutoff = min(watermark, _day_start(datetime.utcnow() - timedelta(days=ttl_days)))
+    return UserAction._get_collection().delete_many({'created_at': {'$lt': cutoff}}).deleted_count
+
+
+def rollup_user_actions(older_than_days=None):
+    """
+    Roll up all complete days older than the retention window
+
+    The watermark advances after each day, so an interrupted run resumes
+    where it stopped. Raw actions past the TTL are deleted afterwards, up
+    to the watermark only.
+
+    Args:
+        older_than_days (int, optional): Defaults to USER_ACTION_ROLLUP_AFTER_DAYS
+
+    Returns:
+        dict: {'days': int, 'rollups': int, 'expired': int, 'watermark': datetime or None}
+    """
+    drop_ttl_index()
+
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'USER_ACTION_ROLLUP_AFTER_DAYS', 30)
+    cutoff = _day_start(datetime.utcnow() - timedelta(days=older_than_days))
+
+    day = get_watermark()
+    if day is None:
+        oldest = UserAction.objects.order_by('created_at').only('created_at').first()
+        if oldest is None:
+            return {'days': 0, 'rollups': 0, 'expired': 0, 'watermark': None}
+        day = _day_start(oldest.created_at)
+
+    days = 0
+    rollups = 0
+    while day < cutoff:
+        rollups += rollup_day(day)
+        day += timedelta(days=1)
+        days += 1
+        RollupWatermark.objects(name=WATERMARK_NAME).update_one(
+            set__rolled_up_until=day,
+            set__updated_at=datetime.utcnow(),
+            upsert=True
+        )
+
+    expired = expire_raw_actions()
+
+    return {'days': days, 'rollups': rollups, 'expired': expired, 'watermark': get_watermark()}
+
+
+def get_action_totals(user, action_type=None):
+    """
+    Get per-type action counts and XP for a user over their whole history
+
+    Args:
+        user: User object
+        action_type (str, optional): Restrict to one action type
+
+    Returns:
+        dict: {action_type: {'count': int, 'xp_earned': int}}
+    """
+    watermark = get_watermark()
+    totals = {}
+
+    def add(kind, count, xp_earned):
+        entry = totals.setdefault(kind, {'count': 0, 'xp_earned': 0})
+        entry['count'] += count
+        entry['xp_earned'] += xp_earned
+
+    if watermark is not None:
+        rollup_pipeline = [
+            {'$match': {'user': user.id, 'day': {'$lt': watermark}}},
+            {'$project': {'by_type': {'$objectToArray': '$by_type'}}},
+            {'$unwind': '$by_type'},
+        ]
+        if action_type:
+            rollup_pipeline.append({'$match': {'by_type.k': action_type}})
+        rollup_pipeline.append({'$group': {
+            '_id': '$by_type.k',
+            'count': {'$sum': '$by_type.v.count'},
+            'xp_earned': {'$sum': '$by_type.v.xp_earned'},
+        }})
+        for row in UserActionRollup.objects.aggregate(rollup_pipeline):
+            add(row['_id'], row['count'], row['xp_earned'])
+
+    raw_match = {'user': user.id}
+    if watermark is not None:
+        raw_match['created_at'] = {'$gte': watermark}
+    if action_type:
+        raw_match['action_type'] = action_type
+    raw_pipeline = [
+        {'$match': raw_match},
+        {'$group': {
+            '_id': '$action_type',
+            'count': {'$sum': 1},
+            'xp_earned': {'$sum': {'$ifNull': ['$xp_awarded', 0]}},
+        }},
+    ]
+    for row in UserAction.objects.aggregate(raw_pipeline):
+        add(row['_id'], row['count'], row['xp_earned'])
+
+    return totals
+
+
+def count_actions(user, action_type):
+    """Count a user's actions of one type across rollups and raw tail"""
+    return get_action_totals(user, action_type).get(action_type, {}).get('count', 0)
@@ -3,12 +3,18 @@ User Action Tracking System
 Automatically track user actions and award XP
 """
 import json
+import logging
 from datetime import datetime
+from mongoengine import NotUniqueError
 from .models import UserAction
 from .xp_system import get_xp_reward
+from .action_rollups import get_action_totals, count_actions
 
 
-def track_action(user, action_type, target_recipe=None, **kwargs):
+logger = logging.getLogger(__name__)
+
+
+def track_action(user, action_type, target_recipe=None, event_id=None, **kwargs):
     """
     Track a user action and award XP
     
@@ -16,12 +22,16 @@ def track_action(user, action_type, target_recipe=None, **kwargs):
         user: User object
         action_type (str): Type of action (recipe_created, recipe_cooked, etc.)
         target_recipe: Recipe object (optional)
+        event_id (str, optional): Outbox event ID; makes the XP award and
+            action record idempotent when the event is redelivered (the
+            action is inserted first, under the unique event_id index, and
+            XP is only added if that insert succeeds)
         **kwargs: Additional data for metadata (has_photo, has_rating, etc.)
         
     Returns:
         dict: {
             'action': UserAction object,
-            'xp_result': dict from user.add_xp(),
+            'xp_result': dict from user.add_xp(), None for a redelivered event,
             'success': bool
         }
     """
@@ -29,12 +39,6 @@ def track_action(user, action_type, target_recipe=None, **kwargs):
         # Calculate XP reward
         xp_amount = get_xp_reward(action_type, **kwargs)
         
-        # Award XP to user
-        xp_result = user.add_xp(xp_amount, action_type=action_type)
-        
-        # Save user with new XP
-        user.save()
-        
         # Create action record
         metadata = json.dumps(kwargs) if kwargs else None
         action = UserAction(
@@ -43,9 +47,29 @@ def track_action(user, action_type, target_recipe=None, **kwargs):
             target_recipe=target_recipe,
             xp_awarded=xp_amount,
             metadata=metadata,
+            event_id=event_id,
             created_at=datetime.utcnow()
         )
-        action.save()
+        try:
+            action.save(force_insert=True)
+        except NotUniqueError:
+            if not event_id:
+                raise
+            # Event redelivered - the action and its XP were already recorded
+            return {
+                'action': UserAction.objects(event_id=event_id).first(),
+                'xp_result': None,
+                'success': True,
+                'message': f'{action_type} already recorded'
+            }
+        
+        # Award XP to user (atomic $inc)
+        try:
+            xp_result = user.add_xp(xp_amount, action_type=action_type)
+        except Exception:
+            if event_id:
+                action.delete()  # Let the retried event record it again
+            raise
         
         return {
             'action': action,
@@ -83,36 +107,39 @@ def get_user_actions(user, action_type=None, limit=50):
     return list(query.limit(limit))
 
 
+# Action types reported by get_action_stats (zero-filled when absent)
+STAT_ACTION_TYPES = [
+    'recipe_created', 'recipe_cooked', 'photo_uploaded',
+    'recipe_rated', 'comment_posted', 'recipe_liked',
+    'user_followed', 'daily_login', 'badge_earned'
+]
+
+
 def get_action_stats(user):
     """
     Get user's action statistics
     
+    Per-type counts and XP totals come from the daily rollups plus one
+    $group aggregation over the recent raw actions.
+    
     Args:
         user: User object
         
     Returns:
         dict: Statistics by action type
     """
-    actions = UserAction.objects(user=user)
+    grouped = get_action_totals(user)
     
     stats = {
-        'total_actions': actions.count(),
-        'total_xp_earned': sum(action.xp_awarded for action in actions),
+        'total_actions': sum(row['count'] for row in grouped.values()),
+        'total_xp_earned': sum(row['xp_earned'] for row in grouped.values()),
         'by_type': {}
     }
     
-    # Count actions by type
-    for action_type in ['recipe_created', 'recipe_cooked', 'photo_uploaded', 
-                       'recipe_rated', 'comment_posted', 'recipe_liked', 
-                       'user_followed', 'daily_login', 'badge_earned']:
-        type_actions = actions.filter(action_type=action_type)
-        count = type_actions.count()
-        xp = sum(action.xp_awarded for action in type_actions)
-        
-        stats['by_type'][action_type] = {
-            'count': count,
-            'xp_earned': xp
-        }
+    for action_type in STAT_ACTION_TYPES:
+        stats['by_type'][action_type] = grouped.get(
+            action_type, {'count': 0, 'xp_earned': 0}
+        )
     
     return stats
 
@@ -164,11 +191,7 @@ def track_recipe_creation(user, recipe):
         dict: Action tracking result
     """
     # Check if this is user's first recipe for bonus XP
-    from .models import UserAction
-    previous_recipes = UserAction.objects(
-        user=user,
-        action_type='recipe_created'
-    ).count()
+    previous_recipes = count_actions(user, 'recipe_created')
     
     is_first = previous_recipes == 0
     action_type = 'first_recipe' if is_first else 'recipe_created'
@@ -176,7 +199,7 @@ def track_recipe_creation(user, recipe):
     return track_action(user, action_type, target_recipe=recipe, is_first=is_first)
 
 
-def track_recipe_cooked(user, recipe, has_photo=False, has_rating=False):
+def track_recipe_cooked(user, recipe, has_photo=False, has_rating=False, event_id=None):
     """
     Track recipe cooked action with optional bonuses
     
@@ -185,6 +208,7 @@ def track_recipe_cooked(user, recipe, has_photo=False, has_rating=False):
         recipe: Recipe object
         has_photo (bool): Whether user uploaded a photo
         has_rating (bool): Whether user provided a rating
+        event_id (str, optional): Outbox event ID for idempotent replay
         
     Returns:
         dict: Action tracking result
@@ -193,14 +217,15 @@ def track_recipe_cooked(user, recipe, has_photo=False, has_rating=False):
         user,
         'recipe_cooked',
         target_recipe=recipe,
+        event_id=event_id,
         has_photo=has_photo,
         has_rating=has_rating
     )
 
 
-def track_comment_posted(user, recipe):
+def track_comment_posted(user, recipe, event_id=None):
     """Track comment posted action"""
-    return track_action(user, 'comment_posted', target_recipe=recipe)
+    return track_action(user, 'comment_posted', target_recipe=recipe, event_id=event_id)
 
 
 def track_recipe_liked(user, recipe):
@@ -215,27 +240,43 @@ def track_user_followed(user, followed_user):
 
 def track_daily_login(user):
     """
-    Track daily login (award XP once per day)
+    Track daily login (award XP once per UTC day)
+    
+    The award is a single conditional atomic update that only matches
+    while the user's ``last_daily_login`` is before today (UTC), so it
+    costs one write and no read, and concurrent logins award once.
     
     Args:
-        user: User object
+        user: User object (only ``id`` is needed)
         
     Returns:
-        dict: Action tracking result or None if already logged in today
+        dict: Action tracking result; success is False if already logged in today.
+            'action' may be None even on success if the action log write failed
     """
-    from datetime import date
+    from pymongo import ReturnDocument
+    from apps.users.models import User
     
-    # Check if user already logged in today
-    today = date.today()
-    today_start = datetime.combine(today, datetime.min.time())
+    now = datetime.utcnow()
+    today_start = datetime(now.year, now.month, now.day)
+    xp_amount = get_xp_reward('daily_login')
     
-    existing_login = UserAction.objects(
-        user=user,
-        action_type='daily_login',
-        created_at__gte=today_start
-    ).first()
+    updated = User._get_collection().find_one_and_update(
+        {
+            '_id': user.id,
+            '$or': [
+                {'last_daily_login': None},
+                {'last_daily_login': {'$lt': today_start}},
+            ]
+        },
+        {
+            '$set': {'last_daily_login': now, 'updated_at': now},
+            '$inc': {'xp': xp_amount},
+        },
+        projection={'xp': 1, 'level': 1},
+        return_document=ReturnDocument.AFTER
+    )
     
-    if existing_login:
+    if updated is None:
         return {
             'success': False,
             'message': 'Already logged in today',
@@ -243,4 +284,26 @@ def track_daily_login(user):
             'xp_result': None
         }
     
-    return track_action(user, 'daily_login')
+    xp_result = user._apply_atomic_xp(updated, xp_amount, action_type='daily_login')
+    user.last_daily_login = now
+    
+    # Keep the action log complete for statistics; the XP is already granted,
+    # so failing to record it must never fail login or token refresh
+    action = UserAction(
+        user=user.id,
+        action_type='daily_login',
+        xp_awarded=xp_amount,
+        created_at=now
+    )
+    try:
+        action.save()
+    except Exception as e:
+        logger.warning('Failed to record daily_login action for user %s: %s', user.id, e)
+        action = None
+    
+    return {
+        'action': action,
+        'xp_result': xp_result,
+        'success': True,
+        'message': f'Earned {xp_amount} XP for daily_login'
+    }
@@ -2,99 +2,194 @@
 Badge Engine - Automatic badge awarding system
 Checks user progress and awards badges when criteria are met
 """
-from .models import Badge, UserAction, CookedRecipe
+import json
+import logging
+from datetime import datetime
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+from django.core.cache import cache as django_cache
+from .models import Badge, BadgeStatsSnapshot, CookedRecipe, UserAction
+from .action_rollups import count_actions
 from apps.recipes.models import Recipe
 
 
+logger = logging.getLogger(__name__)
+
+# Retries when a concurrent request awarded one of the same badges first
+MAX_AWARD_ATTEMPTS = 3
+
+
 def check_and_award_badges(user):
     """
     Check all badge criteria and award any newly earned badges
     
+    Earned badges are added with one conditional atomic update
+    ($addToSet of the badge IDs plus $inc of their reward XP) that only
+    matches while the user holds none of them, so concurrent requests can
+    never award the same badge twice. Notifications are written with a
+    single insert_many.
+    
     Args:
         user: User object
         
     Returns:
         list: List of newly awarded badge dicts
     """
-    newly_awarded = []
-    all_badges = Badge.objects(is_active=True)
+    cache = {}
+    candidates = [
+        badge for badge in Badge.objects(is_active=True)
+        if str(badge.id) not in (user.badges or []) and meets_criteria(user, badge, cache)
+    ]
     
-    for badge in all_badges:
-        # Skip if user already has this badge
-        if str(badge.id) in user.badges:
-            continue
+    awarded = award_badges(user, candidates)
+    
+    if awarded:
+        try:
+            from .notification_helpers import notify_badges_earned
+            notify_badges_earned(user, awarded)
+        except Exception as e:
+            pass  # Don't fail if notification fails
+    
+    return [badge.to_dict() for badge in awarded]
+
+
+def award_badges(user, badges):
+    """
+    Atomically award badges and their reward XP
+    
+    Args:
+        user: User object
+        badges (list): Badge objects to award
+        
+    Returns:
+        list: Badge objects actually awarded by this call
+    """
+    from pymongo import ReturnDocument
+    from apps.users.models import User
+    
+    collection = User._get_collection()
+    
+    for _ in range(MAX_AWARD_ATTEMPTS):
+        if not badges:
+            return []
+        
+        badge_ids = [str(badge.id) for badge in badges]
+        xp_reward = sum(badge.xp_reward or 0 for badge in badges)
+        
+        updated = collection.find_one_and_update(
+            {'_id': user.id, 'badges': {'$nin': badge_ids}},
+            {
+                '$addToSet': {'badges': {'$each': badge_ids}},
+                '$inc': {'xp': xp_reward},
+                '$set': {'updated_at': datetime.utcnow()},
+            },
+            projection={'xp': 1, 'level': 1, 'badges': 1},
+            return_document=ReturnDocument.AFTER
+        )
         
-        # Check if user meets criteria
-        if meets_criteria(user, badge):
-            # Award badge
-            user.badges.append(str(badge.id))
-            
-            # Award bonus XP if badge has it
-            if badge.xp_reward > 0:
-                user.add_xp(badge.xp_reward, action_type='badge_earned')
-            
-            # Send notification
-            try:
-                from .notification_helpers import notify_badge_earned
-                notify_badge_earned(user, badge)
-            except Exception as e:
-                pass  # Don't fail if notification fails
-            
-            newly_awarded.append(badge.to_dict())
-    
-    # Save user if badges were awarded
-    if newly_awarded:
-        user.save()
-    
-    return newly_awarded
+        if updated is not None:
+            user.badges = updated.get('badges', [])
+            if xp_reward:
+                user._apply_atomic_xp(updated, xp_reward, action_type='badge_earned')
+            record_badge_actions(user, badges)
+            return badges
+        
+        # Someone else awarded part of this batch - drop what is already held
+        current = collection.find_one({'_id': user.id}, {'badges': 1}) or {}
+        held = set(current.get('badges', []))
+        user.badges = list(held)
+        badges = [badge for badge in badges if str(badge.id) not in held]
+    
+    return []
 
 
-def meets_criteria(user, badge):
+def record_badge_actions(user, badges):
     """
-    Check if user meets the criteria for a badge
+    Record one badge_earned UserAction per awarded badge (one insert_many)
+    
+    These feed the action stats and the followers' activity feed. Each
+    action has a per-badge event_id, so recording the same award twice
+    only hits the unique index and is ignored.
+    """
+    now = datetime.utcnow()
+    documents = [
+        UserAction(
+            user=user,
+            action_type='badge_earned',
+            xp_awarded=badge.xp_reward or 0,
+            metadata=json.dumps({'badge_id': str(badge.id)}),
+            event_id=f'badge_earned:{user.id}:{badge.id}',
+            created_at=now
+        ).to_mongo().to_dict()
+        for badge in badges
+    ]
+    if not documents:
+        return
+    try:
+        UserAction._get_collection().insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            logger.error('Failed to record badge_earned actions for user %s: %s', user.id, e.details)
+    except Exception as e:
+        # The award itself already succeeded
+        logger.error('Failed to record badge_earned actions for user %s: %s', user.id, e)
+
+
+def get_criteria_value(user, criteria_type, cache=None):
+    """
+    Get user's current value for a badge criteria type
     
     Args:
         user: User object
-        badge: Badge object
+        criteria_type (str): Badge criteria type
+        cache (dict, optional): Memoizes values across badges of one check
         
     Returns:
-        bool: True if criteria met
+        int: Current value (0 for unknown or special criteria)
     """
-    criteria_type = badge.criteria_type
-    criteria_value = badge.criteria_value
+    if cache is not None and criteria_type in cache:
+        return cache[criteria_type]
     
+    value = 0
     if criteria_type == 'recipes_created':
-        count = Recipe.objects(author=user).count()
-        return count >= criteria_value
-    
+        value = Recipe.objects(author=user).count()
     elif criteria_type == 'recipes_cooked':
-        count = CookedRecipe.objects(user=user).count()
-        return count >= criteria_value
-    
+        value = CookedRecipe.objects(user=user).count()
     elif criteria_type == 'total_xp':
-        return user.xp >= criteria_value
-    
+        value = user.xp
     elif criteria_type == 'level_reached':
-        return user.level >= criteria_value
-    
+        value = user.level
     elif criteria_type == 'followers':
-        return len(user.followers) >= criteria_value
-    
+        value = user.followers_count or 0
     elif criteria_type == 'likes_received':
         # Count total likes on user's recipes
         user_recipes = Recipe.objects(author=user)
-        total_likes = sum(getattr(recipe, 'likes_count', 0) for recipe in user_recipes)
-        return total_likes >= criteria_value
-    
+        value = sum(getattr(recipe, 'likes_count', 0) for recipe in user_recipes)
     elif criteria_type == 'comments_posted':
-        count = UserAction.objects(user=user, action_type='comment_posted').count()
-        return count >= criteria_value
+        value = count_actions(user, 'comment_posted')
     
-    elif criteria_type == 'special':
+    if cache is not None:
+        cache[criteria_type] = value
+    return value
+
+
+def meets_criteria(user, badge, cache=None):
+    """
+    Check if user meets the criteria for a badge
+    
+    Args:
+        user: User object
+        badge: Badge object
+        cache (dict, optional): Memoized criteria values
+        
+    Returns:
+        bool: True if criteria met
+    """
+    if badge.criteria_type == 'special':
         # Special badges are manually awarded by admin
         return False
     
-    return False
+    return get_criteria_value(user, badge.criteria_type, cache) >= badge.criteria_value
 
 
 def get_user_badges(user):
@@ -114,36 +209,20 @@ def get_user_badges(user):
     return [badge.to_dict() for badge in badges]
 
 
-def get_badge_progress(user, badge):
+def get_badge_progress(user, badge, cache=None):
     """
     Get user's progress towards a specific badge
     
     Args:
         user: User object
         badge: Badge object
+        cache (dict, optional): Memoized criteria values
         
     Returns:
         dict: Progress information
     """
-    criteria_type = badge.criteria_type
     criteria_value = badge.criteria_value
-    current_value = 0
-    
-    if criteria_type == 'recipes_created':
-        current_value = Recipe.objects(author=user).count()
-    elif criteria_type == 'recipes_cooked':
-        current_value = CookedRecipe.objects(user=user).count()
-    elif criteria_type == 'total_xp':
-        current_value = user.xp
-    elif criteria_type == 'level_reached':
-        current_value = user.level
-    elif criteria_type == 'followers':
-        current_value = len(user.followers)
-    elif criteria_type == 'likes_received':
-        user_recipes = Recipe.objects(author=user)
-        current_value = sum(getattr(recipe, 'likes_count', 0) for recipe in user_recipes)
-    elif criteria_type == 'comments_posted':
-        current_value = UserAction.objects(user=user, action_type='comment_posted').count()
+    current_value = get_criteria_value(user, badge.criteria_type, cache)
     
     percentage = min(100, (current_value / criteria_value * 100)) if criteria_value > 0 else 0
     
@@ -176,8 +255,9 @@ def get_all_badges_progress(user):
     in_progress = []
     locked = []
     
+    cache = {}
     for badge in all_badges:
-        progress = get_badge_progress(user, badge)
+        progress = get_badge_progress(user, badge, cache)
         
         if progress['earned']:
             earned.append(progress)
@@ -193,6 +273,78 @@ def get_all_badges_progress(user):
     }
 
 
+BADGE_STATS_CACHE_KEY = 'gamification:badge_stats'
+
+
+def refresh_badge_stats():
+    """
+    Recompute badge ownership with one $unwind/$group over users.badges
+    and store it in the badge_stats snapshot
+    
+    Meant to run on a schedule (`python manage.py refresh_badge_stats`),
+    never from a request.
+    
+    Returns:
+        BadgeStatsSnapshot: The refreshed snapshot
+    """
+    from apps.users.models import User
+    
+    pipeline = [
+        {'$match': {'is_active': True, 'badges.0': {'$exists': True}}},
+        {'$unwind': '$badges'},
+        {'$group': {'_id': '$badges', 'holders': {'$sum': 1}}},
+    ]
+    holders = {row['_id']: row['holders'] for row in User.objects.aggregate(pipeline)}
+    total_users = User.objects(is_active=True).count()
+    
+    snapshot = BadgeStatsSnapshot.objects(name='badges').modify(
+        upsert=True,
+        new=True,
+        set__total_users=total_users,
+        set__holders=holders,
+        set__computed_at=datetime.utcnow()
+    )
+    django_cache.delete(BADGE_STATS_CACHE_KEY)
+    return snapshot
+
+
+def get_badge_stats():
+    """
+    Get badge ownership statistics from cache or the materialized snapshot
+    
+    Returns:
+        dict: {
+            'total_users': int,
+            'computed_at': ISO string or None,
+            'badges': {badge_id: {'holders': int, 'percentage': float}}
+        }
+    """
+    stats = django_cache.get(BADGE_STATS_CACHE_KEY)
+    if stats is not None:
+        return stats
+    
+    snapshot = BadgeStatsSnapshot.objects(name='badges').first()
+    total_users = snapshot.total_users if snapshot else 0
+    holders = snapshot.holders if snapshot else {}
+    
+    stats = {
+        'total_users': total_users,
+        'computed_at': snapshot.computed_at.isoformat() if snapshot else None,
+        'badges': {
+            badge_id: {
+                'holders': count,
+                'percentage': round(count / total_users * 100, 2) if total_users else 0.0,
+            }
+            for badge_id, count in holders.items()
+        }
+    }
+    django_cache.set(
+        BADGE_STATS_CACHE_KEY, stats,
+        getattr(settings, 'BADGE_STATS_CACHE_SECONDS', 300)
+    )
+    return stats
+
+
 def create_default_badges():
     """
     Create default badge set if none exist
@@ -0,0 +1,334 @@
+"""
+Challenge Engine - participation, progress and completion for challenges
+
+Progress is measured by aggregating cooked_recipes / user_actions inside
+the challenge window. At end_date every participant is scored in chunks
+with one aggregation per chunk, and rewards are applied with bulk writes.
+Each participation is paid at most once: rewards only go to the rows whose
+``rewarded`` flag this call switched on.
+"""
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from mongoengine import NotUniqueError
+from pymongo import UpdateOne
+
+from apps.users.gamification import Challenge, ChallengeParticipation
+from apps.users.models import User
+from .models import CookedRecipe, UserAction
+from .xp_system import calculate_level_from_xp
+
+
+logger = logging.getLogger(__name__)
+
+# Participants scored per aggregation during end_date evaluation
+EVALUATION_CHUNK_SIZE = 500
+
+# rules['metric'] values measured on cooked_recipes; any UserAction
+# action_type is accepted as a metric as well
+COOKED_METRICS = ['recipes_cooked', 'photos_uploaded']
+
+
+class ChallengeError(Exception):
+    """Raised when a challenge operation is not allowed"""
+
+
+def supported_metrics():
+    """Every accepted rules['metric'] value"""
+    return COOKED_METRICS + list(UserAction.action_type.choices)
+
+
+def validate_rules(rules):
+    """
+    Check challenge rules before a challenge is stored
+
+    Raises:
+        ChallengeError: For an unknown metric or a non-positive target
+    """
+    if not isinstance(rules, dict):
+        raise ChallengeError('rules must be an object')
+    metric = rules.get('metric', 'recipes_cooked')
+    if metric not in supported_metrics():
+        raise ChallengeError(
+            f"Unknown challenge metric: {metric}. Supported: {', '.join(supported_metrics())}"
+        )
+    try:
+        target = int(rules.get('target', 1))
+    except (TypeError, ValueError):
+        raise ChallengeError('rules.target must be an integer')
+    if target < 1:
+        raise ChallengeError('rules.target must be at least 1')
+
+
+def get_challenge_target(challenge):
+    """Metric value a participant needs to complete the challenge"""
+    return max(1, int((challenge.rules or {}).get('target', 1)))
+
+
+def compute_progress(challenge, user_ids):
+    """
+    Measure the challenge metric for many users with one aggregation
+
+    Args:
+        challenge: Challenge object
+        user_ids (list): ObjectIds of the users to score
+
+    Returns:
+        dict: {user_id: metric value}; users without activity are absent
+    """
+    if not user_ids:
+        return {}
+
+    metric = (challenge.rules or {}).get('metric', 'recipes_cooked')
+    window = {'$gte': challenge.start_date, '$lte': challenge.end_date}
+
+    if metric in COOKED_METRICS:
+        document = CookedRecipe
+        match = {'user': {'$in': list(user_ids)}, 'cooked_at': window}
+        if metric == 'photos_uploaded':
+            match['photo_url'] = {'$nin': [None, '']}
+    elif metric in UserAction.action_type.choices:
+        document = UserAction
+        match = {
+            'user': {'$in': list(user_ids)},
+            'action_type': metric,
+            'created_at': window,
+        }
+    else:
+        raise ChallengeError(f'Unknown challenge metric: {metric}')
+
+    pipeline = [
+        {'$match': match},
+        {'$group': {'_id': '$user', 'value': {'$sum': 1}}},
+    ]
+    return {row['_id']: row['value'] for row in document.objects.aggregate(pipeline)}
+
+
+def join_challenge(challenge, user):
+    """
+    Add a user to a challenge
+
+    Returns:
+        tuple: (ChallengeParticipation, created)
+    """
+    if not challenge.is_ongoing():
+        raise ChallengeError('Challenge is not active')
+
+    participation = ChallengeParticipation(challenge=challenge, user=user)
+    try:
+        participation.save()
+    except NotUniqueError:
+        existing = ChallengeParticipation.objects(challenge=challenge, user=user).first()
+        return existing, False
+
+    Challenge.objects(id=challenge.id).update_one(inc__participants_count=1)
+    return participation, True
+
+
+def get_progress(challenge, user):
+    """
+    Refresh and return a user's progress in a challenge
+
+    Returns:
+        dict or None: Progress info, or None if the user has not joined
+    """
+    participation = ChallengeParticipation.objects(challenge=challenge, user=user).first()
+    if not participation:
+        return None
+
+    if participation.status != 'completed' and challenge.evaluated_at is None:
+        value = compute_progress(challenge, [user.id]).get(user.id, 0)
+        if value != participation.progress:
+            participation.progress = value
+            ChallengeParticipation.objects(id=participation.id).update_one(
+                set__progress=value,
+                set__updated_at=datetime.utcnow()
+            )
+
+    target = get_challenge_target(challenge)
+    return {
+        'status': participation.status,
+        'progress': participation.progress,
+        'target': target,
+        'percentage': round(min(100, participation.progress / target * 100), 2),
+        'joined_at': participation.joined_at.isoformat() if participation.joined_at else None,
+        'completed_at': (
+            participation.completed_at.isoformat() if participation.completed_at else None
+        ),
+    }
+
+
+def _claim_rewards(challenge, user_ids):
+    """
+    Flag the participations of users as rewarded, once
+
+    One conditional update tags every not yet rewarded row with a token of
+    this call; only the rows carrying the token are paid, so concurrent or
+    repeated calls never pay the same participation twice.
+
+    Returns:
+        list: Ids of the users whose rewards this call must pay
+    """
+    claim = ObjectId()
+    collection = ChallengeParticipation._get_collection()
+    collection.update_many(
+        {'challenge': challenge.id, 'user': {'$in': list(user_ids)}, 'rewarded': {'$ne': True}},
+        {'$set': {'rewarded': True, 'reward_claim': claim}}
+    )
+    return [
+        row['user']
+        for row in collection.find({'challenge': challenge.id, 'reward_claim': claim}, {'user': 1})
+    ]
+
+
+def _award_update(challenge):
+    """User update applying the challenge rewards"""
+    update = {'$set': {'updated_at': datetime.utcnow()}}
+    if challenge.reward_xp:
+        update['$inc'] = {'xp': challenge.reward_xp}
+    if challenge.reward_badge:
+        update['$addToSet'] = {'badges': str(challenge.reward_badge.id)}
+    return update
+
+
+def _sync_levels(user_ids):
+    """Recalculate stored levels after bulk XP increments"""
+    operations = []
+    for row in User.objects(id__in=list(user_ids)).only('xp', 'level').as_pymongo():
+        level = calculate_level_from_xp(row.get('xp', 0))
+        if level > row.get('level', 1):
+            operations.append(UpdateOne(
+                {'_id': row['_id'], 'level': {'$lt': level}},
+                {'$set': {'level': level}}
+            ))
+    if operations:
+        User._get_collection().bulk_write(operations, ordered=False)
+
+
+def award_completers(challenge, user_ids):
+    """
+    Give the challenge rewards to users, at most once per participation
+
+    Returns:
+        list: Ids of the users paid by this call
+    """
+    if not user_ids or not (challenge.reward_xp or challenge.reward_badge):
+        return []
+    paid = _claim_rewards(challenge, user_ids)
+    if not paid:
+        return []
+    User._get_collection().update_many({'_id': {'$in': paid}}, _award_update(challenge))
+    if challenge.reward_xp:
+        _sync_levels(paid)
+    return paid
+
+
+def complete_challenge(challenge, user):
+    """
+    Complete a challenge for one user if they reached the target
+
+    Returns:
+        bool: True if the user completed the challenge with this call
+    """
+    progress = get_progress(challenge, user)
+    if progress is None:
+        raise ChallengeError('You have not joined this challenge')
+    if progress['status'] == 'completed':
+        return False
+    if progress['progress'] < progress['target']:
+        return False
+
+    now = datetime.utcnow()
+    updated = ChallengeParticipation.objects(
+        challenge=challenge, user=user, status='joined'
+    ).update_one(set__status='completed', set__completed_at=now, set__updated_at=now)
+    if not updated:
+        return False
+
+    Challenge.objects(id=challenge.id).update_one(inc__completers_count=1)
+    award_completers(challenge, [user.id])
+    return True
+
+
+def evaluate_challenge(challenge, chunk_size=EVALUATION_CHUNK_SIZE):
+    """
+    Score every participant of a finished challenge and reward new completers
+
+    Participants are read in _id order in chunks; each chunk costs one
+    progress aggregation, one participation bulk write and the reward
+    writes. Users who had already completed (and been paid by
+    complete_challenge or a migration) are not rewarded again. Safe to
+    rerun after an interruption.
+
+    Returns:
+        dict: {'participants': int, 'completed': int}
+    """
+    target = get_challenge_target(challenge)
+    collection = ChallengeParticipation._get_collection()
+    last_id = None
+    participants = 0
+    newly_completed = 0
+
+    while True:
+        query = {'challenge': challenge.id}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        chunk = list(
+            collection.find(query, {'user': 1, 'status': 1})
+            .sort('_id', 1)
+            .limit(chunk_size)
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1]['_id']
+        participants += len(chunk)
+
+        values = compute_progress(challenge, [row['user'] for row in chunk])
+        now = datetime.utcnow()
+        operations = []
+        completers = []
+
+        for row in chunk:
+            value = values.get(row['user'], 0)
+            update = {'$set': {'progress': value, 'updated_at': now}}
+            if value >= target and row.get('status') != 'completed':
+                completers.append(row['user'])
+                newly_completed += 1
+                update['$set'].update({'status': 'completed', 'completed_at': now})
+            operations.append(UpdateOne({'_id': row['_id']}, update))
+
+        collection.bulk_write(operations, ordered=False)
+        award_completers(challenge, completers)
+
+    completers_count = ChallengeParticipation.objects(
+        challenge=challenge, status='completed'
+    ).count()
+    Challenge.objects(id=challenge.id).update_one(
+        set__completers_count=completers_count,
+        set__participants_count=participants,
+        set__is_active=False,
+        set__evaluated_at=datetime.utcnow()
+    )
+
+    return {'participants': participants, 'completed': newly_completed}
+
+
+def evaluate_due_challenges():
+    """
+    Evaluate every challenge whose end_date has passed
+
+    Returns:
+        list: (challenge title, evaluation result) tuples; the result is
+            {'error': str} for a challenge that failed
+    """
+    results = []
+    due = Challenge.objects(end_date__lte=datetime.utcnow(), evaluated_at=None)
+    for challenge in due:
+        # One broken challenge must not block the others; it stays due
+        try:
+            results.append((challenge.title, evaluate_challenge(challenge)))
+        except Exception as e:
+            logger.exception('Failed to evaluate challenge %s', challenge.id)
+            results.append((challenge.title, {'error': str(e)}))
+    return results
@@ -0,0 +1,274 @@
+"""
+Challenge API endpoints
+"""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.response import Response
+from rest_framework import status
+from datetime import datetime
+from mongoengine import ValidationError
+
+from apps.users.gamification import Challenge, ChallengeParticipation
+from .challenge_engine import (
+    ChallengeError,
+    validate_rules,
+    join_challenge,
+    get_progress,
+    complete_challenge
+)
+
+
+def _get_challenge(challenge_id):
+    try:
+        return Challenge.objects(id=challenge_id).first()
+    except ValidationError:
+        return None
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+def challenges_list_create(request):
+    """
+    List or create challenges
+    GET /api/gamification/challenges/?include_past=false
+    POST /api/gamification/challenges/ (admin only)
+    Body: {
+        "title": "...", "description": "...",
+        "rules": {"metric": "recipes_cooked", "target": 5},
+        "reward_xp": 100, "start_date": "ISO", "end_date": "ISO"
+    }
+    """
+    try:
+        if request.method == 'GET':
+            include_past = request.GET.get('include_past', 'false').lower() == 'true'
+
+            challenges = Challenge.objects.order_by('end_date')
+            if not include_past:
+                challenges = challenges.filter(is_active=True, end_date__gte=datetime.utcnow())
+
+            results = [challenge.to_dict() for challenge in challenges]
+
+            # Resolve the current user's participation for the whole page at once
+            if request.user.is_authenticated and results:
+                joined = {
+                    str(row['challenge']): row.get('status')
+                    for row in ChallengeParticipation.objects(
+                        user=request.user.id,
+                        challenge__in=[c['id'] for c in results]
+                    ).only('challenge', 'status').as_pymongo()
+                }
+                for result in results:
+                    result['my_status'] = joined.get(result['id'])
+
+            return Response({
+                'challenges': results,
+                'total': len(results)
+            }, status=status.HTTP_200_OK)
+
+        # POST - admin only
+        if not request.user.is_authenticated or not getattr(request.user, 'is_admin', False):
+            return Response(
+                {'error': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        data = request.data
+        try:
+            start_date = datetime.fromisoformat(data['start_date'])
+            end_date = datetime.fromisoformat(data['end_date'])
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'start_date and end_date must be ISO datetimes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_date <= start_date:
+            return Response(
+                {'error': 'end_date must be after start_date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rules = data.get('rules') or {}
+        try:
+            validate_rules(rules)
+        except ChallengeError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            reward_xp = int(data.get('reward_xp', 0))
+        except (TypeError, ValueError):
+            reward_xp = -1
+        if reward_xp < 0:
+            return Response(
+                {'error': 'reward_xp must be a non-negative integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        challenge = Challenge(
+            title=data.get('title', '').strip(),
+            description=data.get('description', ''),
+            rules=rules,
+            reward_xp=reward_xp,
+            start_date=start_date,
+            end_date=end_date
+        )
+        challenge.save()
+
+        return Response({
+            'challenge': challenge.to_dict()
+        }, status=status.HTTP_201_CREATED)
+
+    except ValidationError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def challenge_detail(request, challenge_id):
+    """
+    Get a challenge
+    GET /api/gamification/challenges/{id}/
+    """
+    try:
+        challenge = _get_challenge(challenge_id)
+        if not challenge:
+            return Response(
+                {'error': 'Challenge not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        data = challenge.to_dict()
+        if request.user.is_authenticated:
+            data['my_progress'] = get_progress(challenge, request.user)
+
+        return Response({'challenge': data}, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def join_challenge_view(request, challenge_id):
+    """
+    Join a challenge
+    POST /api/gamification/challenges/{id}/join/
+    """
+    try:
+        challenge = _get_challenge(challenge_id)
+        if not challenge:
+            return Response(
+                {'error': 'Challenge not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        participation, created = join_challenge(challenge, request.user)
+
+        return Response({
+            'message': 'Joined challenge' if created else 'Already joined',
+            'joined': created,
+            'progress': get_progress(challenge, request.user)
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    except ChallengeError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def challenge_progress(request, challenge_id):
+    """
+    Get current user's progress in a challenge
+    GET /api/gamification/challenges/{id}/progress/
+    """
+    try:
+        challenge = _get_challenge(challenge_id)
+        if not challenge:
+            return Response(
+                {'error': 'Challenge not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        progress = get_progress(challenge, request.user)
+        if progress is None:
+            return Response(
+                {'error': 'You have not joined this challenge'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response({'progress': progress}, status=status.HTTP_200_OK)
+
+    except ChallengeError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_challenge_view(request, challenge_id):
+    """
+    Claim completion of a challenge once the target is reached
+    POST /api/gamification/challenges/{id}/complete/
+    """
+    try:
+        challenge = _get_challenge(challenge_id)
+        if not challenge:
+            return Response(
+                {'error': 'Challenge not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        completed = complete_challenge(challenge, request.user)
+        progress = get_progress(challenge, request.user)
+
+        if completed:
+            message = 'Challenge completed!'
+        elif progress['status'] == 'completed':
+            message = 'Challenge already completed'
+        else:
+            message = f"Keep going! {progress['progress']}/{progress['target']}"
+
+        return Response({
+            'completed': completed,
+            'message': message,
+            'reward_xp': challenge.reward_xp if completed else 0,
+            'progress': progress
+        }, status=status.HTTP_200_OK)
+
+    except ChallengeError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -6,22 +6,23 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from datetime import datetime
+from mongoengine import NotUniqueError
+from pymongo import ReturnDocument
 
-from .models import Comment
+from .models import Comment, CommentLike, liked_comment_ids
 from apps.recipes.models import Recipe
 from apps.users.models import User
-from apps.gamification.action_tracker import track_comment_posted
-from apps.gamification.badge_engine import check_and_award_badges
+from apps.gamification.outbox import publish_event
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
 def comments_list_create(request, slug):
     """
-    List or create comments on a recipe
+    List top-level comments or create a comment/reply on a recipe
     GET /api/recipes/:slug/comments/?page=1&limit=20
     POST /api/recipes/:slug/comments/
-    Body: { "content": "comment text" }
+    Body: { "content": "comment text", "parent_id": "optional comment id" }
     """
     try:
         # Get recipe
@@ -42,12 +43,19 @@ def comments_list_create(request, slug):
             offset = (page - 1) * limit
             
             # Get comments
-            total_comments = Comment.objects(recipe=recipe).count()
-            comments = Comment.objects(recipe=recipe).order_by('-created_at').skip(offset).limit(limit)
+            # Get top-level comments; replies load per thread
+            # (total from the counter on the recipe, no count query)
+            total_comments = recipe.thread_count or 0
+            comments = Comment.objects(recipe=recipe, depth=0).order_by('-created_at').skip(offset).limit(limit)
             
-            # Convert to dict
+            # Convert to dict, resolving is_liked for the whole page at once
+            comments = list(comments)
             current_user = request.user if request.user.is_authenticated else None
-            comments_data = [comment.to_dict(current_user=current_user) for comment in comments]
+            liked_ids = liked_comment_ids(current_user, [comment.id for comment in comments])
+            comments_data = [
+                comment.to_dict(current_user=current_user, liked_ids=liked_ids)
+                for comment in comments
+            ]
             
             # Calculate pagination info
             total_pages = (total_comments + limit - 1) // limit  # Ceiling division
@@ -56,6 +64,7 @@ def comments_list_create(request, slug):
             
             return Response({
                 'comments': comments_data,
+                'comment_count': recipe.comment_count or 0,
                 'pagination': {
                     'page': page,
                     'limit': limit,
@@ -90,40 +99,49 @@ def comments_list_create(request, slug):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # Resolve the comment being replied to
+            parent = None
+            parent_id = request.data.get('parent_id')
+            if parent_id:
+                parent = Comment.objects(id=parent_id, recipe=recipe, is_deleted__ne=True).first()
+                if not parent:
+                    return Response(
+                        {'error': 'Parent comment not found'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+            
             # Create comment
             comment = Comment(
                 user=request.user,
                 recipe=recipe,
                 content=content
             )
-            comment.save()
-            
-            # Track action and award XP
-            xp_result = track_comment_posted(request.user, recipe)
-            
-            # Check for badge achievements
-            badges_earned = check_and_award_badges(request.user)
-            
-            # Send notification to recipe author
-            try:
-                from .notification_helpers import notify_new_comment
-                notify_new_comment(recipe.author, request.user, recipe, comment)
-            except Exception as e:
-                pass  # Don't fail if notification fails
+            comment.assign_thread(parent)
+            comment.save(force_insert=True)
+            if comment.parent:
+                Comment.objects(id=comment.parent.id).update_one(inc__reply_count=1)
+                Recipe.objects(id=recipe.id).update_one(inc__comment_count=1)
+            else:
+                Recipe.objects(id=recipe.id).update_one(inc__comment_count=1, inc__thread_count=1)
             
-            # Extract serializable data from xp_result
-            xp_awarded = 0
-            level_up_info = None
-            if xp_result and xp_result.get('action'):
-                xp_awarded = xp_result['action'].xp_awarded
-            if xp_result and xp_result.get('xp_result'):
-                level_up_info = xp_result['xp_result']
+            # XP, badges and notifications are applied by the outbox worker
+            payload = {'recipe_id': str(recipe.id), 'comment_id': str(comment.id)}
+            if comment.parent:
+                payload['parent_comment_id'] = str(comment.parent.id)
+            if parent:
+                # The comment actually replied to; past MAX_COMMENT_DEPTH the
+                # reply is stored under its grandparent instead
+                payload['replied_to_comment_id'] = str(parent.id)
+                payload['replied_to_user_id'] = str(parent._data['user'].id)
+            event = publish_event('comment_posted', request.user, **payload)
+            outcome = event.result or {}
             
             return Response({
-                'comment': comment.to_dict(current_user=request.user),
-                'xp_awarded': xp_awarded,
-                'level_up': level_up_info,
-                'badges_earned': badges_earned
+                'comment': comment.to_dict(current_user=request.user, liked_ids=set()),
+                'xp_awarded': outcome.get('xp_awarded', 0),
+                'level_up': outcome.get('xp_result'),
+                'badges_earned': outcome.get('badges_earned', []),
+                'rewards_pending': event.status != 'done'
             }, status=status.HTTP_201_CREATED)
     
     except Recipe.DoesNotExist:
@@ -143,6 +161,65 @@ def comments_list_create(request, slug):
         )
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def comment_replies(request, comment_id):
+    """
+    Get the replies below a comment, depth-first in thread order
+    GET /api/comments/:id/replies/?page=1&limit=50
+    
+    The whole subtree is one indexed range query on the materialized path.
+    """
+    try:
+        comment = Comment.objects.get(id=comment_id)
+        
+        page = max(int(request.GET.get('page', 1)), 1)
+        limit = int(request.GET.get('limit', 50))
+        if limit < 1 or limit > 200:
+            limit = 50
+        offset = (page - 1) * limit
+        
+        replies = Comment.objects(__raw__={'path': comment.subtree_range()}).order_by('path')
+        total = replies.count()
+        replies = list(replies.skip(offset).limit(limit))
+        
+        current_user = request.user if request.user.is_authenticated else None
+        liked_ids = liked_comment_ids(current_user, [reply.id for reply in replies])
+        total_pages = (total + limit - 1) // limit
+        
+        return Response({
+            'comment_id': str(comment.id),
+            'replies': [
+                reply.to_dict(current_user=current_user, liked_ids=liked_ids)
+                for reply in replies
+            ],
+            'pagination': {
+                'page': page,
+                'limit': limit,
+                'total': total,
+                'total_pages': total_pages,
+                'has_next': page < total_pages,
+                'has_prev': page > 1
+            }
+        }, status=status.HTTP_200_OK)
+    
+    except Comment.DoesNotExist:
+        return Response(
+            {'error': 'Comment not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except ValueError:
+        return Response(
+            {'error': 'Invalid pagination parameters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_comment(request, comment_id):
@@ -152,8 +229,8 @@ def update_comment(request, comment_id):
     Body: { "content": "updated text" }
     """
     try:
-        # Get comment
-        comment = Comment.objects.get(id=comment_id)
+        # Get comment (deleted placeholders can't be changed)
+        comment = Comment.objects.get(id=comment_id, is_deleted__ne=True)
         
         # Check if user is the author
         if str(comment.user.id) != str(request.user.id):
@@ -201,16 +278,49 @@ def update_comment(request, comment_id):
         )
 
 
+def _remove_comment(comment_id, recipe_id, parent_id):
+    """
+    Remove a comment without replies and update the counters
+    
+    The parent's reply_count never goes below zero (it may have been
+    removed concurrently). A deleted parent left without replies is
+    removed in turn, up the thread.
+    """
+    collection = Comment._get_collection()
+    while comment_id is not None:
+        if not Comment.objects(id=comment_id).delete():
+            return  # Removed concurrently
+        Recipe.objects(id=recipe_id).update_one(
+            inc__comment_count=-1,
+            inc__thread_count=0 if parent_id else -1
+        )
+        if parent_id is None:
+            return
+        
+        Comment.objects(id=parent_id, reply_count__gt=0).update_one(inc__reply_count=-1)
+        placeholder = collection.find_one(
+            {'_id': parent_id, 'is_deleted': True, 'reply_count': {'$lte': 0}},
+            projection={'parent': 1}
+        )
+        comment_id = placeholder['_id'] if placeholder else None
+        parent_id = placeholder.get('parent') if placeholder else None
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_comment(request, comment_id):
     """
     Delete a comment (only by the comment author)
     DELETE /api/comments/:id/
+    
+    A comment without replies is removed. A comment with replies is
+    soft-deleted instead: it stays in the thread as a placeholder without
+    author or content, so other users' replies are never removed with it.
+    Placeholders left without replies are removed as well.
     """
     try:
-        # Get comment
-        comment = Comment.objects.get(id=comment_id)
+        # Get comment (deleted placeholders can't be changed)
+        comment = Comment.objects.get(id=comment_id, is_deleted__ne=True)
         
         # Check if user is the author
         if str(comment.user.id) != str(request.user.id):
@@ -219,8 +329,17 @@ def delete_comment(request, comment_id):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Delete comment
-        comment.delete()
+        CommentLike.objects(comment=comment.id).delete()
+        if comment.reply_count:
+            Comment.objects(id=comment.id).update_one(
+                set__is_deleted=True,
+                set__content='',
+                set__likes_count=0,
+                set__updated_at=datetime.utcnow()
+            )
+        else:
+            parent_ref = comment._data.get('parent')
+            _remove_comment(comment.id, comment._data['recipe'].id, parent_ref.id if parent_ref else None)
         
         return Response({
             'message': 'Comment deleted successfully'
@@ -246,21 +365,32 @@ def toggle_comment_like(request, comment_id):
     POST /api/comments/:id/like/
     """
     try:
-        # Get comment
-        comment = Comment.objects.get(id=comment_id)
-        
-        # Check if user already liked
-        user_liked = any(str(like.id) == str(request.user.id) for like in comment.likes)
+        # Get comment (deleted placeholders can't be changed)
+        comment = Comment.objects.get(id=comment_id, is_deleted__ne=True)
         
-        if user_liked:
-            # Unlike - remove user from likes
-            comment.likes = [like for like in comment.likes if str(like.id) != str(request.user.id)]
+        # Unlike if a like exists, otherwise like; the unique (comment, user)
+        # index makes concurrent toggles safe and the counter exact
+        unliked = CommentLike.objects(comment=comment.id, user=request.user.id).delete()
+        if unliked:
+            delta = -1
             action = 'unliked'
         else:
-            # Like - add user to likes
-            comment.likes.append(request.user)
+            try:
+                CommentLike(comment=comment, user=request.user).save()
+                delta = 1
+            except NotUniqueError:
+                delta = 0  # Liked concurrently
             action = 'liked'
-            
+        
+        updated = Comment._get_collection().find_one_and_update(
+            {'_id': comment.id},
+            {'$inc': {'likes_count': delta}},
+            projection={'likes_count': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        comment.likes_count = (updated or {}).get('likes_count', 0)
+        
+        if delta > 0:
             # Send notification to comment author
             try:
                 from .notification_helpers import notify_comment_like
@@ -268,12 +398,14 @@ def toggle_comment_like(request, comment_id):
             except Exception as e:
                 pass  # Don't fail if notification fails
         
-        comment.save()
-        
         return Response({
             'action': action,
-            'likes_count': len(comment.likes),
-            'comment': comment.to_dict(current_user=request.user)
+            'is_liked': action == 'liked',
+            'likes_count': comment.likes_count,
+            'comment': comment.to_dict(
+                current_user=request.user,
+                liked_ids={comment.id} if action == 'liked' else set()
+            )
         }, status=status.HTTP_200_OK)
     
     except Comment.DoesNotExist:
@@ -0,0 +1,65 @@
+"""
+Follower fan-out for newly published recipes
+
+Runs from the outbox worker (``recipe_published`` events), never inside a
+request. Followers are processed in ascending id order, one insert_many of
+notifications and one bulk_write of home timeline entries per chunk, and
+the last processed id is checkpointed after every chunk so an interrupted
+fan-out resumes where it stopped instead of starting over.
+"""
+from bson import ObjectId
+from django.conf import settings
+
+from apps.recipes.models import Recipe
+
+from apps.users.follows import iter_follower_ids
+from apps.users.timeline import is_high_fanout, push_recipe
+from .notification_helpers import notify_new_recipe
+
+
+def fan_out_new_recipe(recipe, author, after=None, chunk_size=None, checkpoint=None):
+    """
+    Send a ``new_recipe`` notification to every follower of the author
+    and push the recipe into their home timelines
+
+    Followers are read from the follows collection in ascending id order,
+    one indexed range read per chunk. Recipes of high-fanout authors are
+    not pushed; the first attempt marks them Recipe.timeline_pull so they
+    are pulled at read time, and a resumed fan-out keeps that decision.
+
+    Args:
+        recipe: The published Recipe
+        author: The recipe's author (User)
+        after (str, optional): Resume after this follower id
+        chunk_size (int, optional): Followers per insert_many
+            (defaults to NOTIFICATION_FANOUT_CHUNK_SIZE)
+        checkpoint (callable, optional): Called with the progress dict after
+            every chunk, e.g. to persist it
+
+    Returns:
+        dict: {'cursor': last follower id, 'sent': int, 'timelines': int,
+            'followers': int}
+    """
+    chunk_size = chunk_size or getattr(settings, 'NOTIFICATION_FANOUT_CHUNK_SIZE', 1000)
+    after = ObjectId(after) if after else None
+
+    if recipe.timeline_pull is None:
+        recipe.timeline_pull = is_high_fanout(author)
+        Recipe.objects(id=recipe.id, timeline_pull=None).update_one(
+            set__timeline_pull=recipe.timeline_pull
+        )
+        recipe.reload('timeline_pull')  # A concurrent attempt may have decided first
+    push = not recipe.timeline_pull
+
+    progress = {'cursor': str(after) if after else None, 'sent': 0, 'timelines': 0, 'followers': 0}
+
+    for chunk in iter_follower_ids(author.id, after=after, chunk_size=chunk_size):
+        progress['sent'] += notify_new_recipe(author, recipe, chunk)
+        if push:
+            progress['timelines'] += push_recipe(recipe, chunk)
+        progress['followers'] += len(chunk)
+        progress['cursor'] = str(chunk[-1])
+        if checkpoint:
+            checkpoint(progress)
+
+    return progress
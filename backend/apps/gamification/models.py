@@ -3,9 +3,17 @@ Gamification models for badges, user actions, and cooked recipes
 """
 from mongoengine import (
     Document, StringField, IntField, ReferenceField,
-    DateTimeField, FloatField, BooleanField, ListField
+    DateTimeField, FloatField, BooleanField, DictField, ObjectIdField
 )
+from bson import ObjectId
 from datetime import datetime
+from django.conf import settings
+
+
+# Raw UserAction documents are deleted by rollup_user_actions after this many
+# days, and never before their day is rolled up into UserActionRollup (there
+# is deliberately no TTL index: it would expire history that was never rolled up).
+USER_ACTION_TTL_DAYS = getattr(settings, 'USER_ACTION_TTL_DAYS', 90)
 
 
 class Badge(Document):
@@ -53,6 +61,22 @@ class Badge(Document):
         return f"{self.name} ({self.rarity})"
 
 
+class BadgeStatsSnapshot(Document):
+    """Materialized badge ownership counts (see badge_engine.refresh_badge_stats)"""
+    
+    name = StringField(required=True, unique=True, default='badges', max_length=50)
+    total_users = IntField(default=0)
+    holders = DictField()  # {badge_id: number of users holding it}
+    computed_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'badge_stats'
+    }
+    
+    def __str__(self):
+        return f"Badge stats ({self.computed_at})"
+
+
 class UserAction(Document):
     """Track user actions for XP and analytics"""
     
@@ -71,6 +95,7 @@ class UserAction(Document):
     target_recipe = ReferenceField('Recipe', null=True)  # If action is recipe-related
     xp_awarded = IntField(default=0)
     metadata = StringField(max_length=500, null=True)  # JSON string for additional data
+    event_id = StringField()  # Outbox event that produced this action (absent otherwise)
     created_at = DateTimeField(default=datetime.utcnow)
     
     meta = {
@@ -79,7 +104,15 @@ class UserAction(Document):
             'user',
             'action_type',
             '-created_at',
-            ('user', '-created_at')
+            ('user', '-created_at'),
+            ('action_type', 'user', '-created_at'),  # Badge awards in the activity feed
+            {
+                'fields': ['event_id'],
+                'name': 'event_id_unique',
+                'unique': True,
+                # Only actions of outbox events; never null or missing ids
+                'partialFilterExpression': {'event_id': {'$type': 'string'}},
+            },
         ]
     }
     
@@ -99,6 +132,42 @@ class UserAction(Document):
         return f"{self.user.username} - {self.action_type}"
 
 
+class UserActionRollup(Document):
+    """Per-user per-day summary of UserAction records (see action_rollups)"""
+    
+    user = ReferenceField('User', required=True)
+    day = DateTimeField(required=True)  # UTC midnight
+    by_type = DictField()  # {action_type: {'count': int, 'xp_earned': int}}
+    total_actions = IntField(default=0)
+    total_xp = IntField(default=0)
+    
+    meta = {
+        'collection': 'user_action_rollups',
+        'indexes': [
+            {'fields': ['user', 'day'], 'unique': True},
+            '-day'
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.user.id} - {self.day.date()}"
+
+
+class RollupWatermark(Document):
+    """Boundary up to which a raw collection has been rolled up"""
+    
+    name = StringField(required=True, unique=True, max_length=100)
+    rolled_up_until = DateTimeField()  # Exclusive; raw data from here on is authoritative
+    updated_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'rollup_watermarks'
+    }
+    
+    def __str__(self):
+        return f"{self.name} until {self.rolled_up_until}"
+
+
 class CookedRecipe(Document):
     """Track recipes that users have cooked"""
     
@@ -115,7 +184,8 @@ class CookedRecipe(Document):
             'user',
             'recipe',
             '-cooked_at',
-            ('user', 'recipe')  # Compound index for uniqueness check
+            ('user', 'recipe'),  # Compound index for uniqueness check
+            ('user', '-cooked_at'),  # Cooks in the activity feed
         ]
     }
     
@@ -136,50 +206,181 @@ class CookedRecipe(Document):
         return f"{self.user.username} cooked {self.recipe.title}"
 
 
+class CookingStreak(Document):
+    """Per-user daily cooking streak, updated atomically at cook time"""
+    
+    user = ReferenceField('User', required=True, unique=True)
+    current_streak = IntField(default=0)
+    longest_streak = IntField(default=0)
+    last_cooked_day = DateTimeField()  # UTC midnight of the latest cooking day
+    updated_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'cooking_streaks'
+    }
+    
+    def __str__(self):
+        return f"{self.user.id} - {self.current_streak} day streak"
+
+
+class CookingActivityYear(Document):
+    """
+    Bitmap of the days a user cooked in one year
+    
+    ``months`` maps "1".."12" to an int whose bit (day - 1) is set when
+    the user cooked on that day.
+    """
+    
+    user = ReferenceField('User', required=True)
+    year = IntField(required=True)
+    months = DictField()
+    
+    meta = {
+        'collection': 'cooking_activity',
+        'indexes': [
+            {'fields': ['user', 'year'], 'unique': True}
+        ]
+    }
+    
+    def __str__(self):
+        return f"{self.user.id} - {self.year}"
+
+
+# Replies nested deeper than this attach to the deepest allowed ancestor
+MAX_COMMENT_DEPTH = 8
+
+
 class Comment(Document):
-    """Recipe comment/review document"""
+    """
+    Recipe comment/review document - the only schema for `comments`
+    
+    Threads are stored as a materialized path: ``path`` is the
+    slash-separated chain of ancestor ids ending with the comment's own id.
+    ObjectIds are time ordered, so sorting by path yields a depth-first,
+    chronological thread, and a whole subtree is one indexed range query
+    (see subtree_range).
+    """
     
     user = ReferenceField('User', required=True)
     recipe = ReferenceField('Recipe', required=True)
     content = StringField(required=True, max_length=2000)
-    likes = ListField(ReferenceField('User'), default=list)  # Users who liked this comment
+    likes_count = IntField(default=0)  # Maintained with $inc, likes live in CommentLike
+    
+    # Threading
+    parent = ReferenceField('self')  # None for top-level comments
+    root = ObjectIdField()  # Id of the top-level comment of the thread
+    path = StringField()  # "<root id>/<child id>/.../<own id>"
+    depth = IntField(default=0)
+    reply_count = IntField(default=0)  # Direct replies, maintained with $inc
     
     created_at = DateTimeField(default=datetime.utcnow)
     updated_at = DateTimeField(default=datetime.utcnow)
     is_edited = BooleanField(default=False)
+    is_deleted = BooleanField(default=False)  # Placeholder kept for its replies
     
     meta = {
         'collection': 'comments',
         'indexes': [
             'user',
-            'recipe',
             '-created_at',
-            ('recipe', '-created_at')  # Compound index for recipe comments
-        ]
+            ('user', '-created_at'),  # Comments in the activity feed
+            ('recipe', 'depth', '-created_at'),  # Top-level comments of a recipe
+            'path',  # Thread and subtree range queries
+        ],
+        'strict': False  # Legacy documents may still carry old fields
     }
     
-    def to_dict(self, current_user=None):
-        """Convert comment to dictionary"""
-        liked_by_current_user = False
-        if current_user:
-            liked_by_current_user = any(str(like.id) == str(current_user.id) for like in self.likes)
+    def assign_thread(self, parent=None):
+        """
+        Set id, root, path and depth before the first save
+        
+        Args:
+            parent: Comment being replied to (None for a top-level comment)
+        """
+        if self.id is None:
+            self.id = ObjectId()
+        if parent is not None and parent.depth >= MAX_COMMENT_DEPTH:
+            parent = parent.parent
+        
+        self.parent = parent
+        if parent is None:
+            self.root = self.id
+            self.path = str(self.id)
+            self.depth = 0
+        else:
+            self.root = parent.root
+            self.path = f'{parent.path}/{self.id}'
+            self.depth = parent.depth + 1
+    
+    def subtree_range(self, include_self=False):
+        """Raw `path` condition matching all descendants (optionally itself)"""
+        return {'$gte': self.path if include_self else f'{self.path}/', '$lt': f'{self.path}0'}
+    
+    def to_dict(self, current_user=None, liked_ids=None):
+        """
+        Convert comment to dictionary
+        
+        Args:
+            current_user: Viewer, used to resolve is_liked
+            liked_ids (set, optional): Comment ids the viewer liked, from
+                liked_comment_ids(); avoids one query per comment on lists
+        """
+        if liked_ids is None and current_user:
+            liked_ids = liked_comment_ids(current_user, [self.id])
         
         return {
             'id': str(self.id),
-            'author': {
+            'author': None if self.is_deleted else {
                 'id': str(self.user.id),
                 'username': self.user.username,
                 'avatar_url': self.user.avatar_url,
                 'level': self.user.level if hasattr(self.user, 'level') else 1,
             },
-            'recipe_id': str(self.recipe.id),
-            'content': self.content,
-            'likes_count': len(self.likes),
-            'is_liked': liked_by_current_user,
+            'recipe_id': str(self._data['recipe'].id),
+            'content': '' if self.is_deleted else self.content,
+            'parent_id': str(self._data['parent'].id) if self._data.get('parent') else None,
+            'root_id': str(self.root) if self.root else None,
+            'depth': self.depth or 0,
+            'reply_count': self.reply_count or 0,
+            'likes_count': self.likes_count or 0,
+            'is_liked': bool(liked_ids) and self.id in liked_ids,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'is_edited': self.is_edited,
+            'is_deleted': bool(self.is_deleted),
         }
     
     def __str__(self):
         return f"Comment by {self.user.username} on {self.recipe.title}"
+
+
+class CommentLike(Document):
+    """One user's like on a comment"""
+    
+    comment = ReferenceField('Comment', required=True)
+    user = ReferenceField('User', required=True)
+    created_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'comment_likes',
+        'indexes': [
+            {'fields': ['comment', 'user'], 'unique': True},
+            ('user', 'comment'),  # is_liked lookups for a page of comments
+        ]
+    }
+
+
+def liked_comment_ids(user, comment_ids):
+    """
+    Which of these comments a user liked, with one $in query
+    
+    Returns:
+        set: ObjectIds of the liked comments
+    """
+    if not user or not comment_ids:
+        return set()
+    return {
+        row['comment']
+        for row in CommentLike.objects(user=user.id, comment__in=list(comment_ids))
+        .only('comment').as_pymongo()
+    }
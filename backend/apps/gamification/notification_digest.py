@@ -0,0 +1,194 @@
+"""
+Periodic notification digests
+
+Events of users who chose 'digest' delivery are collected in the
+DigestBufferEntry collection (see notification_helpers). The builder
+groups recipients into chunks and runs one aggregation pipeline per chunk
+that summarizes every buffered event up to the end of the period. It then
+writes one digest per user with a single insert_many, or one email per
+user as a local mail stand-in, and deletes the consumed entries.
+
+The period end is aligned to NOTIFICATION_DIGEST_PERIOD_HOURS and is part
+of each digest's dedupe key. Re-running an interrupted build within the
+same period therefore never sends a digest twice.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.mail import get_connection, EmailMessage
+
+from .notification_model import Notification, DigestBufferEntry
+
+
+# Phrases used in the digest summary, per notification type
+DIGEST_PHRASES = {
+    'recipe_comment': ('new comment', 'new comments'),
+    'comment_reply': ('reply', 'replies'),
+    'recipe_cooked': ('cook of your recipes', 'cooks of your recipes'),
+    'comment_like': ('like on your comments', 'likes on your comments'),
+    'recipe_like': ('like on your recipes', 'likes on your recipes'),
+    'new_follower': ('new follower', 'new followers'),
+    'new_recipe': ('new recipe from people you follow', 'new recipes from people you follow'),
+    'badge_earned': ('badge earned', 'badges earned'),
+    'level_up': ('level up', 'level ups'),
+}
+
+# Usernames kept per type for the digest highlights
+HIGHLIGHT_ACTORS = 3
+
+
+def current_period_end(period_hours=None, now=None):
+    """End of the latest complete digest period (aligned to the epoch)"""
+    period_hours = period_hours or getattr(settings, 'NOTIFICATION_DIGEST_PERIOD_HOURS', 24)
+    period = period_hours * 3600
+    now = now or datetime.utcnow()
+    return datetime.utcfromtimestamp(int(now.timestamp() // period) * period)
+
+
+def _field(name):
+    return DigestBufferEntry._fields[name].db_field
+
+
+def _summarize_chunk(recipient_ids, period_end):
+    """
+    One aggregation for a chunk of recipients
+
+    Returns:
+        dict: recipient ObjectId -> {type: {'count', 'actors', 'latest'}}
+    """
+    recipient, notification_type = _field('recipient'), _field('notification_type')
+    created_at, sender = _field('created_at'), _field('sender')
+
+    pipeline = [
+        {'$match': {recipient: {'$in': recipient_ids}, created_at: {'$lt': period_end}}},
+        {'$sort': {created_at: -1}},
+        {'$group': {
+            '_id': {'recipient': f'${recipient}', 'type': f'${notification_type}'},
+            'count': {'$sum': 1},
+            'actors': {'$addToSet': f'${sender}.username'},
+            'latest': {'$first': f'${created_at}'},
+        }},
+        {'$group': {
+            '_id': '$_id.recipient',
+            'types': {'$push': {
+                'type': '$_id.type',
+                'count': '$count',
+                'actors': {'$slice': ['$actors', HIGHLIGHT_ACTORS]},
+                'latest': '$latest',
+            }},
+        }},
+    ]
+
+    return {
+        row['_id']: {entry['type']: entry for entry in row['types']}
+        for row in DigestBufferEntry.objects.aggregate(pipeline)
+    }
+
+
+def _summary_text(types):
+    parts = []
+    for notification_type, entry in sorted(types.items(), key=lambda item: -item[1]['count']):
+        singular, plural = DIGEST_PHRASES.get(
+            notification_type, (notification_type.replace('_', ' '),) * 2
+        )
+        parts.append(f"{entry['count']} {singular if entry['count'] == 1 else plural}")
+    if len(parts) > 1:
+        return ', '.join(parts[:-1]) + f' and {parts[-1]}'
+    return parts[0] if parts else ''
+
+
+def _recipient_chunks(period_end, chunk_size):
+    """Yield sorted chunks of recipients with buffered entries in the period"""
+    recipient, created_at = _field('recipient'), _field('created_at')
+    cursor = DigestBufferEntry.objects.aggregate([
+        {'$match': {created_at: {'$lt': period_end}}},
+        {'$group': {'_id': f'${recipient}'}},
+        {'$sort': {'_id': 1}},
+    ], allowDiskUse=True)
+
+    chunk = []
+    for row in cursor:
+        chunk.append(row['_id'])
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _deliver_in_app(summaries, period_end, period_hours):
+    from apps.users.models import User
+
+    notifications = []
+    for recipient_id, types in summaries.items():
+        notifications.append(Notification(
+            recipient=User(id=recipient_id),
+            notification_type='digest',
+            title=f'Your {period_hours}h digest',
+            message=f'While you were away: {_summary_text(types)}',
+            related_object_type='none',
+            metadata={
+                'period_end': period_end.isoformat(),
+                'counts': {t: entry['count'] for t, entry in types.items()},
+                'highlights': {t: [a for a in entry['actors'] if a] for t, entry in types.items()},
+            },
+            dedupe_key=f'digest:{recipient_id}:{period_end.isoformat()}'
+        ))
+    return len(Notification.bulk_create(notifications))
+
+
+def _deliver_email(summaries, period_end, period_hours):
+    from apps.users.models import User
+
+    emails = {
+        row['_id']: row.get('email')
+        for row in User.objects(id__in=list(summaries)).only('email').as_pymongo()
+    }
+    messages = [
+        EmailMessage(
+            subject=f'Your {period_hours}h Cooking Time digest',
+            body=f'While you were away: {_summary_text(types)}',
+            to=[emails[recipient_id]]
+        )
+        for recipient_id, types in summaries.items()
+        if emails.get(recipient_id)
+    ]
+    if not messages:
+        return 0
+    with get_connection() as connection:
+        return connection.send_messages(messages) or 0
+
+
+def build_digests(period_hours=None, chunk_size=500, delivery=None, now=None):
+    """
+    Build and deliver digests for everything buffered before the period end
+
+    Args:
+        period_hours (int, optional): Digest period, defaults to
+            NOTIFICATION_DIGEST_PERIOD_HOURS
+        chunk_size (int): Recipients per aggregation
+        delivery (str, optional): 'in_app' or 'email', defaults to
+            NOTIFICATION_DIGEST_DELIVERY
+
+    Returns:
+        dict: {'recipients', 'delivered', 'entries', 'period_end'}
+    """
+    period_hours = period_hours or getattr(settings, 'NOTIFICATION_DIGEST_PERIOD_HOURS', 24)
+    delivery = delivery or getattr(settings, 'NOTIFICATION_DIGEST_DELIVERY', 'in_app')
+    period_end = current_period_end(period_hours, now)
+    deliver = _deliver_email if delivery == 'email' else _deliver_in_app
+
+    stats = {'recipients': 0, 'delivered': 0, 'entries': 0, 'period_end': period_end.isoformat()}
+
+    for recipient_ids in _recipient_chunks(period_end, chunk_size):
+        summaries = _summarize_chunk(recipient_ids, period_end)
+        if not summaries:
+            continue
+
+        stats['recipients'] += len(summaries)
+        stats['delivered'] += deliver(summaries, period_end, period_hours)
+        stats['entries'] += DigestBufferEntry.objects(
+            recipient__in=recipient_ids, created_at__lt=period_end
+        ).delete()
+
+    return stats
@@ -1,66 +1,176 @@
 """
 Helper functions to create notifications for various events
+
+Every helper checks the recipient's notification preferences first:
+'off' writes nothing, 'digest' writes one DigestBufferEntry instead.
 """
-from .notification_model import Notification
+from .notification_model import Notification, DigestBufferEntry
+from .notification_preferences import get_mode, get_preferences_many, DEFAULT_MODE
+
+
+def _digest_entry(recipient_id, notification_type, sender, message,
+                  related_object_type=None, related_object_id=None, dedupe_key=None):
+    return DigestBufferEntry(
+        recipient=recipient_id,
+        notification_type=notification_type,
+        sender={'id': str(sender.id), 'username': sender.username} if sender else {},
+        message=message,
+        related_object_type=related_object_type,
+        related_object_id=related_object_id,
+        dedupe_key=dedupe_key
+    )
+
 
+def _deliver_in_app(recipient, notification_type, sender=None, message='',
+                    related_object_type=None, related_object_id=None, dedupe_key=None):
+    """
+    Apply the recipient's preference for a notification type
+    
+    Returns:
+        bool: True if the caller should create the in-app notification
+    """
+    mode = get_mode(recipient.id, notification_type)
+    if mode == 'digest':
+        DigestBufferEntry.bulk_create([_digest_entry(
+            recipient.id, notification_type, sender, message,
+            related_object_type, related_object_id, dedupe_key
+        )])
+    return mode == 'in_app'
 
-def notify_new_comment(recipe_author, commenter, recipe, comment):
+
+def notify_new_comment(recipe_author, commenter, recipe, comment, dedupe_key=None):
     """Notify recipe author when someone comments on their recipe"""
     if str(recipe_author.id) == str(commenter.id):
         return  # Don't notify yourself
     
+    message = f'{commenter.username} commented on "{recipe.title}"'
+    if not _deliver_in_app(recipe_author, 'recipe_comment', commenter, message,
+                           'recipe', str(recipe.id), dedupe_key):
+        return
+    
     Notification.create_notification(
         recipient=recipe_author,
         sender=commenter,
         notification_type='recipe_comment',
         title='New comment on your recipe',
-        message=f'{commenter.username} commented on "{recipe.title}"',
+        message=message,
         related_object_type='recipe',
         related_object_id=str(recipe.id),
         metadata={
             'recipe_slug': recipe.slug,
             'recipe_title': recipe.title,
             'comment_id': str(comment.id),
-        }
+        },
+        dedupe_key=dedupe_key
+    )
+
+
+def notify_comment_reply(parent_author, replier, recipe, reply, replied_to_id=None, dedupe_key=None):
+    """
+    Notify a comment's author when someone replies to it
+    
+    replied_to_id is the comment the user replied to, which differs from
+    reply.parent when the reply was moved up at MAX_COMMENT_DEPTH.
+    """
+    if str(parent_author.id) == str(replier.id):
+        return  # Don't notify yourself
+    
+    message = f'{replier.username} replied to your comment on "{recipe.title}"'
+    if not _deliver_in_app(parent_author, 'comment_reply', replier, message,
+                           'comment', str(reply.id), dedupe_key):
+        return
+    
+    Notification.create_notification(
+        recipient=parent_author,
+        sender=replier,
+        notification_type='comment_reply',
+        title='New reply to your comment',
+        message=message,
+        related_object_type='comment',
+        related_object_id=str(reply.id),
+        metadata={
+            'recipe_slug': recipe.slug,
+            'recipe_title': recipe.title,
+            'comment_id': str(reply.id),
+            'parent_comment_id': replied_to_id or (str(reply.parent.id) if reply.parent else None),
+        },
+        dedupe_key=dedupe_key
     )
 
 
 def notify_comment_like(comment_author, liker, comment):
-    """Notify comment author when someone likes their comment"""
+    """Notify comment author when someone likes their comment (coalesced per comment)"""
     if str(comment_author.id) == str(liker.id):
         return  # Don't notify yourself
     
-    Notification.create_notification(
+    # One per liker and comment, so like/unlike/like never repeats it
+    dedupe_key = f'comment_like:{comment.id}:{liker.id}'
+    if not _deliver_in_app(comment_author, 'comment_like', liker,
+                           f'{liker.username} liked your comment',
+                           'comment', str(comment.id), dedupe_key):
+        return
+    
+    Notification.coalesce(
         recipient=comment_author,
         sender=liker,
         notification_type='comment_like',
+        group_key=f'comment_like:{comment.id}',
         title='Someone liked your comment',
-        message=f'{liker.username} liked your comment',
+        action='liked your comment',
         related_object_type='comment',
         related_object_id=str(comment.id),
-        metadata={'comment_id': str(comment.id)}
+        metadata={'comment_id': str(comment.id)},
+        event_key=dedupe_key
     )
 
 
 def notify_badge_earned(user, badge):
     """Notify user when they earn a new badge"""
-    Notification.create_notification(
-        recipient=user,
-        notification_type='badge_earned',
-        title='New badge earned!',
-        message=f'Congratulations! You earned the "{badge.name}" badge',
-        related_object_type='badge',
-        related_object_id=str(badge.id),
-        metadata={
-            'badge_name': badge.name,
-            'badge_icon': badge.icon,
-            'badge_rarity': badge.rarity,
-        }
-    )
+    notify_badges_earned(user, [badge])
+
+
+def notify_badges_earned(user, badges):
+    """Notify user about several newly earned badges with one insert_many"""
+    mode = get_mode(user.id, 'badge_earned')
+    if mode == 'off':
+        return
+    if mode == 'digest':
+        DigestBufferEntry.bulk_create([
+            _digest_entry(
+                user.id, 'badge_earned', None,
+                f'You earned the "{badge.name}" badge',
+                'badge', str(badge.id),
+                dedupe_key=f'badge_earned:{user.id}:{badge.id}'
+            )
+            for badge in badges
+        ])
+        return
+    
+    Notification.bulk_create([
+        Notification(
+            recipient=user,
+            notification_type='badge_earned',
+            title='New badge earned!',
+            message=f'Congratulations! You earned the "{badge.name}" badge',
+            related_object_type='badge',
+            related_object_id=str(badge.id),
+            metadata={
+                'badge_name': badge.name,
+                'badge_icon': badge.icon,
+                'badge_rarity': badge.rarity,
+            },
+            dedupe_key=f'badge_earned:{user.id}:{badge.id}'
+        )
+        for badge in badges
+    ])
 
 
 def notify_level_up(user, new_level):
     """Notify user when they level up"""
+    if not _deliver_in_app(user, 'level_up', None, f'You reached Level {new_level}',
+                           'user', str(user.id), f'level_up:{user.id}:{new_level}'):
+        return
+    
     Notification.create_notification(
         recipient=user,
         notification_type='level_up',
@@ -68,39 +178,112 @@ def notify_level_up(user, new_level):
         message=f'Congratulations! You reached Level {new_level}',
         related_object_type='user',
         related_object_id=str(user.id),
-        metadata={'new_level': new_level}
+        metadata={'new_level': new_level},
+        dedupe_key=f'level_up:{user.id}:{new_level}'
     )
 
 
-def notify_recipe_cooked(recipe_author, cooker, recipe):
-    """Notify recipe author when someone cooks their recipe"""
+def notify_recipe_cooked(recipe_author, cooker, recipe, dedupe_key=None):
+    """
+    Notify recipe author when someone cooks their recipe (coalesced per recipe)
+    
+    ``dedupe_key`` identifies the cook event, so a redelivered event is
+    neither folded in again nor buffered twice for the digest.
+    """
     if str(recipe_author.id) == str(cooker.id):
         return  # Don't notify yourself
     
-    Notification.create_notification(
+    if not _deliver_in_app(recipe_author, 'recipe_cooked', cooker,
+                           f'{cooker.username} cooked "{recipe.title}"',
+                           'recipe', str(recipe.id), dedupe_key):
+        return
+    
+    Notification.coalesce(
         recipient=recipe_author,
         sender=cooker,
         notification_type='recipe_cooked',
+        group_key=f'recipe_cooked:{recipe.id}',
         title='Someone cooked your recipe!',
-        message=f'{cooker.username} cooked "{recipe.title}"',
+        action=f'cooked "{recipe.title}"',
         related_object_type='recipe',
         related_object_id=str(recipe.id),
         metadata={
             'recipe_slug': recipe.slug,
             'recipe_title': recipe.title,
-        }
+        },
+        event_key=dedupe_key
     )
 
 
+def notify_new_recipe(author, recipe, follower_ids):
+    """
+    Notify a chunk of followers about a newly published recipe
+    
+    One insert_many per call; the per-follower dedupe key makes re-running
+    an interrupted chunk safe.
+    
+    Returns:
+        int: Number of in-app notifications actually inserted
+    """
+    from apps.users.models import User
+    
+    message = f'{author.username} published "{recipe.title}"'
+    preferences = get_preferences_many(follower_ids)  # One query for the whole chunk
+    in_app = []
+    digest = []
+    for follower_id in follower_ids:
+        mode = preferences.get(str(follower_id), {}).get('new_recipe', DEFAULT_MODE)
+        if mode == 'in_app':
+            in_app.append(follower_id)
+        elif mode == 'digest':
+            digest.append(follower_id)
+    
+    DigestBufferEntry.bulk_create([
+        _digest_entry(
+            follower_id, 'new_recipe', author, message, 'recipe', str(recipe.id),
+            dedupe_key=f'new_recipe:{recipe.id}:{follower_id}'
+        )
+        for follower_id in digest
+    ])
+    
+    created = Notification.bulk_create([
+        Notification(
+            recipient=User(id=follower_id),
+            sender=author,
+            notification_type='new_recipe',
+            title='New recipe',
+            message=message,
+            related_object_type='recipe',
+            related_object_id=str(recipe.id),
+            metadata={
+                'recipe_slug': recipe.slug,
+                'recipe_title': recipe.title,
+            },
+            dedupe_key=f'new_recipe:{recipe.id}:{follower_id}'
+        )
+        for follower_id in in_app
+    ], stream=False)  # Fan-out: not pushed to open streams
+    return len(created)
+
+
 def notify_new_follower(followed_user, follower):
-    """Notify user when someone follows them"""
-    Notification.create_notification(
+    """Notify user when someone follows them (coalesced per followed user)"""
+    # One per follower, so follow/unfollow/follow never repeats it
+    dedupe_key = f'new_follower:{followed_user.id}:{follower.id}'
+    if not _deliver_in_app(followed_user, 'new_follower', follower,
+                           f'{follower.username} started following you',
+                           'user', str(follower.id), dedupe_key):
+        return
+    
+    Notification.coalesce(
         recipient=followed_user,
         sender=follower,
         notification_type='new_follower',
+        group_key=f'new_follower:{followed_user.id}',
         title='New follower',
-        message=f'{follower.username} started following you',
+        action='started following you',
         related_object_type='user',
         related_object_id=str(follower.id),
-        metadata={'follower_username': follower.username}
+        metadata={'follower_username': follower.username},
+        event_key=dedupe_key
     )
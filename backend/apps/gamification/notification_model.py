@@ -3,9 +3,24 @@ Notification model for user notifications
 """
 from mongoengine import (
     Document, StringField, ReferenceField, BooleanField, 
-    DateTimeField, DictField
+    DateTimeField, DictField, IntField, ListField, ObjectIdField, NotUniqueError
 )
 from datetime import datetime
+from django.conf import settings
+from pymongo import ReturnDocument, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+# Number of most recent actors kept on a coalesced notification
+COALESCE_MAX_ACTORS = 5
+
+# Number of most recent event dedupe keys kept on a coalesced notification
+COALESCE_MAX_EVENT_KEYS = 100
+
+# Read notifications expire through a TTL index on read_at after this many
+# days; unread ones older than NOTIFICATION_ARCHIVE_AFTER_DAYS are moved to
+# ArchivedNotification by `manage.py archive_notifications`.
+NOTIFICATION_READ_TTL_DAYS = getattr(settings, 'NOTIFICATION_READ_TTL_DAYS', 30)
 
 
 class Notification(Document):
@@ -13,6 +28,9 @@ class Notification(Document):
     
     recipient = ReferenceField('User', required=True)
     sender = ReferenceField('User', required=False)  # Optional, can be system notification
+    # Copy of the sender's public fields taken at creation time so listing
+    # never dereferences users; refreshed by refresh_sender_snapshots()
+    sender_snapshot = DictField()  # {'id', 'username', 'avatar_url', 'level'}
     
     notification_type = StringField(required=True, choices=[
         'new_follower',      # Someone followed you
@@ -23,6 +41,8 @@ class Notification(Document):
         'level_up',          # You leveled up
         'recipe_cooked',     # Someone cooked your recipe
         'comment_reply',     # Someone replied to your comment
+        'new_recipe',        # Someone you follow published a recipe
+        'digest',            # Periodic summary of digest-mode events
     ])
     
     title = StringField(required=True, max_length=200)
@@ -35,6 +55,14 @@ class Notification(Document):
     # Additional data (e.g., recipe slug, badge name, etc.)
     metadata = DictField()
     
+    # Optional idempotency key - replayed events never notify twice
+    dedupe_key = StringField()
+    
+    # Coalesced notifications ("Alice and 12 others liked your comment")
+    actor_count = IntField(default=1)
+    actors = ListField(DictField())  # Most recent first: {'id', 'username'}
+    event_keys = ListField(StringField())  # Dedupe keys of the latest folded events
+    
     is_read = BooleanField(default=False)
     created_at = DateTimeField(default=datetime.utcnow)
     read_at = DateTimeField()
@@ -47,20 +75,22 @@ class Notification(Document):
             'is_read',
             ('recipient', '-created_at'),
             ('recipient', 'is_read'),
+            ('is_read', 'created_at'),
+            {'fields': ['sender'], 'sparse': True},
+            {'fields': ['dedupe_key'], 'unique': True, 'sparse': True},
+            {'fields': ['read_at'], 'expireAfterSeconds': NOTIFICATION_READ_TTL_DAYS * 86400},
         ],
         'ordering': ['-created_at']
     }
     
     def to_dict(self):
-        """Convert notification to dictionary"""
+        """Convert notification to dictionary (never dereferences users)"""
+        sender_id = _reference_id(self._data.get('sender'))
+        recipient_id = _reference_id(self._data.get('recipient'))
         return {
             'id': str(self.id),
-            'recipient': str(self.recipient.id) if self.recipient else None,
-            'sender': {
-                'id': str(self.sender.id),
-                'username': self.sender.username,
-                'level': self.sender.level,
-            } if self.sender else None,
+            'recipient': str(recipient_id) if recipient_id else None,
+            'sender': (self.sender_snapshot or {'id': str(sender_id)}) if sender_id else None,
             'type': self.notification_type,
             'title': self.title,
             'message': self.message,
@@ -69,6 +99,8 @@ class Notification(Document):
                 'id': self.related_object_id,
             } if self.related_object_type and self.related_object_id else None,
             'metadata': self.metadata or {},
+            'actor_count': self.actor_count or 1,
+            'actors': self.actors or [],
             'is_read': self.is_read,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'read_at': self.read_at.isoformat() if self.read_at else None,
@@ -77,17 +109,417 @@ class Notification(Document):
     @classmethod
     def create_notification(cls, recipient, notification_type, title, message, 
                           sender=None, related_object_type=None, 
-                          related_object_id=None, metadata=None):
-        """Helper method to create a notification"""
+                          related_object_id=None, metadata=None, dedupe_key=None):
+        """
+        Helper method to create a notification
+        
+        If ``dedupe_key`` is given and a notification with the same key
+        already exists, nothing is written and None is returned.
+        """
         notification = cls(
             recipient=recipient,
             sender=sender,
+            sender_snapshot=sender_snapshot(sender) if sender else {},
             notification_type=notification_type,
             title=title,
             message=message,
             related_object_type=related_object_type or 'none',
             related_object_id=related_object_id,
-            metadata=metadata or {}
+            metadata=metadata or {},
+            dedupe_key=dedupe_key
         )
-        notification.save()
+        try:
+            notification.save()
+        except NotUniqueError:
+            return None
+        
+        cls._after_create([notification])
         return notification
+    
+    @classmethod
+    def coalesce(cls, recipient, sender, notification_type, group_key, title, action,
+                 related_object_type=None, related_object_id=None, metadata=None,
+                 event_key=None):
+        """
+        Fold an event into the aggregate notification of its group
+        
+        Events with the same ``group_key`` (type + target) inside one
+        NOTIFICATION_COALESCE_WINDOW_SECONDS bucket upsert a single
+        notification holding the actor count and the most recent actors,
+        with the message "<sender>[ and N others] <action>". A read
+        aggregate is reopened as unread. Repeated events from an actor
+        still in the recent list do not change the count.
+        
+        ``event_key`` identifies the event itself (e.g. an outbox event);
+        an event already folded into the aggregate is ignored entirely, so
+        redelivery never bumps or reopens it.
+        
+        Returns:
+            Notification: The aggregate notification
+        """
+        window = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW_SECONDS', 86400)
+        now = datetime.utcnow()
+        bucket = int(now.timestamp() // window)
+        dedupe_key = f'{group_key}:{bucket}'
+        collection = cls._get_collection()
+        
+        if event_key and collection.find_one(
+            {'dedupe_key': dedupe_key, 'event_keys': event_key}, {'_id': 1}
+        ):
+            return cls.objects(dedupe_key=dedupe_key).first()
+        
+        actor_id = str(sender.id)
+        recent = {'$ifNull': ['$actors', []]}
+        known = {'$in': [actor_id, {'$ifNull': ['$actors.id', []]}]}
+        others = {'$subtract': ['$actor_count', 1]}
+        
+        pipeline = [
+            {'$set': {
+                'actor_count': {'$cond': [
+                    known,
+                    '$actor_count',
+                    {'$add': [{'$ifNull': ['$actor_count', 0]}, 1]}
+                ]},
+                'actors': {'$concatArrays': [
+                    [{'$literal': {'id': actor_id, 'username': sender.username}}],
+                    {'$filter': {'input': recent, 'cond': {'$ne': ['$$this.id', actor_id]}}}
+                ]},
+            }},
+            {'$set': {
+                'actors': {'$slice': ['$actors', COALESCE_MAX_ACTORS]},
+                'event_keys': {'$slice': [
+                    {'$concatArrays': [
+                        [{'$literal': event_key}] if event_key else [],
+                        {'$ifNull': ['$event_keys', []]},
+                    ]},
+                    COALESCE_MAX_EVENT_KEYS
+                ]},
+                'message': {'$concat': [
+                    {'$literal': sender.username},
+                    {'$switch': {
+                        'branches': [
+                            {'case': {'$eq': [others, 0]}, 'then': ''},
+                            {'case': {'$eq': [others, 1]}, 'then': ' and 1 other'},
+                        ],
+                        'default': {'$concat': [' and ', {'$toString': others}, ' others']},
+                    }},
+                    {'$literal': f' {action}'},
+                ]},
+                'recipient': recipient.id,
+                'sender': sender.id,
+                'sender_snapshot': {'$literal': sender_snapshot(sender)},
+                'notification_type': notification_type,
+                'title': {'$literal': title},
+                'related_object_type': related_object_type or 'none',
+                'related_object_id': related_object_id,
+                'metadata': {'$literal': metadata or {}},
+                'is_read': False,
+                'created_at': now,
+            }},
+            {'$unset': 'read_at'},
+        ]
+        
+        for attempt in range(2):
+            try:
+                before = collection.find_one_and_update(
+                    {'dedupe_key': dedupe_key},
+                    pipeline,
+                    projection={'is_read': 1},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+                break
+            except DuplicateKeyError:
+                # Lost an upsert race; the retry updates the winner's document
+                if attempt:
+                    raise
+        
+        notification = cls.objects(dedupe_key=dedupe_key).first()
+        if notification:
+            cls._after_create([notification], count_unread=before is None or before.get('is_read', False))
+        return notification
+    
+    @classmethod
+    def bulk_create(cls, notifications, stream=True):
+        """
+        Insert many unsaved notifications with a single insert_many
+        
+        Notifications whose dedupe_key already exists are skipped.
+        
+        Args:
+            notifications (list): Unsaved Notification objects
+            stream (bool): Push them to the recipients' open streams; off for
+                follower fan-out, which would flood the capped stream log
+                and evict everyone else's undelivered messages
+            
+        Returns:
+            list: The notifications that were inserted
+        """
+        if not notifications:
+            return []
+        
+        for notification in notifications:
+            sender = notification._data.get('sender')
+            if not notification.sender_snapshot and isinstance(sender, Document):
+                notification.sender_snapshot = sender_snapshot(sender)
+            notification.validate()
+        documents = [notification.to_mongo().to_dict() for notification in notifications]
+        
+        try:
+            result = cls._get_collection().insert_many(documents, ordered=False)
+            inserted_ids = result.inserted_ids
+        except BulkWriteError as e:
+            failed = {error['index'] for error in e.details.get('writeErrors', [])
+                      if error.get('code') == 11000}
+            if len(failed) != len(e.details.get('writeErrors', [])):
+                raise
+            inserted_ids = [doc['_id'] for i, doc in enumerate(documents) if i not in failed]
+        
+        inserted = set(inserted_ids)
+        created = []
+        for notification, document in zip(notifications, documents):
+            if document.get('_id') in inserted:
+                notification.id = document['_id']
+                created.append(notification)
+        
+        cls._after_create(created, stream=stream)
+        return created
+    
+    @classmethod
+    def _after_create(cls, notifications, count_unread=True, stream=True):
+        """Bookkeeping shared by every creation path"""
+        from .notification_stream import publish_many
+        
+        messages = []
+        per_recipient = {}
+        for notification in notifications:
+            recipient_id = notification.to_mongo().get('recipient')
+            counted = count_unread and not notification.is_read
+            messages.append((recipient_id, {
+                'type': 'notification',
+                'notification': notification.to_dict(),
+                'counted': counted,  # Whether it added to the unread counter
+            }))
+            if counted:
+                per_recipient[recipient_id] = per_recipient.get(recipient_id, 0) + 1
+        
+        if stream:
+            publish_many(messages)
+        
+        if len(per_recipient) == 1:
+            # Single recipient: exact counter pushed to their streams
+            for recipient_id, count in per_recipient.items():
+                adjust_unread_count(recipient_id, count)
+        elif per_recipient:
+            increment_unread_counts(per_recipient)
+
+
+def _reference_id(value):
+    """Id of a raw or loaded reference without dereferencing it"""
+    if value is None:
+        return None
+    return getattr(value, 'id', value)
+
+
+def sender_snapshot(user):
+    """Public fields of a user as stored on notifications they send"""
+    return {
+        'id': str(user.id),
+        'username': user.username,
+        'avatar_url': getattr(user, 'avatar_url', None),
+        'level': getattr(user, 'level', 1),
+    }
+
+
+def refresh_sender_snapshots(user):
+    """
+    Rewrite the sender snapshot on every notification a user has sent
+    
+    Called when the username or avatar changes; one update_many per
+    collection.
+    
+    Returns:
+        int: Number of notifications updated
+    """
+    snapshot = sender_snapshot(user)
+    updated = Notification.objects(sender=user.id).update(set__sender_snapshot=snapshot)
+    updated += ArchivedNotification.objects(sender__id=str(user.id)).update(set__sender=snapshot)
+    return updated
+
+
+class ArchivedNotification(Document):
+    """
+    Compact copy of an old unread notification
+    
+    Uses short field names and drops the sender reference (a snapshot is
+    kept instead), dedupe key and actor list. Field names match
+    Notification so the same queries and updates apply to both.
+    """
+    
+    recipient = ObjectIdField(required=True, db_field='r')
+    sender = DictField(db_field='s')  # Sender snapshot, see sender_snapshot()
+    notification_type = StringField(required=True, db_field='t')
+    title = StringField(db_field='ti')
+    message = StringField(db_field='m')
+    related_object_type = StringField(db_field='ot')
+    related_object_id = StringField(db_field='oi')
+    metadata = DictField(db_field='md')
+    actor_count = IntField(default=1, db_field='ac')
+    is_read = BooleanField(default=False, db_field='rd')
+    created_at = DateTimeField(required=True, db_field='c')
+    read_at = DateTimeField(db_field='ra')
+    archived_at = DateTimeField(default=datetime.utcnow, db_field='a')
+    
+    meta = {
+        'collection': 'notifications_archive',
+        'indexes': [
+            ('recipient', '-created_at'),
+            ('recipient', 'is_read'),
+            {'fields': ['sender.id'], 'sparse': True},
+            {'fields': ['read_at'], 'expireAfterSeconds': NOTIFICATION_READ_TTL_DAYS * 86400},
+        ],
+        'ordering': ['-created_at']
+    }
+    
+    def to_dict(self):
+        """Same shape as Notification.to_dict"""
+        return {
+            'id': str(self.id),
+            'recipient': str(self.recipient),
+            'sender': self.sender or None,
+            'type': self.notification_type,
+            'title': self.title,
+            'message': self.message,
+            'related_object': {
+                'type': self.related_object_type,
+                'id': self.related_object_id,
+            } if self.related_object_type and self.related_object_id else None,
+            'metadata': self.metadata or {},
+            'actor_count': self.actor_count or 1,
+            'actors': [],
+            'is_read': self.is_read,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'read_at': self.read_at.isoformat() if self.read_at else None,
+            'archived': True,
+        }
+
+
+class DigestBufferEntry(Document):
+    """
+    Compact record of an event held back for the recipient's digest
+    
+    Written instead of a Notification when the recipient chose 'digest' for
+    the notification type; consumed by the periodic digest builder.
+    """
+    
+    recipient = ObjectIdField(required=True, db_field='r')
+    notification_type = StringField(required=True, db_field='t')
+    sender = DictField(db_field='s')  # {'id', 'username'}
+    message = StringField(db_field='m')
+    related_object_type = StringField(db_field='ot')
+    related_object_id = StringField(db_field='oi')
+    dedupe_key = StringField(db_field='k')
+    created_at = DateTimeField(default=datetime.utcnow, db_field='c')
+    
+    meta = {
+        'collection': 'notification_digest_buffer',
+        'indexes': [
+            ('recipient', 'created_at'),
+            {'fields': ['dedupe_key'], 'unique': True, 'sparse': True},
+        ]
+    }
+    
+    @classmethod
+    def bulk_create(cls, entries):
+        """
+        Write entries with one bulk_write
+        
+        Entries with a dedupe key are upserted on it, so a redelivered or
+        repeated event (like, unlike, like) buffers one item only.
+        """
+        if not entries:
+            return
+        key_field = cls._fields['dedupe_key'].db_field
+        operations = []
+        for entry in entries:
+            document = entry.to_mongo().to_dict()
+            if entry.dedupe_key:
+                operations.append(UpdateOne(
+                    {key_field: entry.dedupe_key},
+                    {'$setOnInsert': document},
+                    upsert=True
+                ))
+            else:
+                operations.append(InsertOne(document))
+        try:
+            cls._get_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of the same key
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+
+# Every collection a user's notifications can live in
+NOTIFICATION_DOCUMENTS = (Notification, ArchivedNotification)
+
+
+def increment_unread_counts(per_recipient):
+    """
+    Add to many users' unread counters with one update_many per distinct delta
+    
+    Used for fan-out, which is not streamed; clients see the new counter
+    when they next connect or load their notifications.
+    
+    Args:
+        per_recipient (dict): recipient ObjectId -> positive delta
+    """
+    from apps.users.models import User
+    
+    by_delta = {}
+    for recipient_id, delta in per_recipient.items():
+        by_delta.setdefault(delta, []).append(recipient_id)
+    
+    collection = User._get_collection()
+    for delta, recipient_ids in by_delta.items():
+        collection.update_many(
+            {'_id': {'$in': recipient_ids}},
+            {'$inc': {'unread_notifications': delta}}
+        )
+
+
+def adjust_unread_count(recipient_id, delta):
+    """
+    Atomically change a user's denormalized unread notification counter
+    
+    The counter is clamped at zero; `manage.py reconcile_unread_counts`
+    repairs any drift. The new value is pushed to the user's open
+    notification streams.
+    
+    Args:
+        recipient_id: ObjectId of the user
+        delta (int): Amount to add (negative when notifications are read/deleted)
+        
+    Returns:
+        int: The updated counter, or None if nothing changed
+    """
+    if not delta:
+        return None
+    
+    from apps.users.models import User
+    from .notification_stream import publish
+    
+    updated = User._get_collection().find_one_and_update(
+        {'_id': recipient_id},
+        [{'$set': {'unread_notifications': {'$max': [
+            0,
+            {'$add': [{'$ifNull': ['$unread_notifications', 0]}, delta]}
+        ]}}}],
+        projection={'unread_notifications': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        return None
+    
+    unread = updated.get('unread_notifications', 0)
+    publish(recipient_id, {'type': 'unread_count', 'unread_count': unread})
+    return unread
@@ -0,0 +1,126 @@
+"""
+Per-user notification preferences
+
+Each notification type is delivered 'in_app' (default), collected for the
+periodic 'digest', or turned 'off'. Preferences are checked by the helpers
+in notification_helpers.py before anything is written, so muted events
+cost no writes. They are cached in process for
+NOTIFICATION_PREFERENCES_CACHE_SECONDS; a change made through
+set_preferences() is visible immediately in the process that made it.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .notification_model import Notification
+
+
+NOTIFICATION_MODES = ('in_app', 'digest', 'off')
+DEFAULT_MODE = 'in_app'
+
+# Types that can be configured (everything a user can receive but the digest itself)
+CONFIGURABLE_TYPES = tuple(t for t in Notification.notification_type.choices if t != 'digest')
+
+_cache = {}  # user id (str) -> (expires_at, preferences)
+_cache_lock = threading.Lock()
+
+
+def _cache_seconds():
+    return getattr(settings, 'NOTIFICATION_PREFERENCES_CACHE_SECONDS', 60)
+
+
+def get_preferences_many(user_ids):
+    """
+    Get preferences for many users, loading cache misses with one query
+
+    Returns:
+        dict: user id (str) -> {notification type: mode}
+    """
+    from apps.users.models import User
+
+    now = time.monotonic()
+    found = {}
+    missing = []
+    with _cache_lock:
+        for user_id in {str(user_id) for user_id in user_ids}:
+            cached = _cache.get(user_id)
+            if cached and cached[0] > now:
+                found[user_id] = cached[1]
+            else:
+                missing.append(user_id)
+
+    if missing:
+        loaded = {user_id: {} for user_id in missing}
+        for row in User.objects(id__in=missing).only('notification_preferences').as_pymongo():
+            loaded[str(row['_id'])] = row.get('notification_preferences') or {}
+
+        expires_at = now + _cache_seconds()
+        with _cache_lock:
+            for user_id, preferences in loaded.items():
+                _cache[user_id] = (expires_at, preferences)
+        found.update(loaded)
+
+    return found
+
+
+def get_preferences(user_id):
+    """Get one user's stored preferences ({notification type: mode})"""
+    return get_preferences_many([user_id])[str(user_id)]
+
+
+def get_mode(user_id, notification_type):
+    """Delivery mode for a notification type: 'in_app', 'digest' or 'off'"""
+    return get_preferences(user_id).get(notification_type, DEFAULT_MODE)
+
+
+def get_effective_preferences(user_id):
+    """Every configurable type with its mode, defaults included"""
+    stored = get_preferences(user_id)
+    return {
+        notification_type: stored.get(notification_type, DEFAULT_MODE)
+        for notification_type in CONFIGURABLE_TYPES
+    }
+
+
+def invalidate(user_id):
+    with _cache_lock:
+        _cache.pop(str(user_id), None)
+
+
+def set_preferences(user, updates):
+    """
+    Change some of a user's notification preferences
+
+    Args:
+        user: User object
+        updates (dict): {notification type: mode}
+
+    Raises:
+        ValueError: On an unknown type or mode
+
+    Returns:
+        dict: The effective preferences after the update
+    """
+    from apps.users.models import User
+
+    if not isinstance(updates, dict):
+        raise ValueError('Preferences must be an object')
+    for notification_type, mode in updates.items():
+        if notification_type not in CONFIGURABLE_TYPES:
+            raise ValueError(f'Unknown notification type: {notification_type}')
+        if mode not in NOTIFICATION_MODES:
+            raise ValueError(f'Mode must be one of: {", ".join(NOTIFICATION_MODES)}')
+
+    if updates:
+        # Per-key $set so concurrent changes to other types are kept
+        User._get_collection().update_one(
+            {'_id': user.id},
+            {'$set': {
+                f'notification_preferences.{notification_type}': mode
+                for notification_type, mode in updates.items()
+            }}
+        )
+        invalidate(user.id)
+
+    return get_effective_preferences(user.id)
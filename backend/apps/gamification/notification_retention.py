@@ -0,0 +1,140 @@
+"""
+Notification retention
+
+Read notifications expire through the TTL index on ``read_at``. Unread
+notifications older than NOTIFICATION_ARCHIVE_AFTER_DAYS are moved in
+batches to the compact ArchivedNotification collection so the hot
+``notifications`` indexes stay small. Archived notifications still count
+as unread and are listed seamlessly after the live ones.
+"""
+import heapq
+from itertools import islice
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+
+from .notification_model import Notification, ArchivedNotification, sender_snapshot
+
+
+def _sender_snapshots(sender_ids):
+    """Load snapshots for senders of legacy notifications with one query"""
+    from apps.users.models import User
+
+    if not sender_ids:
+        return {}
+    return {
+        user.id: sender_snapshot(user)
+        for user in User.objects(id__in=list(sender_ids)).only('username', 'avatar_url', 'level')
+    }
+
+
+def _archive_document(document, senders):
+    """Map a raw notification to a raw ArchivedNotification document"""
+    archived = ArchivedNotification(
+        recipient=document['recipient'],
+        sender=document.get('sender_snapshot') or senders.get(document.get('sender')) or {},
+        notification_type=document.get('notification_type'),
+        title=document.get('title'),
+        message=document.get('message'),
+        related_object_type=document.get('related_object_type'),
+        related_object_id=document.get('related_object_id'),
+        metadata=document.get('metadata') or {},
+        actor_count=document.get('actor_count', 1),
+        is_read=False,
+        created_at=document['created_at'],
+        archived_at=datetime.utcnow()
+    ).to_mongo().to_dict()
+    archived['_id'] = document['_id']
+    return archived
+
+
+def archive_stale_notifications(older_than_days=None, batch_size=1000):
+    """
+    Move unread notifications older than the horizon into the archive
+
+    Each batch is one insert_many into the archive followed by one
+    delete_many. Archived documents keep their _id, so re-running after
+    an interruption never duplicates anything; a notification that was
+    read between the two steps stays live and its archive copy is removed.
+
+    Returns:
+        dict: {'archived': int, 'batches': int}
+    """
+    if older_than_days is None:
+        older_than_days = getattr(settings, 'NOTIFICATION_ARCHIVE_AFTER_DAYS', 180)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    live = Notification._get_collection()
+    archive = ArchivedNotification._get_collection()
+    archived_total = 0
+    batches = 0
+
+    while True:
+        documents = list(live.find(
+            {'is_read': False, 'created_at': {'$lt': cutoff}},
+            sort=[('created_at', 1)],
+            limit=batch_size
+        ))
+        if not documents:
+            break
+
+        senders = _sender_snapshots({
+            d['sender'] for d in documents
+            if d.get('sender') and not d.get('sender_snapshot')
+        })
+        try:
+            archive.insert_many(
+                [_archive_document(document, senders) for document in documents],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+        ids = [document['_id'] for document in documents]
+        archived_total += live.delete_many({'_id': {'$in': ids}, 'is_read': False}).deleted_count
+
+        # Read concurrently: keep the live copy only
+        still_live = [row['_id'] for row in live.find({'_id': {'$in': ids}}, {'_id': 1})]
+        if still_live:
+            archive.delete_many({'_id': {'$in': still_live}})
+
+        batches += 1
+        if len(documents) < batch_size:
+            break
+
+    return {'archived': archived_total, 'batches': batches}
+
+
+def list_recipient_notifications(recipient_id, unread_only=False, start=0, limit=20):
+    """
+    Page through a user's live and archived notifications as one list
+
+    Both collections are read newest first through their
+    (recipient, -created_at) index, limited to the page end, and merged.
+
+    Returns:
+        tuple: (total count, list of notification dicts)
+    """
+    query = {'recipient': recipient_id}
+    if unread_only:
+        query['is_read'] = False
+
+    end = start + limit
+    total = 0
+    sources = []
+    for document in (Notification, ArchivedNotification):
+        queryset = document.objects(**query)
+        count = queryset.count()
+        total += count
+        if count:
+            sources.append(queryset.order_by('-created_at', '-id').limit(end))
+
+    merged = heapq.merge(
+        *sources,
+        key=lambda notification: (notification.created_at, notification.id),
+        reverse=True
+    )
+    page = [notification.to_dict() for notification in islice(merged, start, end)]
+    return total, page
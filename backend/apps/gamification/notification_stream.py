@@ -0,0 +1,239 @@
+"""
+Real-time notification push
+
+NotificationHub is an in-process publish/subscribe hub: every open
+Server-Sent Events connection (see notification_views.notification_stream)
+subscribes an asyncio.Queue for its user, and notification writes publish
+to it.
+
+With NOTIFICATION_FANOUT = 'mongo' (default) messages are written to a
+capped collection instead, and every ASGI worker process tails it and
+dispatches to its local hub. This reaches clients connected to any
+worker, including for notifications created by the outbox worker.
+
+Messages carry a sequence number taken from a counter document. The tailer
+reads in natural (insertion) order and, when its cursor has to be
+recreated, resumes a window of RESUME_WINDOW sequence numbers back,
+skipping messages it already dispatched. Neither ObjectId nor sequence
+order matches insertion order across processes, so resuming strictly
+after the last id would lose messages written slightly out of order.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+from django.conf import settings
+from mongoengine import Document, StringField, DictField, DateTimeField, IntField
+from pymongo import CursorType, ReturnDocument
+
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered per connection before the oldest are dropped
+QUEUE_SIZE = 100
+
+# Sequence numbers re-read (and deduplicated) when the tailer resumes
+RESUME_WINDOW = 10000
+
+SEQUENCE_NAME = 'notification_stream'
+
+
+class NotificationStreamEvent(Document):
+    """Capped fan-out log of stream messages for multi-worker setups"""
+
+    user_id = StringField(required=True)
+    payload = DictField()
+    seq = IntField()  # From NotificationStreamSequence, for resuming
+    created_at = DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'notification_stream',
+        'max_size': 16 * 1024 * 1024,
+        'max_documents': 100000,
+    }
+
+
+class NotificationStreamSequence(Document):
+    """Counter handing out NotificationStreamEvent sequence numbers"""
+
+    name = StringField(primary_key=True)
+    value = IntField(default=0)
+
+    meta = {
+        'collection': 'notification_stream_sequence'
+    }
+
+
+def _reserve_seqs(count):
+    """Reserve `count` consecutive sequence numbers (one atomic $inc)"""
+    updated = NotificationStreamSequence._get_collection().find_one_and_update(
+        {'_id': SEQUENCE_NAME},
+        {'$inc': {'value': count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return range(updated['value'] - count + 1, updated['value'] + 1)
+
+
+class _RecentSeqs:
+    """Bounded set of the sequence numbers dispatched last"""
+
+    def __init__(self, size=RESUME_WINDOW):
+        self._order = deque()
+        self._members = set()
+        self._size = size
+
+    def add(self, seq):
+        """Remember a sequence number; False if it was already seen"""
+        if seq in self._members:
+            return False
+        self._order.append(seq)
+        self._members.add(seq)
+        if len(self._order) > self._size:
+            self._members.discard(self._order.popleft())
+        return True
+
+
+def _put_dropping_oldest(queue, message):
+    """Enqueue without blocking; slow clients lose the oldest messages"""
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(message)
+
+
+class NotificationHub:
+    """In-process publish/subscribe hub keyed by user id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self._tailer = None
+
+    def subscribe(self, user_id):
+        """Register a queue for a user; must be called from a running event loop"""
+        if _fanout_mode() == 'mongo':
+            self._ensure_tailer()
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[user_id].add((loop, queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if not subscribers:
+                return
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                del self._subscribers[user_id]
+
+    def dispatch(self, user_id, message):
+        """Deliver a message to this process's connections of a user (thread-safe)"""
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_put_dropping_oldest, queue, message)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+    def _ensure_tailer(self):
+        with self._lock:
+            if self._tailer is None or not self._tailer.is_alive():
+                self._tailer = threading.Thread(
+                    target=self._tail, name='notification-stream-tailer', daemon=True
+                )
+                self._tailer.start()
+
+    def _tail(self):
+        """Follow the capped collection and dispatch new messages locally"""
+        collection = NotificationStreamEvent._get_collection()
+
+        # Messages already there when this process starts are not delivered
+        recent = _RecentSeqs()
+        last_seq = 0
+        for document in collection.find(
+            {}, {'seq': 1}, sort=[('$natural', -1)], limit=RESUME_WINDOW
+        ):
+            seq = document.get('seq') or 0
+            recent.add(seq)
+            last_seq = max(last_seq, seq)
+
+        while True:
+            query = {'seq': {'$gt': last_seq - RESUME_WINDOW}} if last_seq else {}
+            try:
+                cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    for document in cursor:
+                        seq = document.get('seq') or 0
+                        if not recent.add(seq):
+                            continue  # Dispatched before the cursor was recreated
+                        last_seq = max(last_seq, seq)
+                        self.dispatch(document['user_id'], document.get('payload', {}))
+            except Exception as e:
+                logger.warning('Notification stream tailer error: %s', e)
+            # Tailable cursors die on an empty collection; retry shortly
+            time.sleep(0.5)
+
+
+notification_hub = NotificationHub()
+
+
+def _fanout_mode():
+    return getattr(settings, 'NOTIFICATION_FANOUT', 'mongo')
+
+
+def publish_many(messages):
+    """
+    Push many messages at once (one insert_many in 'mongo' mode)
+
+    Args:
+        messages (list): (user_id, message) pairs
+    """
+    if not messages:
+        return
+    try:
+        if _fanout_mode() == 'mongo':
+            seqs = _reserve_seqs(len(messages))
+            NotificationStreamEvent._get_collection().insert_many([
+                {
+                    'user_id': str(user_id),
+                    'payload': message,
+                    'seq': seq,
+                    'created_at': datetime.utcnow(),
+                }
+                for (user_id, message), seq in zip(messages, seqs)
+            ], ordered=False)
+        else:
+            for user_id, message in messages:
+                notification_hub.dispatch(str(user_id), message)
+    except Exception as e:
+        logger.warning('Failed to publish notification stream messages: %s', e)
+
+
+def publish(user_id, message):
+    """
+    Push a message to every open stream of a user
+
+    Args:
+        user_id: ID of the recipient
+        message (dict): JSON-serializable payload with a 'type' key
+    """
+    user_id = str(user_id)
+    try:
+        if _fanout_mode() == 'mongo':
+            NotificationStreamEvent(
+                user_id=user_id, payload=message, seq=_reserve_seqs(1)[0]
+            ).save()
+        else:
+            notification_hub.dispatch(user_id, message)
+    except Exception as e:
+        logger.warning('Failed to publish notification stream message: %s', e)
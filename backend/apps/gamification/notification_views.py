@@ -1,12 +1,29 @@
 """
 Notification API endpoints
 """
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from datetime import datetime
-from .notification_model import Notification
+from datetime import datetime, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from .notification_model import Notification, NOTIFICATION_DOCUMENTS, adjust_unread_count
+from .notification_retention import list_recipient_notifications
+from .notification_preferences import (
+    NOTIFICATION_MODES, get_effective_preferences, set_preferences
+)
+from .notification_stream import notification_hub
+
+
+# Maximum number of explicit ids accepted by the bulk endpoint
+MAX_BULK_IDS = 500
 
 
 @api_view(['GET'])
@@ -21,26 +38,19 @@ def list_notifications(request):
         limit = min(int(request.GET.get('limit', 20)), 50)
         unread_only = request.GET.get('unread_only', 'false').lower() == 'true'
         
-        # Build query
-        query = {'recipient': request.user.id}
-        if unread_only:
-            query['is_read'] = False
-        
-        # Get notifications
-        notifications = Notification.objects(**query).order_by('-created_at')
-        
-        # Pagination
-        total = notifications.count()
+        # Live and archived notifications, merged into one list
         start = (page - 1) * limit
-        end = start + limit
+        total, results = list_recipient_notifications(
+            request.user.id, unread_only=unread_only, start=start, limit=limit
+        )
         
         return Response({
             'count': total,
-            'unread_count': Notification.objects(recipient=request.user.id, is_read=False).count(),
+            'unread_count': request.user.unread_notifications or 0,
             'page': page,
             'limit': limit,
             'total_pages': (total + limit - 1) // limit if total > 0 else 0,
-            'results': [notif.to_dict() for notif in notifications[start:end]]
+            'results': results
         })
         
     except Exception as e:
@@ -58,12 +68,24 @@ def mark_notification_read(request, notification_id):
     POST /api/notifications/{id}/read/
     """
     try:
-        notification = Notification.objects.get(id=notification_id, recipient=request.user.id)
+        for document in NOTIFICATION_DOCUMENTS:
+            notification = document.objects(id=notification_id, recipient=request.user.id).first()
+            if notification:
+                break
+        else:
+            raise Notification.DoesNotExist
         
         if not notification.is_read:
+            now = datetime.utcnow()
+            # Conditional update so a concurrent read only decrements once
+            updated = type(notification).objects(id=notification.id, is_read=False).update_one(
+                set__is_read=True,
+                set__read_at=now
+            )
+            if updated:
+                adjust_unread_count(request.user.id, -1)
             notification.is_read = True
-            notification.read_at = datetime.utcnow()
-            notification.save()
+            notification.read_at = now
         
         return Response({
             'message': 'Notification marked as read',
@@ -90,14 +112,16 @@ def mark_all_read(request):
     POST /api/notifications/mark-all-read/
     """
     try:
-        notifications = Notification.objects(recipient=request.user.id, is_read=False)
-        count = notifications.count()
-        
+        # One update_many per collection instead of one save per notification
         now = datetime.utcnow()
-        for notif in notifications:
-            notif.is_read = True
-            notif.read_at = now
-            notif.save()
+        count = sum(
+            document.objects(recipient=request.user.id, is_read=False).update(
+                set__is_read=True,
+                set__read_at=now
+            )
+            for document in NOTIFICATION_DOCUMENTS
+        )
+        adjust_unread_count(request.user.id, -count)
         
         return Response({
             'message': f'{count} notifications marked as read',
@@ -111,6 +135,94 @@ def mark_all_read(request):
         )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_notifications(request):
+    """
+    Mark as read or delete many notifications in one operation
+    POST /api/notifications/bulk/
+    Body: {
+        "action": "read" | "delete",
+        "ids": ["..."],                  # either a list of ids
+        "before": "2025-01-01T00:00:00"  # or everything created before this time
+    }
+    """
+    try:
+        action = request.data.get('action')
+        ids = request.data.get('ids')
+        before = request.data.get('before')
+        
+        if action not in ('read', 'delete'):
+            return Response(
+                {'error': 'action must be "read" or "delete"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (ids is None) == (before is None):
+            return Response(
+                {'error': 'Provide exactly one of "ids" or "before"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        query = {'recipient': request.user.id}
+        
+        if ids is not None:
+            if not isinstance(ids, list) or len(ids) > MAX_BULK_IDS:
+                return Response(
+                    {'error': f'ids must be a list of at most {MAX_BULK_IDS} ids'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                query['id__in'] = [ObjectId(notification_id) for notification_id in ids]
+            except (InvalidId, TypeError):
+                return Response(
+                    {'error': 'Invalid notification id'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            try:
+                before = datetime.fromisoformat(str(before).replace('Z', '+00:00'))
+                if before.tzinfo is not None:
+                    # Stored times are naive UTC: convert, don't drop the offset
+                    before = before.astimezone(timezone.utc).replace(tzinfo=None)
+                query['created_at__lt'] = before
+            except (ValueError, TypeError, OverflowError):
+                return Response(
+                    {'error': 'before must be an ISO datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        if action == 'read':
+            query['is_read'] = False
+            now = datetime.utcnow()
+            count = sum(
+                document.objects(**query).update(set__is_read=True, set__read_at=now)
+                for document in NOTIFICATION_DOCUMENTS
+            )
+            adjust_unread_count(request.user.id, -count)
+            message = f'{count} notifications marked as read'
+        else:
+            # Delete unread first so the counter drops by exactly what was removed
+            unread_deleted = count = 0
+            for document in NOTIFICATION_DOCUMENTS:
+                deleted = document.objects(is_read=False, **query).delete()
+                unread_deleted += deleted
+                count += deleted + document.objects(**query).delete()
+            adjust_unread_count(request.user.id, -unread_deleted)
+            message = f'{count} notifications deleted'
+        
+        return Response({
+            'message': message,
+            'action': action,
+            'count': count
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_notification(request, notification_id):
@@ -119,8 +231,16 @@ def delete_notification(request, notification_id):
     DELETE /api/notifications/{id}/
     """
     try:
-        notification = Notification.objects.get(id=notification_id, recipient=request.user.id)
-        notification.delete()
+        for document in NOTIFICATION_DOCUMENTS:
+            notification = document.objects(id=notification_id, recipient=request.user.id).first()
+            if notification:
+                break
+        else:
+            raise Notification.DoesNotExist
+        
+        deleted = type(notification).objects(id=notification.id).delete()
+        if deleted and not notification.is_read:
+            adjust_unread_count(request.user.id, -1)
         
         return Response({
             'message': 'Notification deleted'
@@ -144,12 +264,44 @@ def unread_count(request):
     """
     Get count of unread notifications
     GET /api/notifications/unread-count/
+    
+    Served from the denormalized counter on the already authenticated
+    user document - no query on the notifications collection.
     """
     try:
-        count = Notification.objects(recipient=request.user.id, is_read=False).count()
+        return Response({
+            'unread_count': request.user.unread_notifications or 0
+        })
+        
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET', 'PUT', 'PATCH'])
+@permission_classes([IsAuthenticated])
+def notification_preferences(request):
+    """
+    Get or change how each notification type is delivered
+    GET /api/notifications/preferences/
+    PUT /api/notifications/preferences/
+    Body: {"comment_like": "digest", "new_follower": "off", "level_up": "in_app"}
+    """
+    try:
+        if request.method != 'GET':
+            try:
+                set_preferences(request.user, request.data)
+            except ValueError as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         return Response({
-            'unread_count': count
+            'preferences': get_effective_preferences(request.user.id),
+            'modes': list(NOTIFICATION_MODES)
         })
         
     except Exception as e:
@@ -157,3 +309,66 @@ def unread_count(request):
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+def _authenticate_stream(raw_token):
+    """Resolve the user for a stream request (EventSource cannot send headers)"""
+    from apps.authentication.authentication import MongoEngineJWTAuthentication
+    
+    auth = MongoEngineJWTAuthentication()
+    return auth.get_user(auth.get_validated_token(raw_token))
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+async def notification_stream(request):
+    """
+    Push notifications and unread count changes as Server-Sent Events
+    GET /api/notifications/stream/?token=<access token>
+    
+    Requires the ASGI server (uvicorn). Sends the current unread count on
+    connect, then one event per new notification or counter change and a
+    comment line every NOTIFICATION_STREAM_HEARTBEAT_SECONDS to keep
+    proxies from closing the connection.
+    """
+    raw_token = request.GET.get('token')
+    if not raw_token:
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            raw_token = header[len('Bearer '):]
+    
+    try:
+        user = await sync_to_async(_authenticate_stream)(raw_token)
+    except Exception:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    user_id = str(user.id)
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT_SECONDS', 15)
+    
+    async def events():
+        queue = notification_hub.subscribe(user_id)
+        try:
+            yield 'retry: 5000\n\n'
+            yield _sse('unread_count', {
+                'type': 'unread_count',
+                'unread_count': user.unread_notifications or 0
+            })
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _sse(message.get('type', 'message'), message)
+        finally:
+            notification_hub.unsubscribe(user_id, queue)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
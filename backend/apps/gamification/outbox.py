@@ -0,0 +1,377 @@
+"""
+Gamification outbox - deferred side effects for user actions
+
+Request handlers record a single OutboxEvent and return; the
+``process_outbox`` management command claims pending events in batches and
+applies XP, UserAction records, badges and notifications. Delivery is
+at-least-once, so every handler below must be safe to run more than once
+for the same event.
+"""
+import os
+import socket
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from mongoengine import (
+    Document, StringField, ReferenceField, IntField,
+    DateTimeField, DictField, Q
+)
+
+
+class OutboxEvent(Document):
+    """A user action whose gamification side effects are still to be applied"""
+
+    event_type = StringField(required=True, choices=[
+        'recipe_cooked',
+        'comment_posted',
+        'recipe_published',
+    ])
+    user = ReferenceField('User', required=True)
+    payload = DictField()
+
+    status = StringField(required=True, choices=[
+        'pending',      # Waiting for a worker
+        'processing',   # Claimed by a worker until locked_until
+        'done',         # All side effects applied
+        'failed',       # Gave up after OUTBOX_MAX_ATTEMPTS
+    ], default='pending')
+    attempts = IntField(default=0)
+    available_at = DateTimeField(default=datetime.utcnow)  # Retry backoff
+    locked_until = DateTimeField()
+    locked_by = StringField(max_length=200)
+
+    result = DictField()  # Handler summary (xp_result, badges_earned, ...)
+    last_error = StringField(max_length=1000)
+
+    created_at = DateTimeField(default=datetime.utcnow)
+    processed_at = DateTimeField()
+
+    meta = {
+        'collection': 'outbox_events',
+        'indexes': [
+            ('status', 'available_at'),
+            ('status', 'locked_until'),
+            'user',
+        ]
+    }
+
+    def __str__(self):
+        return f"{self.event_type} ({self.status})"
+
+
+# event_type -> handler(event, user) returning a result dict
+EVENT_HANDLERS = {}
+
+
+def outbox_handler(event_type):
+    """Register a function as the handler for an outbox event type"""
+    def decorator(func):
+        EVENT_HANDLERS[event_type] = func
+        return func
+    return decorator
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def publish_event(event_type, user, **payload):
+    """
+    Record an outbox event for a user action
+
+    In synchronous mode (``OUTBOX_SYNC = True``, used by tests and single
+    process setups) the event is processed inline through the same handler
+    path the worker uses.
+
+    Args:
+        event_type (str): One of OutboxEvent.event_type choices
+        user: User object that performed the action
+        **payload: JSON-serializable event data (recipe_id, comment_id, ...)
+
+    Returns:
+        OutboxEvent: The saved event; ``status == 'done'`` and ``result``
+        are populated when it was processed inline
+    """
+    now = datetime.utcnow()
+    sync = _setting('OUTBOX_SYNC', False)
+
+    event = OutboxEvent(
+        event_type=event_type,
+        user=user,
+        payload=payload,
+        created_at=now,
+        available_at=now
+    )
+    if sync:
+        # Claim it up front so a concurrently running worker skips it
+        event.status = 'processing'
+        event.attempts = 1
+        event.locked_by = _worker_id()
+        event.locked_until = now + timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 60))
+    event.save()
+
+    if sync:
+        process_event(event, user=user)
+
+    return event
+
+
+def claim_events(batch_size, worker_id=None):
+    """
+    Atomically claim up to ``batch_size`` events for this worker
+
+    Pending events that are due and processing events whose lease expired
+    (a crashed worker) are both eligible.
+
+    Returns:
+        list: Claimed OutboxEvent objects, oldest first
+    """
+    worker_id = worker_id or _worker_id()
+    lease = timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 60))
+    claimed = []
+
+    for _ in range(batch_size):
+        now = datetime.utcnow()
+        event = OutboxEvent.objects(
+            Q(status='pending', available_at__lte=now) |
+            Q(status='processing', locked_until__lt=now)
+        ).order_by('created_at').modify(
+            new=True,
+            set__status='processing',
+            set__locked_by=worker_id,
+            set__locked_until=now + lease,
+            inc__attempts=1
+        )
+        if event is None:
+            break
+        claimed.append(event)
+
+    return claimed
+
+
+def process_event(event, user=None):
+    """
+    Run the handler for a claimed event and record the outcome
+
+    Args:
+        event: OutboxEvent in ``processing`` state
+        user: Already loaded User (optional, avoids a dereference)
+
+    Returns:
+        bool: True if the event completed
+    """
+    handler = EVENT_HANDLERS.get(event.event_type)
+
+    try:
+        if handler is None:
+            raise ValueError(f'No outbox handler for {event.event_type}')
+        result = handler(event, user or event.user) or {}
+    except Exception as e:
+        _record_failure(event, e)
+        return False
+
+    now = datetime.utcnow()
+    OutboxEvent.objects(id=event.id).update_one(
+        set__status='done',
+        set__processed_at=now,
+        set__result=result,
+        unset__locked_until=True,
+        unset__last_error=True
+    )
+    event.status = 'done'
+    event.processed_at = now
+    event.result = result
+    return True
+
+
+def checkpoint_event(event, progress):
+    """
+    Persist a long-running handler's progress and extend its lease
+
+    The progress is stored in ``result`` so a retry after a crash can read
+    it back from ``event.result`` and resume.
+    """
+    lease = timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 60))
+    OutboxEvent.objects(id=event.id).update_one(
+        set__result=dict(progress),
+        set__locked_until=datetime.utcnow() + lease
+    )
+    event.result = dict(progress)
+
+
+def _record_failure(event, error):
+    """Schedule a retry with exponential backoff, or give up"""
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    message = f'{type(error).__name__}: {error}'[:1000]
+
+    if event.attempts >= max_attempts:
+        OutboxEvent.objects(id=event.id).update_one(
+            set__status='failed',
+            set__last_error=message,
+            unset__locked_until=True
+        )
+        event.status = 'failed'
+    else:
+        delay = min(2 ** event.attempts, 300)
+        OutboxEvent.objects(id=event.id).update_one(
+            set__status='pending',
+            set__available_at=datetime.utcnow() + timedelta(seconds=delay),
+            set__last_error=message,
+            unset__locked_until=True
+        )
+        event.status = 'pending'
+    event.last_error = message
+
+
+def process_pending(batch_size=None, max_workers=None, worker_id=None):
+    """
+    Claim one batch of events and process it on a thread pool
+
+    Events of the same user run sequentially within one task so that a
+    user's XP and badge updates never race each other.
+
+    Returns:
+        dict: {'claimed': int, 'done': int, 'failed': int}
+    """
+    batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 100)
+    max_workers = max_workers or _setting('OUTBOX_WORKERS', 4)
+
+    events = claim_events(batch_size, worker_id=worker_id)
+    if not events:
+        return {'claimed': 0, 'done': 0, 'failed': 0}
+
+    by_user = OrderedDict()
+    for event in events:
+        by_user.setdefault(event.user.pk, []).append(event)
+
+    def run_group(group):
+        return [process_event(event) for event in group]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = [ok for group in executor.map(run_group, by_user.values()) for ok in group]
+
+    done = sum(1 for ok in outcomes if ok)
+    return {'claimed': len(events), 'done': done, 'failed': len(events) - done}
+
+
+def _xp_summary(action_result):
+    """Raise if XP tracking failed so the event is retried"""
+    if not action_result.get('success'):
+        raise RuntimeError(action_result.get('message'))
+    action = action_result.get('action')
+    return {
+        'xp_awarded': action.xp_awarded if action else 0,
+        'xp_result': action_result.get('xp_result'),
+    }
+
+
+@outbox_handler('recipe_cooked')
+def handle_recipe_cooked(event, user):
+    """XP, streak, badges and author notification for a cooked recipe"""
+    from apps.recipes.models import Recipe
+    from .action_tracker import track_recipe_cooked
+    from .badge_engine import check_and_award_badges
+    from .notification_helpers import notify_recipe_cooked
+    from .streaks import record_cooking_day
+
+    recipe = Recipe.objects(id=event.payload.get('recipe_id')).first()
+    if not recipe:
+        return {'skipped': 'recipe not found'}
+
+    cooked_at = event.payload.get('cooked_at')
+    record_cooking_day(
+        user,
+        datetime.fromisoformat(cooked_at) if cooked_at else event.created_at
+    )
+
+    result = _xp_summary(track_recipe_cooked(
+        user,
+        recipe,
+        has_photo=event.payload.get('has_photo', False),
+        has_rating=event.payload.get('has_rating', False),
+        event_id=str(event.id)
+    ))
+    result['badges_earned'] = check_and_award_badges(user)
+
+    # Coalesced per recipe; the event-scoped key makes a replay a no-op
+    notify_recipe_cooked(recipe.author, user, recipe, dedupe_key=f'recipe_cooked:{event.id}')
+
+    return result
+
+
+@outbox_handler('comment_posted')
+def handle_comment_posted(event, user):
+    """XP, badges and author (and replied-to comment author) notifications for a new comment"""
+    from bson import ObjectId
+    from apps.recipes.models import Recipe
+    from apps.users.models import User
+    from .models import Comment
+    from .action_tracker import track_comment_posted
+    from .badge_engine import check_and_award_badges
+    from .notification_helpers import notify_new_comment, notify_comment_reply
+
+    recipe = Recipe.objects(id=event.payload.get('recipe_id')).first()
+    if not recipe:
+        return {'skipped': 'recipe not found'}
+
+    result = _xp_summary(track_comment_posted(user, recipe, event_id=str(event.id)))
+    result['badges_earned'] = check_and_award_badges(user)
+
+    comment = Comment.objects(id=event.payload.get('comment_id')).first()
+    if comment:
+        notify_new_comment(
+            recipe.author, user, recipe, comment,
+            dedupe_key=f'recipe_comment:{event.id}'
+        )
+        replied_to_user_id = event.payload.get('replied_to_user_id')
+        if replied_to_user_id:
+            notify_comment_reply(
+                User(id=ObjectId(replied_to_user_id)), user, recipe, comment,
+                replied_to_id=event.payload.get('replied_to_comment_id'),
+                dedupe_key=f'comment_reply:{event.id}'
+            )
+        elif comment.parent:
+            # Events published before the replied-to ids were in the payload
+            notify_comment_reply(
+                comment.parent.user, user, recipe, comment,
+                dedupe_key=f'comment_reply:{event.id}'
+            )
+
+    return result
+
+
+@outbox_handler('recipe_published')
+def handle_recipe_published(event, user):
+    """Fan a new_recipe notification and timeline entry out to the author's followers"""
+    from apps.recipes.models import Recipe
+    from .fanout import fan_out_new_recipe
+
+    recipe = Recipe.objects(id=event.payload.get('recipe_id')).first()
+    if not recipe or not recipe.is_published:
+        return {'skipped': 'recipe not found or unpublished'}
+
+    # Resume from the last checkpoint of an interrupted attempt
+    previous = event.result or {}
+    sent_before = previous.get('sent', 0)
+    timelines_before = previous.get('timelines', 0)
+
+    def with_total(progress):
+        return dict(
+            progress,
+            sent=progress['sent'] + sent_before,
+            timelines=progress['timelines'] + timelines_before
+        )
+
+    progress = fan_out_new_recipe(
+        recipe,
+        user,
+        after=previous.get('cursor'),
+        checkpoint=lambda progress: checkpoint_event(event, with_total(progress))
+    )
+    return with_total(progress)
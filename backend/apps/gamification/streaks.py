@@ -0,0 +1,113 @@
+"""
+Cooking streaks and activity calendar
+
+Both are maintained incrementally when a recipe is cooked: one atomic
+pipeline update of the user's CookingStreak and one $bit update of the
+yearly CookingActivityYear bitmap. Both updates are idempotent, so
+replaying a cook event never changes the result.
+"""
+import calendar
+from datetime import datetime, timedelta, date
+
+from .models import CookingStreak, CookingActivityYear
+
+
+def _day_start(value):
+    """Truncate a datetime to UTC midnight"""
+    return datetime(value.year, value.month, value.day)
+
+
+def record_cooking_day(user, cooked_at=None):
+    """
+    Record that a user cooked on the day of ``cooked_at``
+
+    Args:
+        user: User object (or anything with an ``id``)
+        cooked_at (datetime, optional): UTC time of cooking, defaults to now
+    """
+    day = _day_start(cooked_at or datetime.utcnow())
+    previous_day = day - timedelta(days=1)
+
+    # Same day (or older, out-of-order replay) keeps the streak, the next
+    # day extends it, anything else starts over at 1.
+    current = {'$ifNull': ['$current_streak', 0]}
+    CookingStreak._get_collection().update_one(
+        {'user': user.id},
+        [
+            {'$set': {
+                'current_streak': {'$switch': {
+                    'branches': [
+                        {'case': {'$gte': ['$last_cooked_day', day]}, 'then': current},
+                        {'case': {'$eq': ['$last_cooked_day', previous_day]},
+                         'then': {'$add': [current, 1]}},
+                    ],
+                    'default': 1,
+                }},
+            }},
+            {'$set': {
+                'longest_streak': {'$max': [{'$ifNull': ['$longest_streak', 0]}, '$current_streak']},
+                'last_cooked_day': {'$max': ['$last_cooked_day', day]},
+                'updated_at': datetime.utcnow(),
+            }},
+        ],
+        upsert=True
+    )
+
+    CookingActivityYear._get_collection().update_one(
+        {'user': user.id, 'year': day.year},
+        {'$bit': {f'months.{day.month}': {'or': 1 << (day.day - 1)}}},
+        upsert=True
+    )
+
+
+def get_streak(user):
+    """
+    Get a user's cooking streak
+
+    The stored current streak only counts while it is still alive, i.e.
+    the user cooked today or yesterday (UTC).
+
+    Returns:
+        dict: {'current_streak', 'longest_streak', 'last_cooked_day'}
+    """
+    streak = CookingStreak.objects(user=user.id).first()
+    if not streak:
+        return {'current_streak': 0, 'longest_streak': 0, 'last_cooked_day': None}
+
+    today = _day_start(datetime.utcnow())
+    alive = streak.last_cooked_day and streak.last_cooked_day >= today - timedelta(days=1)
+
+    return {
+        'current_streak': streak.current_streak if alive else 0,
+        'longest_streak': streak.longest_streak,
+        'last_cooked_day': streak.last_cooked_day.date().isoformat() if streak.last_cooked_day else None,
+    }
+
+
+def get_activity_calendar(user, year):
+    """
+    Get the days a user cooked in a year, decoded from the bitmap
+
+    Returns:
+        dict: {'year', 'months' (raw bitmasks), 'days' (ISO dates), 'active_days'}
+    """
+    activity = CookingActivityYear.objects(user=user.id, year=year).first()
+    months = {str(m): 0 for m in range(1, 13)}
+    if activity and activity.months:
+        months.update({str(k): int(v) for k, v in activity.months.items()})
+
+    days = []
+    for month in range(1, 13):
+        mask = months[str(month)]
+        if not mask:
+            continue
+        for day in range(1, calendar.monthrange(year, month)[1] + 1):
+            if mask & (1 << (day - 1)):
+                days.append(date(year, month, day).isoformat())
+
+    return {
+        'year': year,
+        'months': months,
+        'days': days,
+        'active_days': len(days),
+    }
@@ -0,0 +1,305 @@
+from datetime import datetime, timedelta
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.testing import MongoTestCase
+from apps.recipes.models import Recipe
+from apps.users.models import User
+from apps.users.gamification import Challenge, ChallengeParticipation
+from .challenge_engine import join_challenge, complete_challenge, evaluate_challenge
+from .models import Comment, CookedRecipe, UserAction, MAX_COMMENT_DEPTH
+from .notification_model import Notification, DigestBufferEntry
+from .outbox import OutboxEvent, publish_event, claim_events, process_event, process_pending
+
+
+def make_user(username, **fields):
+    return User(
+        username=username, email=f'{username}@example.com', password_hash='x', **fields
+    ).save()
+
+
+def make_recipe(author, title='Pasta', **fields):
+    return Recipe(title=title, author=author, is_published=True, **fields).save()
+
+
+def reload_xp(user):
+    return User.objects.only('xp').get(id=user.id).xp
+
+
+@override_settings(NOTIFICATION_FANOUT='local')
+class OutboxTests(MongoTestCase):
+    """Outbox delivery: inline processing, the worker path and redelivery"""
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.cook = make_user('cook')
+        self.recipe = make_recipe(self.author)
+
+    @override_settings(OUTBOX_SYNC=True)
+    def test_sync_mode_processes_inline(self):
+        event = publish_event('recipe_cooked', self.cook, recipe_id=str(self.recipe.id))
+
+        self.assertEqual(event.status, 'done')
+        self.assertEqual(event.result['xp_awarded'], 10)
+        self.assertEqual(OutboxEvent.objects.get(id=event.id).status, 'done')
+        self.assertEqual(reload_xp(self.cook), 10)
+
+    @override_settings(OUTBOX_SYNC=False)
+    def test_worker_processes_pending_events(self):
+        event = publish_event('recipe_cooked', self.cook, recipe_id=str(self.recipe.id))
+        self.assertEqual(event.status, 'pending')
+        self.assertEqual(reload_xp(self.cook), 0)
+
+        outcome = process_pending(max_workers=1, worker_id='test')
+
+        self.assertEqual(outcome, {'claimed': 1, 'done': 1, 'failed': 0})
+        self.assertEqual(OutboxEvent.objects.get(id=event.id).status, 'done')
+        self.assertEqual(reload_xp(self.cook), 10)
+
+    @override_settings(OUTBOX_SYNC=False)
+    def test_redelivered_event_applies_once(self):
+        event = publish_event('recipe_cooked', self.cook, recipe_id=str(self.recipe.id))
+        [claimed] = claim_events(1, worker_id='test')
+        self.assertTrue(process_event(claimed))
+
+        # A worker that crashed after the handler ran gets the event again
+        OutboxEvent.objects(id=event.id).update_one(set__status='processing')
+        self.assertTrue(process_event(OutboxEvent.objects.get(id=event.id)))
+
+        self.assertEqual(reload_xp(self.cook), 10)
+        self.assertEqual(UserAction.objects(event_id=str(event.id)).count(), 1)
+        notification = Notification.objects.get(
+            recipient=self.author.id, notification_type='recipe_cooked'
+        )
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(User.objects.get(id=self.author.id).unread_notifications, 1)
+
+    @override_settings(OUTBOX_SYNC=False)
+    def test_separate_events_each_award_xp(self):
+        for _ in range(2):
+            publish_event('recipe_cooked', self.cook, recipe_id=str(self.recipe.id))
+        process_pending(max_workers=1, worker_id='test')
+
+        self.assertEqual(reload_xp(self.cook), 20)
+        self.assertEqual(UserAction.objects(user=self.cook.id, action_type='recipe_cooked').count(), 2)
+
+
+class ChallengeEvaluationTests(MongoTestCase):
+    """Challenge rewards are paid once per participation"""
+
+    def setUp(self):
+        now = datetime.utcnow()
+        self.challenge = Challenge(
+            title='Cook once',
+            rules={'metric': 'recipes_cooked', 'target': 1},
+            reward_xp=50,
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1)
+        ).save()
+        self.recipe = make_recipe(make_user('author'))
+
+    def cook(self, user):
+        CookedRecipe(user=user, recipe=self.recipe, cooked_at=datetime.utcnow()).save()
+
+    def test_evaluation_does_not_pay_users_rewarded_on_completion(self):
+        user = make_user('claimer')
+        join_challenge(self.challenge, user)
+        self.cook(user)
+
+        self.assertTrue(complete_challenge(self.challenge, user))
+        self.assertEqual(reload_xp(user), 50)
+
+        result = evaluate_challenge(self.challenge)
+
+        self.assertEqual(result['completed'], 0)
+        self.assertEqual(reload_xp(user), 50)
+
+    def test_evaluation_pays_new_completers_once(self):
+        finisher = make_user('finisher')
+        idle = make_user('idle')
+        for user in (finisher, idle):
+            join_challenge(self.challenge, user)
+        self.cook(finisher)
+
+        first = evaluate_challenge(self.challenge)
+        second = evaluate_challenge(self.challenge)
+
+        self.assertEqual(first, {'participants': 2, 'completed': 1})
+        self.assertEqual(second, {'participants': 2, 'completed': 0})
+        self.assertEqual(reload_xp(finisher), 50)
+        self.assertEqual(reload_xp(idle), 0)
+        self.assertTrue(ChallengeParticipation.objects.get(user=finisher.id).rewarded)
+
+    def test_migrated_completers_are_not_paid_again(self):
+        legacy = make_user('legacy')
+        ChallengeParticipation(
+            challenge=self.challenge, user=legacy, status='completed', rewarded=True
+        ).save()
+        self.cook(legacy)
+
+        evaluate_challenge(self.challenge)
+
+        self.assertEqual(reload_xp(legacy), 0)
+
+
+@override_settings(NOTIFICATION_FANOUT='local')
+class NotificationCoalescingTests(MongoTestCase):
+    """Coalesced notifications and per-event dedupe"""
+
+    def setUp(self):
+        self.recipient = make_user('recipient')
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def like(self, sender, event_key=None):
+        return Notification.coalesce(
+            recipient=self.recipient,
+            sender=sender,
+            notification_type='comment_like',
+            group_key='comment_like:c1',
+            title='Someone liked your comment',
+            action='liked your comment',
+            event_key=event_key
+        )
+
+    def test_events_of_one_group_fold_into_one_notification(self):
+        self.like(self.alice, 'like:alice')
+        notification = self.like(self.bob, 'like:bob')
+
+        self.assertEqual(Notification.objects(recipient=self.recipient.id).count(), 1)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.message, 'bob and 1 other liked your comment')
+        self.assertEqual([actor['username'] for actor in notification.actors], ['bob', 'alice'])
+        self.assertEqual(User.objects.get(id=self.recipient.id).unread_notifications, 1)
+
+    def test_repeated_actor_is_counted_once(self):
+        self.like(self.alice, 'like:alice:1')
+        notification = self.like(self.alice, 'like:alice:2')
+
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.message, 'alice liked your comment')
+
+    def test_redelivered_event_does_not_reopen_a_read_notification(self):
+        notification = self.like(self.alice, 'like:alice')
+        Notification.objects(id=notification.id).update_one(
+            set__is_read=True, set__read_at=datetime.utcnow()
+        )
+
+        self.like(self.alice, 'like:alice')
+
+        self.assertTrue(Notification.objects.get(id=notification.id).is_read)
+
+    def test_dedupe_key_creates_one_notification(self):
+        for _ in range(2):
+            Notification.create_notification(
+                recipient=self.recipient,
+                notification_type='comment_reply',
+                title='New reply to your comment',
+                message='alice replied to your comment',
+                sender=self.alice,
+                dedupe_key='comment_reply:event-1'
+            )
+
+        self.assertEqual(Notification.objects(dedupe_key='comment_reply:event-1').count(), 1)
+        self.assertEqual(User.objects.get(id=self.recipient.id).unread_notifications, 1)
+
+    def test_digest_entries_are_deduplicated(self):
+        def entry():
+            return DigestBufferEntry(
+                recipient=self.recipient.id,
+                notification_type='new_follower',
+                message='alice started following you',
+                dedupe_key='new_follower:recipient:alice'
+            )
+
+        DigestBufferEntry.bulk_create([entry()])
+        DigestBufferEntry.bulk_create([entry(), DigestBufferEntry(
+            recipient=self.recipient.id, notification_type='level_up', message='Level 2'
+        )])
+
+        self.assertEqual(DigestBufferEntry.objects(recipient=self.recipient.id).count(), 2)
+
+
+class CommentThreadTests(SimpleTestCase):
+    """Materialized paths and depth capping of comment threads"""
+
+    def chain(self, length):
+        comments = []
+        parent = None
+        for _ in range(length):
+            comment = Comment()
+            comment.assign_thread(parent)
+            comments.append(comment)
+            parent = comment
+        return comments
+
+    def test_reply_extends_the_parent_path(self):
+        root, reply = self.chain(2)
+
+        self.assertEqual(root.depth, 0)
+        self.assertEqual(root.root, root.id)
+        self.assertEqual(root.path, str(root.id))
+        self.assertEqual(reply.depth, 1)
+        self.assertEqual(reply.root, root.id)
+        self.assertEqual(reply.path, f'{root.id}/{reply.id}')
+
+    def test_reply_past_max_depth_moves_under_the_grandparent(self):
+        comments = self.chain(MAX_COMMENT_DEPTH + 1)
+        deepest = comments[-1]
+        self.assertEqual(deepest.depth, MAX_COMMENT_DEPTH)
+
+        reply = Comment()
+        reply.assign_thread(deepest)
+
+        self.assertIs(reply.parent, comments[-2])
+        self.assertEqual(reply.depth, MAX_COMMENT_DEPTH)
+        self.assertEqual(reply.path, f'{comments[-2].path}/{reply.id}')
+        self.assertEqual(reply.root, comments[0].id)
+
+    def test_subtree_range_matches_descendants_only(self):
+        root, child, grandchild = self.chain(3)
+        sibling_root = self.chain(1)[0]
+        subtree = root.subtree_range()
+
+        def matches(path):
+            return subtree['$gte'] <= path < subtree['$lt']
+
+        self.assertTrue(matches(child.path))
+        self.assertTrue(matches(grandchild.path))
+        self.assertFalse(matches(root.path))
+        self.assertFalse(matches(sibling_root.path))
+        self.assertTrue(root.subtree_range(include_self=True)['$gte'] == root.path)
+
+
+@override_settings(NOTIFICATION_FANOUT='local', OUTBOX_SYNC=True)
+class CommentReplyNotificationTests(MongoTestCase):
+    """Reply notifications go to the author of the comment replied to"""
+
+    def test_reply_past_max_depth_notifies_the_replied_to_author(self):
+        recipe = make_recipe(make_user('author'))
+        authors = [make_user(f'user{depth}') for depth in range(MAX_COMMENT_DEPTH + 1)]
+        parent = None
+        for user in authors:
+            comment = Comment(user=user, recipe=recipe, content='hi')
+            comment.assign_thread(parent)
+            comment.save(force_insert=True)
+            parent = comment
+
+        replier = make_user('replier')
+        reply = Comment(user=replier, recipe=recipe, content='reply')
+        reply.assign_thread(parent)
+        reply.save(force_insert=True)
+        self.assertNotEqual(reply.parent.id, parent.id)  # Moved up a level
+
+        publish_event(
+            'comment_posted', replier,
+            recipe_id=str(recipe.id),
+            comment_id=str(reply.id),
+            parent_comment_id=str(reply.parent.id),
+            replied_to_comment_id=str(parent.id),
+            replied_to_user_id=str(authors[-1].id)
+        )
+
+        notification = Notification.objects.get(notification_type='comment_reply')
+        self.assertEqual(notification.to_mongo()['recipient'], authors[-1].id)
+        self.assertEqual(notification.metadata['parent_comment_id'], str(parent.id))
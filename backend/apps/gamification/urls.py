@@ -2,7 +2,7 @@
 URL patterns for gamification app
 """
 from django.urls import path
-from . import views, comments_views
+from . import views, comments_views, challenge_views
 
 app_name = 'gamification'
 
@@ -11,6 +11,16 @@ urlpatterns = [
     path('badges/', views.get_all_badges, name='badges-list'),
     path('badges/initialize/', views.initialize_badges, name='badges-initialize'),
     path('badges/progress/', views.get_badge_progress_view, name='badges-progress'),
+    path('badges/stats/', views.get_badge_stats_view, name='badges-stats'),
     path('badges/check/', views.check_badges_view, name='badges-check'),
     path('users/<str:user_id>/badges/', views.get_user_badges_view, name='user-badges'),
+    path('users/<str:user_id>/streak/', views.get_user_streak_view, name='user-streak'),
+    path('users/<str:user_id>/activity/', views.get_user_activity_view, name='user-activity'),
+    
+    # Challenge endpoints
+    path('challenges/', challenge_views.challenges_list_create, name='challenges-list'),
+    path('challenges/<str:challenge_id>/', challenge_views.challenge_detail, name='challenge-detail'),
+    path('challenges/<str:challenge_id>/join/', challenge_views.join_challenge_view, name='challenge-join'),
+    path('challenges/<str:challenge_id>/progress/', challenge_views.challenge_progress, name='challenge-progress'),
+    path('challenges/<str:challenge_id>/complete/', challenge_views.complete_challenge_view, name='challenge-complete'),
 ]
@@ -5,15 +5,19 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from mongoengine import ValidationError
 
 from .models import Badge
 from .badge_engine import (
     get_user_badges,
     get_all_badges_progress,
     check_and_award_badges,
-    create_default_badges
+    create_default_badges,
+    get_badge_stats
 )
 from .serializers import BadgeSerializer, BadgeProgressSerializer
+from .streaks import get_streak, get_activity_calendar
+from apps.users.models import User
 
 
 @api_view(['GET'])
@@ -26,9 +30,51 @@ def get_all_badges(request):
         badges = Badge.objects(is_active=True)
         serializer = BadgeSerializer([badge.to_dict() for badge in badges], many=True)
         
+        # Ownership comes from the cached snapshot, never a users scan
+        ownership = get_badge_stats()['badges']
+        results = []
+        for badge in serializer.data:
+            badge = dict(badge)
+            badge['ownership'] = ownership.get(badge['id'], {'holders': 0, 'percentage': 0.0})
+            results.append(badge)
+        
+        return Response({
+            'badges': results,
+            'total': len(results)
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def get_badge_stats_view(request):
+    """
+    Get how many users hold each badge
+    GET /api/gamification/badges/stats
+    """
+    try:
+        stats = get_badge_stats()
+        badges = Badge.objects(is_active=True).only('id', 'name', 'icon', 'rarity')
+        
+        results = []
+        for badge in badges:
+            ownership = stats['badges'].get(str(badge.id), {'holders': 0, 'percentage': 0.0})
+            results.append({
+                'id': str(badge.id),
+                'name': badge.name,
+                'icon': badge.icon,
+                'rarity': badge.rarity,
+                'holders': ownership['holders'],
+                'percentage': ownership['percentage'],
+            })
+        
         return Response({
-            'badges': serializer.data,
-            'total': len(serializer.data)
+            'badges': results,
+            'total_users': stats['total_users'],
+            'computed_at': stats['computed_at']
         }, status=status.HTTP_200_OK)
     
     except Exception as e:
@@ -148,3 +194,60 @@ def initialize_badges(request):
         return Response({
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def get_user_streak_view(request, user_id):
+    """
+    Get a user's cooking streak
+    GET /api/gamification/users/:id/streak
+    """
+    try:
+        user = User.objects.only('id').get(id=user_id)
+        
+        return Response({
+            'user_id': str(user.id),
+            **get_streak(user)
+        }, status=status.HTTP_200_OK)
+    
+    except (User.DoesNotExist, ValidationError):
+        return Response({
+            'error': 'User not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def get_user_activity_view(request, user_id):
+    """
+    Get a user's cooking activity heatmap for one year
+    GET /api/gamification/users/:id/activity?year=2025
+    """
+    try:
+        from datetime import datetime
+        
+        try:
+            year = int(request.GET.get('year', datetime.utcnow().year))
+        except ValueError:
+            return Response({
+                'error': 'Invalid year'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        user = User.objects.only('id').get(id=user_id)
+        
+        return Response({
+            'user_id': str(user.id),
+            **get_activity_calendar(user, year)
+        }, status=status.HTTP_200_OK)
+    
+    except (User.DoesNotExist, ValidationError):
+        return Response({
+            'error': 'User not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -81,6 +81,8 @@ class Recipe(Document):
     rating_stats = EmbeddedDocumentField(RatingStats, default=RatingStats)
     views = IntField(default=0)
     cook_count = IntField(default=0)  # How many times marked as cooked
+    comment_count = IntField(default=0)  # All comments incl. replies, maintained with $inc
+    thread_count = IntField(default=0)  # Top-level comments, maintained with $inc
     
     # Gamification
     rarity = StringField(
@@ -94,6 +96,8 @@ class Recipe(Document):
     
     # Moderation
     is_published = BooleanField(default=False)
+    published_at = DateTimeField()
+    timeline_pull = BooleanField()  # Fanned out by pull at read time, not pushed (set once)
     is_featured = BooleanField(default=False)
     
     meta = {
@@ -107,7 +111,13 @@ class Recipe(Document):
             '-created_at',
             '-views',
             '-rating_stats.average',
-            'is_published'
+            'is_published',
+            ('is_published', '-comment_count', '-created_at'),  # sort=most_discussed
+            ('author', '-published_at'),  # Timeline backfill
+            {
+                'fields': ['timeline_pull', 'author', '-published_at'],
+                'partialFilterExpression': {'timeline_pull': True},
+            },  # Timeline pull
         ]
     }
     
@@ -216,6 +226,7 @@ class Recipe(Document):
             },
             'views': self.views,
             'cook_count': self.cook_count,
+            'comment_count': self.comment_count or 0,
             'rarity': self.rarity,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
@@ -245,45 +256,3 @@ class Recipe(Document):
     
     def __str__(self):
         return f"Recipe: {self.title}"
-
-
-class Comment(Document):
-    """Comment document for recipes"""
-    recipe = ReferenceField(Recipe, required=True)
-    user = ReferenceField('User', required=True)
-    text = StringField(required=True, max_length=1000)
-    parent = ReferenceField('self')  # For threading
-    likes = IntField(default=0)
-    created_at = DateTimeField(default=datetime.utcnow)
-    updated_at = DateTimeField(default=datetime.utcnow)
-    is_edited = BooleanField(default=False)
-    
-    meta = {
-        'collection': 'comments',
-        'indexes': [
-            'recipe',
-            'user',
-            'parent',
-            '-created_at'
-        ]
-    }
-    
-    def to_dict(self):
-        """Convert comment to dictionary"""
-        return {
-            'id': str(self.id),
-            'recipe_id': str(self.recipe.id),
-            'user': {
-                'id': str(self.user.id),
-                'username': self.user.username,
-                'avatar_url': self.user.avatar_url,
-            },
-            'text': self.text,
-            'parent_id': str(self.parent.id) if self.parent else None,
-            'likes': self.likes,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'is_edited': self.is_edited,
-        }
-    
-    def __str__(self):
-        return f"Comment by {self.user.username} on {self.recipe.title}"
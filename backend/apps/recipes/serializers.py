@@ -2,7 +2,8 @@
 Recipe Serializers
 """
 from rest_framework import serializers
-from apps.recipes.models import Recipe, Ingredient, RecipeStep, Comment
+from apps.recipes.models import Recipe, Ingredient, RecipeStep
+from apps.gamification.models import Comment
 from apps.users.models import User
 
 
@@ -39,6 +40,7 @@ class RecipeListSerializer(serializers.Serializer):
     rating_stats = serializers.DictField(read_only=True)
     views = serializers.IntegerField(read_only=True)
     cook_count = serializers.IntegerField(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
     rarity = serializers.CharField(read_only=True)
     author = serializers.DictField(read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
@@ -173,10 +175,12 @@ class CommentSerializer(serializers.Serializer):
     """Serializer for comments"""
     id = serializers.CharField(read_only=True)
     recipe_id = serializers.CharField(write_only=True, required=False)
-    user = serializers.DictField(read_only=True)
-    text = serializers.CharField(max_length=1000)
+    author = serializers.DictField(read_only=True)
+    content = serializers.CharField(max_length=2000)
     parent_id = serializers.CharField(required=False, allow_null=True)
-    likes = serializers.IntegerField(read_only=True)
+    depth = serializers.IntegerField(read_only=True)
+    reply_count = serializers.IntegerField(read_only=True)
+    likes_count = serializers.IntegerField(read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
     is_edited = serializers.BooleanField(read_only=True)
     
@@ -12,6 +12,7 @@ urlpatterns = [
     path('cooked/', saved_recipes_views.list_cooked_recipes, name='recipe-list-cooked'),
     path('<slug:slug>/', views.recipe_detail, name='recipe-detail'),
     path('<slug:slug>/mark_cooked/', views.mark_cooked, name='recipe-mark-cooked'),
+    path('<slug:slug>/publish/', views.publish_recipe, name='recipe-publish'),
     path('<slug:slug>/save/', saved_recipes_views.toggle_save_recipe, name='recipe-toggle-save'),
     
     # Comment endpoints
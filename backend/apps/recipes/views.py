@@ -7,7 +7,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
 
-from apps.recipes.models import Recipe, Comment
+from apps.recipes.models import Recipe
+from apps.gamification.models import Comment
 from apps.users.models import User
 from apps.users.gamification import award_xp_for_action
 from .serializers import (
@@ -103,7 +104,7 @@ def recipe_list_create(request):
         
         # Sorting
         sort_by = request.query_params.get('sort', '-created_at')
-        allowed_sorts = ['created_at', '-created_at', 'views', '-views', 'rating_stats.average', '-rating_stats.average']
+        allowed_sorts = ['created_at', '-created_at', 'views', '-views', 'rating_stats.average', '-rating_stats.average', 'most_discussed']
         if sort_by not in allowed_sorts:
             sort_by = '-created_at'
         
@@ -119,9 +120,14 @@ def recipe_list_create(request):
                 recipes = sorted(recipes, key=lambda r: r.views, reverse=reverse)
             elif sort_field == 'created_at':
                 recipes = sorted(recipes, key=lambda r: r.created_at, reverse=reverse)
+            elif sort_field == 'most_discussed':
+                recipes = sorted(recipes, key=lambda r: (r.comment_count or 0, r.created_at), reverse=True)
         else:
             # Use database sorting
-            recipes = recipes.order_by(sort_by)
+            if sort_by == 'most_discussed':
+                recipes = recipes.order_by('-comment_count', '-created_at')
+            else:
+                recipes = recipes.order_by(sort_by)
         
         # Paginate
         paginator = RecipePagination()
@@ -232,6 +238,51 @@ def recipe_detail(request, slug):
         }, status=status.HTTP_204_NO_CONTENT)
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def publish_recipe(request, slug):
+    """
+    Publish a recipe (admin only)
+    POST /api/recipes/{slug}/publish/
+    
+    The unpublished -> published transition is a conditional update, so
+    followers are notified exactly once; the fan-out itself runs in the
+    outbox worker.
+    """
+    from datetime import datetime
+    from apps.gamification.outbox import publish_event
+    
+    if not hasattr(request, 'user_id'):
+        return Response({
+            'error': 'Authentication required'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    
+    user = User.objects(id=request.user_id).first()
+    if not user or not user.is_admin:
+        return Response({
+            'error': 'Admin permission required'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    recipe = Recipe.objects(slug=slug).first()
+    if not recipe:
+        return Response({
+            'error': 'Recipe not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    published = Recipe.objects(id=recipe.id, is_published=False).update_one(
+        set__is_published=True,
+        set__published_at=datetime.utcnow()
+    )
+    if published:
+        publish_event('recipe_published', recipe.author, recipe_id=str(recipe.id))
+        recipe.reload()
+    
+    return Response({
+        'message': 'Recipe published' if published else 'Recipe already published',
+        'recipe': RecipeDetailSerializer(recipe).data
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_cooked(request, slug):
@@ -330,8 +381,7 @@ def mark_cooked(request, slug):
     """
     try:
         from apps.gamification.models import CookedRecipe
-        from apps.gamification.action_tracker import track_recipe_cooked
-        from apps.gamification.badge_engine import check_and_award_badges
+        from apps.gamification.outbox import publish_event
         
         # Get recipe
         recipe = Recipe.objects.get(slug=slug, is_published=True)
@@ -377,22 +427,16 @@ def mark_cooked(request, slug):
         recipe.cook_count += 1
         recipe.save()
         
-        # Track action and award XP
-        has_photo = bool(photo_url)
-        has_rating = rating is not None
-        action_result = track_recipe_cooked(user, recipe, has_photo=has_photo, has_rating=has_rating)
-        
-        # Check for new badges
-        badges_earned = []
-        if action_result['success']:
-            badges_earned = check_and_award_badges(user)
-        
-        # Send notification to recipe author
-        try:
-            from apps.gamification.notification_helpers import notify_recipe_cooked
-            notify_recipe_cooked(recipe.author, user, recipe)
-        except Exception as e:
-            pass  # Don't fail if notification fails
+        # XP, badges and the author notification are applied by the outbox worker
+        event = publish_event(
+            'recipe_cooked',
+            user,
+            recipe_id=str(recipe.id),
+            cooked_at=cooked_recipe.cooked_at.isoformat(),
+            has_photo=bool(photo_url),
+            has_rating=rating is not None
+        )
+        outcome = event.result or {}
         
         # Update recipe rating if rating was provided
         if rating:
@@ -403,8 +447,9 @@ def mark_cooked(request, slug):
         
         return Response({
             'message': 'Recipe marked as cooked!',
-            'xp_result': action_result.get('xp_result'),
-            'badges_earned': badges_earned,
+            'xp_result': outcome.get('xp_result'),
+            'badges_earned': outcome.get('badges_earned', []),
+            'rewards_pending': event.status != 'done',
             'cooked_recipe': cooked_recipe.to_dict(),
             'recipe': {
                 'slug': recipe.slug,
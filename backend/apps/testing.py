@@ -0,0 +1,73 @@
+"""
+Test helpers for code backed by MongoDB
+
+MongoTestCase points MongoEngine at a throwaway database next to the
+configured one (``<MONGODB_NAME>_test``) for the duration of a test class
+and empties it after every test. Tests are skipped when no MongoDB server
+is reachable.
+"""
+import mongoengine
+from django.conf import settings
+from django.test import SimpleTestCase
+from mongoengine.connection import get_db
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+
+def _connection_kwargs():
+    """MONGODB_SETTINGS pointed at the test database"""
+    options = dict(settings.MONGODB_SETTINGS)
+    options['db'] = f"{options['db']}_test"
+    if options.get('username'):
+        options['authentication_source'] = 'admin'
+    else:
+        options.pop('username', None)
+        options.pop('password', None)
+    return options
+
+
+def _server_available(options):
+    try:
+        client = MongoClient(
+            host=options['host'],
+            port=options['port'],
+            username=options.get('username'),
+            password=options.get('password'),
+            serverSelectionTimeoutMS=1000
+        )
+        client.admin.command('ping')
+        client.close()
+        return True
+    except PyMongoError:
+        return False
+
+
+class MongoTestCase(SimpleTestCase):
+    """SimpleTestCase running against an isolated, emptied MongoDB database"""
+
+    @classmethod
+    def setUpClass(cls):
+        options = _connection_kwargs()
+        if not _server_available(options):
+            raise cls.skipException('MongoDB is not reachable')
+        super().setUpClass()
+        # Disconnecting also drops the collections cached on the documents
+        mongoengine.disconnect()
+        mongoengine.connect(**options)
+
+    @classmethod
+    def tearDownClass(cls):
+        db = get_db()
+        db.client.drop_database(db.name)
+        mongoengine.disconnect()
+        super().tearDownClass()
+
+    def tearDown(self):
+        # Empty rather than drop, so indexes created on first use stay in
+        # place for the next test (capped collections cannot be emptied)
+        db = get_db()
+        for name in db.list_collection_names():
+            collection = db[name]
+            if not name.startswith('system.') and not collection.options().get('capped'):
+                collection.delete_many({})
+        super().tearDown()
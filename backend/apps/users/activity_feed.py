@@ -0,0 +1,244 @@
+"""
+Mixed-event activity feed
+
+The feed merges four time-ordered sources from the users someone follows:
+published recipes (the home timeline, see timeline.py), cooks with a photo,
+comments and badge awards. Each source is a lazy cursor sorted newest first
+on its own (user, -time) index; a k-way merge takes the newest item across
+sources until the page is full, so a source is only read as far as the page
+actually reaches into it.
+
+The cursor token records, per source, the (time, id) of the last item it
+contributed. The next page resumes every source right after its own
+position, without skip/offset and without re-reading earlier pages.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+from itertools import islice
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+
+from .follows import following_ids
+from .models import User
+from .timeline import iter_timeline, recipe_card, CARD_FIELDS
+
+
+FEED_SOURCES = ('recipe', 'cook', 'comment', 'badge')
+
+# Longest comment excerpt shown in the feed
+COMMENT_EXCERPT_LENGTH = 280
+
+
+class InvalidFeedCursor(ValueError):
+    """Raised for a malformed feed cursor token"""
+
+
+def encode_cursor(positions):
+    """Encode {source: (time, id)} as an opaque URL-safe token"""
+    payload = {
+        source: [position[0].isoformat(), str(position[1])]
+        for source, position in positions.items()
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(token):
+    """Decode a token from encode_cursor() (an empty token starts at the top)"""
+    if not token:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return {
+            source: (datetime.fromisoformat(position[0]), ObjectId(position[1]))
+            for source, position in payload.items()
+            if source in FEED_SOURCES
+        }
+    except (ValueError, TypeError, InvalidId, AttributeError, IndexError) as e:
+        raise InvalidFeedCursor('Invalid feed cursor') from e
+
+
+def _before(field, position):
+    """Items strictly older than a (time, id) position, in (-field, -id) order"""
+    if position is None:
+        return Q()
+    return Q(**{f'{field}__lt': position[0]}) | Q(**{field: position[0], 'id__lt': position[1]})
+
+
+def _cursor_source(queryset, time_field, limit, batch_size):
+    """Lazily yield (time, id, row) from a queryset, newest first"""
+    cursor = (
+        queryset
+        .order_by(f'-{time_field}', '-id')
+        .limit(limit)
+        .batch_size(batch_size)
+        .as_pymongo()
+    )
+    return ((row[time_field], row['_id'], row) for row in cursor)
+
+
+def _source(source, user, followed, position, limit, batch_size):
+    """Lazy (time, id, row) iterator of one feed source, after its position"""
+    from apps.gamification.models import CookedRecipe, Comment, UserAction
+
+    if source == 'recipe':
+        return (
+            (published_at, recipe_id, {'recipe': recipe_id, 'user': author_id})
+            for published_at, recipe_id, author_id in iter_timeline(
+                user, before=position, limit=limit, batch_size=batch_size
+            )
+        )
+    if source == 'cook':
+        return _cursor_source(
+            CookedRecipe.objects(
+                Q(user__in=followed, photo_url__nin=[None, '']) & _before('cooked_at', position)
+            ).only('id', 'user', 'recipe', 'photo_url', 'rating', 'notes', 'cooked_at'),
+            'cooked_at', limit, batch_size
+        )
+    if source == 'comment':
+        return _cursor_source(
+            Comment.objects(
+                Q(user__in=followed, is_deleted__ne=True) & _before('created_at', position)
+            ).only('id', 'user', 'recipe', 'content', 'depth', 'created_at'),
+            'created_at', limit, batch_size
+        )
+    return _cursor_source(
+        UserAction.objects(
+            Q(action_type='badge_earned', user__in=followed) & _before('created_at', position)
+        ).only('id', 'user', 'metadata', 'created_at'),
+        'created_at', limit, batch_size
+    )
+
+
+def _tagged(source, iterator):
+    return ((time, item_id, source, row) for time, item_id, row in iterator)
+
+
+def _badge_id(row):
+    try:
+        return ObjectId(json.loads(row.get('metadata') or '{}').get('badge_id'))
+    except (ValueError, TypeError, InvalidId):
+        return None
+
+
+def _hydrate(items):
+    """Turn merged raw items into feed events with one query per collection"""
+    from apps.recipes.models import Recipe
+    from apps.gamification.models import Badge
+
+    recipe_ids = {row['recipe'] for _, _, source, row in items if source != 'badge'}
+    recipes = {
+        recipe.id: recipe
+        for recipe in Recipe.objects(id__in=list(recipe_ids), is_published=True)
+        .no_dereference().only(*CARD_FIELDS)
+    } if recipe_ids else {}
+
+    badge_ids = {_badge_id(row) for _, _, source, row in items if source == 'badge'} - {None}
+    badges = {badge.id: badge for badge in Badge.objects(id__in=list(badge_ids))} if badge_ids else {}
+
+    user_ids = {row['user'] for _, _, _, row in items}
+    user_ids |= {recipe._data['author'].id for recipe in recipes.values() if recipe._data.get('author')}
+    users = {
+        user.id: user
+        for user in User.objects(id__in=list(user_ids)).only('username', 'avatar_url', 'level')
+    } if user_ids else {}
+
+    def actor(user_id):
+        user = users.get(user_id)
+        if not user:
+            return None
+        return {
+            'id': str(user.id),
+            'username': user.username,
+            'avatar_url': user.avatar_url,
+            'level': user.level,
+        }
+
+    def card(recipe_id):
+        recipe = recipes.get(recipe_id)
+        if not recipe:
+            return None
+        author_ref = recipe._data.get('author')
+        return recipe_card(recipe, users.get(author_ref.id) if author_ref else None)
+
+    events = []
+    for time, item_id, source, row in items:
+        event = {
+            'type': source,
+            'id': str(item_id),
+            'created_at': time.isoformat(),
+            'actor': actor(row['user']),
+        }
+        if source == 'badge':
+            badge = badges.get(_badge_id(row))
+            if not badge:
+                continue
+            event['badge'] = {
+                'id': str(badge.id),
+                'name': badge.name,
+                'icon': badge.icon,
+                'rarity': badge.rarity,
+            }
+        else:
+            event['recipe'] = card(row['recipe'])
+            if event['recipe'] is None:
+                continue  # Unpublished or deleted since
+            if source == 'cook':
+                event['cook'] = {
+                    'photo_url': row.get('photo_url'),
+                    'rating': row.get('rating'),
+                    'notes': row.get('notes'),
+                }
+            elif source == 'comment':
+                content = row.get('content') or ''
+                event['comment'] = {
+                    'content': content[:COMMENT_EXCERPT_LENGTH],
+                    'is_reply': (row.get('depth') or 0) > 0,
+                }
+        events.append(event)
+    return events
+
+
+def read_feed(user, cursor=None, limit=20, types=None):
+    """
+    One page of a user's mixed activity feed, newest first
+
+    Args:
+        user: Reader (User)
+        cursor (str, optional): Token from the previous page's next_cursor
+        limit (int): Maximum number of events
+        types (iterable, optional): Subset of FEED_SOURCES to include
+
+    Returns:
+        tuple: (list of events, next cursor token or None)
+
+    Raises:
+        InvalidFeedCursor: If the cursor token is malformed
+    """
+    positions = decode_cursor(cursor)
+    types = [source for source in FEED_SOURCES if not types or source in types]
+
+    followed = following_ids(user)
+    if not followed:
+        return [], None
+
+    # Small batches: each source is read only as far as the merge consumes it
+    batch_size = max(1, limit // len(types)) + 1
+    merged = heapq.merge(
+        *(
+            _tagged(source, _source(source, user, followed, positions.get(source), limit, batch_size))
+            for source in types
+        ),
+        key=lambda item: (item[0], item[1]),
+        reverse=True
+    )
+    items = list(islice(merged, limit))
+
+    for time, item_id, source, _ in items:
+        positions[source] = (time, item_id)
+    next_cursor = encode_cursor(positions) if len(items) == limit else None
+
+    return _hydrate(items), next_cursor
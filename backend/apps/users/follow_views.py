@@ -5,7 +5,14 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from apps.users.models import User
+from apps.users.models import User, Follow
+from apps.users.follows import follow, unfollow, following_among
+from apps.users.activity_feed import read_feed, FEED_SOURCES, InvalidFeedCursor
+from apps.users.suggestions import get_suggestions
+
+
+# Fields rendered for each row of the follower and following lists
+LIST_USER_FIELDS = ('username', 'level', 'xp', 'followers_count')
 
 
 @api_view(['POST'])
@@ -27,18 +34,13 @@ def toggle_follow(request, user_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if already following
-        is_following = str(target_user.id) in current_user.following
-        
-        if is_following:
-            # Unfollow
-            current_user.following.remove(str(target_user.id))
-            target_user.followers.remove(str(current_user.id))
+        # Unfollow if an edge exists, otherwise follow
+        if unfollow(current_user, target_user):
+            is_following = False
             action = 'unfollowed'
         else:
-            # Follow
-            current_user.following.append(str(target_user.id))
-            target_user.followers.append(str(current_user.id))
+            follow(current_user, target_user)
+            is_following = True
             action = 'followed'
             
             # Send notification
@@ -48,16 +50,13 @@ def toggle_follow(request, user_id):
             except Exception as e:
                 pass  # Don't fail if notification fails
         
-        # Update counts
-        current_user.following_count = len(current_user.following)
-        target_user.followers_count = len(target_user.followers)
-        
-        current_user.save()
-        target_user.save()
+        # Read back the counters maintained with $inc
+        target_user.reload('followers_count')
+        current_user.reload('following_count')
         
         return Response({
             'action': action,
-            'is_following': not is_following,
+            'is_following': is_following,
             'followers_count': target_user.followers_count,
             'following_count': current_user.following_count
         })
@@ -81,28 +80,36 @@ def get_followers(request, user_id):
     GET /api/users/{user_id}/followers/?page=1&limit=20
     """
     try:
-        user = User.objects.get(id=user_id)
+        user = User.objects.only('followers_count').get(id=user_id)
         page = int(request.GET.get('page', 1))
         limit = min(int(request.GET.get('limit', 20)), 50)
         
-        # Get followers
-        follower_ids = user.followers
-        followers = User.objects(id__in=follower_ids)
-        
-        # Pagination
-        total = followers.count()
+        # Page through follower edges, newest first; the total is the stored counter
+        total = user.followers_count or 0
         start = (page - 1) * limit
         end = start + limit
+        edges = Follow.objects(followee=user.id).order_by('-created_at')
+        page_ids = [row['follower'] for row in edges[start:end].only('follower').as_pymongo()]
+        users_by_id = {
+            u.id: u
+            for u in User.objects(id__in=page_ids).only(*LIST_USER_FIELDS)
+        } if page_ids else {}
+        
+        # Relationship flags for the whole page in one query
+        viewer_following = following_among(request.user, page_ids)
         
         results = []
-        for follower in followers[start:end]:
+        for follower_id in page_ids:
+            follower = users_by_id.get(follower_id)
+            if not follower:
+                continue
             results.append({
                 'id': str(follower.id),
                 'username': follower.username,
                 'level': follower.level,
                 'xp': follower.xp,
-                'followers_count': follower.followers_count,
-                'is_following': str(follower.id) in request.user.following if request.user and hasattr(request.user, 'following') else False
+                'followers_count': follower.followers_count or 0,
+                'is_following': follower.id in viewer_following
             })
         
         return Response({
@@ -132,28 +139,36 @@ def get_following(request, user_id):
     GET /api/users/{user_id}/following/?page=1&limit=20
     """
     try:
-        user = User.objects.get(id=user_id)
+        user = User.objects.only('following_count').get(id=user_id)
         page = int(request.GET.get('page', 1))
         limit = min(int(request.GET.get('limit', 20)), 50)
         
-        # Get following
-        following_ids = user.following
-        following = User.objects(id__in=following_ids)
-        
-        # Pagination
-        total = following.count()
+        # Page through following edges, newest first; the total is the stored counter
+        total = user.following_count or 0
         start = (page - 1) * limit
         end = start + limit
+        edges = Follow.objects(follower=user.id).order_by('-created_at')
+        page_ids = [row['followee'] for row in edges[start:end].only('followee').as_pymongo()]
+        users_by_id = {
+            u.id: u
+            for u in User.objects(id__in=page_ids).only(*LIST_USER_FIELDS)
+        } if page_ids else {}
+        
+        # Relationship flags for the whole page in one query
+        viewer_following = following_among(request.user, page_ids)
         
         results = []
-        for followed_user in following[start:end]:
+        for followed_id in page_ids:
+            followed_user = users_by_id.get(followed_id)
+            if not followed_user:
+                continue
             results.append({
                 'id': str(followed_user.id),
                 'username': followed_user.username,
                 'level': followed_user.level,
                 'xp': followed_user.xp,
-                'followers_count': followed_user.followers_count,
-                'is_following': str(followed_user.id) in request.user.following if request.user and hasattr(request.user, 'following') else False
+                'followers_count': followed_user.followers_count or 0,
+                'is_following': followed_user.id in viewer_following
             })
         
         return Response({
@@ -181,69 +196,58 @@ def get_following(request, user_id):
 def get_activity_feed(request):
     """
     Get activity feed from followed users
-    GET /api/users/feed/?page=1&limit=20
+    GET /api/users/feed/?limit=20&cursor=<next_cursor>&types=recipe,cook,comment,badge
     
-    Shows recent recipes from users you follow
+    Shows, newest first, recipes published by users you follow (from the
+    home timeline), their cooks with photos, their comments and the badges
+    they earn. Pass the previous response's next_cursor to get the next page.
     """
     try:
-        from apps.recipes.models import Recipe
-        
-        page = int(request.GET.get('page', 1))
         limit = min(int(request.GET.get('limit', 20)), 50)
+        types = [t for t in request.GET.get('types', '').split(',') if t in FEED_SOURCES]
         
-        # Get followed users
-        following_ids = request.user.following
-        
-        if not following_ids:
-            return Response({
-                'count': 0,
-                'page': page,
-                'limit': limit,
-                'total_pages': 0,
-                'results': []
-            })
-        
-        # Get authors
-        followed_users = User.objects(id__in=following_ids)
-        
-        # Get recent recipes from followed users
-        recipes = Recipe.objects(
-            author__in=followed_users,
-            is_published=True
-        ).order_by('-created_at')
+        try:
+            results, next_cursor = read_feed(
+                request.user,
+                cursor=request.GET.get('cursor'),
+                limit=limit,
+                types=types
+            )
+        except InvalidFeedCursor as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Pagination
-        total = recipes.count()
-        start = (page - 1) * limit
-        end = start + limit
+        return Response({
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'results': results
+        })
         
-        results = []
-        for recipe in recipes[start:end]:
-            results.append({
-                'id': str(recipe.id),
-                'slug': recipe.slug,
-                'title': recipe.title,
-                'description': recipe.description,
-                'author': {
-                    'id': str(recipe.author.id),
-                    'username': recipe.author.username,
-                    'level': recipe.author.level,
-                },
-                'images': recipe.images,
-                'difficulty': recipe.difficulty,
-                'total_time': recipe.total_time,
-                'rating_stats': {
-                    'average': recipe.rating_stats.average,
-                    'count': recipe.rating_stats.count
-                },
-                'created_at': recipe.created_at.isoformat() if recipe.created_at else None
-            })
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_follow_suggestions(request):
+    """
+    Get "cooks you may know"
+    GET /api/users/suggestions/?limit=10
+    
+    Reads the list precomputed by `python manage.py compute_follow_suggestions`
+    """
+    try:
+        limit = min(int(request.GET.get('limit', 10)), 50)
+        results, computed_at = get_suggestions(request.user, limit=limit)
         
         return Response({
-            'count': total,
-            'page': page,
-            'limit': limit,
-            'total_pages': (total + limit - 1) // limit if total > 0 else 0,
+            'count': len(results),
+            'computed_at': computed_at.isoformat() if computed_at else None,
             'results': results
         })
         
@@ -0,0 +1,104 @@
+"""
+Follow graph operations on the `follows` edge collection
+
+Each edge is one small document with a unique (follower, followee) index,
+and the followers/following counters on User are maintained with $inc, so
+following someone never rewrites either user document. Following or
+unfollowing also updates the follower's home timeline (see timeline.py).
+"""
+from mongoengine import NotUniqueError
+
+from .models import User, Follow
+from .timeline import backfill_followee, remove_followee
+
+
+def _adjust_counts(follower_id, followee_id, delta):
+    User.objects(id=follower_id).update_one(inc__following_count=delta)
+    User.objects(id=followee_id).update_one(inc__followers_count=delta)
+
+
+def follow(follower, followee):
+    """
+    Create a follow edge
+
+    Returns:
+        bool: True if the edge was created, False if it already existed
+    """
+    try:
+        Follow(follower=follower, followee=followee).save(force_insert=True)
+    except NotUniqueError:
+        return False
+    _adjust_counts(follower.id, followee.id, 1)
+    backfill_followee(follower, followee)
+    return True
+
+
+def unfollow(follower, followee):
+    """
+    Remove a follow edge
+
+    Returns:
+        bool: True if an edge was removed
+    """
+    deleted = Follow.objects(follower=follower.id, followee=followee.id).delete()
+    if deleted:
+        _adjust_counts(follower.id, followee.id, -1)
+        remove_followee(follower.id, followee.id)
+    return bool(deleted)
+
+
+def is_following(follower, followee):
+    """Whether ``follower`` follows ``followee`` (one indexed point read)"""
+    return Follow.objects(follower=follower.id, followee=followee.id).only('id').first() is not None
+
+
+def following_among(user, user_ids):
+    """
+    Which of ``user_ids`` a user follows, with one indexed $in query
+
+    Returns:
+        set: ObjectIds (empty for anonymous users)
+    """
+    if not getattr(user, 'is_authenticated', False) or not user_ids:
+        return set()
+    return {
+        row['followee']
+        for row in Follow.objects(follower=user.id, followee__in=list(user_ids))
+        .only('followee').as_pymongo()
+    }
+
+
+def following_ids(user):
+    """
+    Ids of everyone a user follows
+
+    Returns:
+        list: ObjectIds
+    """
+    return [
+        row['followee']
+        for row in Follow.objects(follower=user.id).only('followee').as_pymongo()
+    ]
+
+
+def iter_follower_ids(user_id, after=None, chunk_size=1000):
+    """
+    Yield chunks of follower ids in ascending order, resumable after an id
+
+    Each chunk is one range read on the (followee, follower) index.
+    """
+    while True:
+        query = {'followee': user_id}
+        if after is not None:
+            query['follower__gt'] = after
+        chunk = [
+            row['follower']
+            for row in Follow.objects(**query).order_by('follower').limit(chunk_size)
+            .only('follower').as_pymongo()
+        ]
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1]
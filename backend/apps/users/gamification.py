@@ -2,8 +2,8 @@
 Gamification models - Badges, User Actions, Challenges
 """
 from mongoengine import (
-    Document, StringField, IntField, ListField,
-    ReferenceField, DateTimeField, DictField, BooleanField
+    Document, StringField, IntField,
+    ReferenceField, DateTimeField, DictField, BooleanField, ObjectIdField
 )
 from datetime import datetime
 
@@ -90,17 +90,19 @@ class Challenge(Document):
     """Challenge document for time-limited events"""
     title = StringField(required=True, max_length=200)
     description = StringField(max_length=1000)
-    rules = DictField()  # Challenge rules and requirements
+    rules = DictField()  # {'metric': 'recipes_cooked', 'target': 5}
     reward_xp = IntField(default=0)
     reward_badge = ReferenceField(Badge)
     
     start_date = DateTimeField(required=True)
     end_date = DateTimeField(required=True)
     
-    participants = ListField(ReferenceField('User'))
-    completers = ListField(ReferenceField('User'))
+    # Participation lives in ChallengeParticipation; these are maintained with $inc
+    participants_count = IntField(default=0)
+    completers_count = IntField(default=0)
     
     is_active = BooleanField(default=True)
+    evaluated_at = DateTimeField()  # Set once the end_date evaluation finished
     created_at = DateTimeField(default=datetime.utcnow)
     
     meta = {
@@ -108,8 +110,12 @@ class Challenge(Document):
         'indexes': [
             'start_date',
             'end_date',
-            'is_active'
-        ]
+            'is_active',
+            ('is_active', 'end_date')
+        ],
+        # Tolerate legacy participants/completers arrays until
+        # `manage.py migrate_challenge_participation` has run
+        'strict': False
     }
     
     def is_ongoing(self):
@@ -119,22 +125,13 @@ class Challenge(Document):
     
     def add_participant(self, user):
         """Add user to challenge participants"""
-        if user not in self.participants:
-            self.participants.append(user)
-            self.save()
+        from apps.gamification.challenge_engine import join_challenge
+        return join_challenge(self, user)
     
     def complete_challenge(self, user):
-        """Mark challenge as completed by user"""
-        if user not in self.completers and user in self.participants:
-            self.completers.append(user)
-            
-            # Award XP and badge
-            user.add_xp(self.reward_xp)
-            if self.reward_badge and self.reward_badge not in user.badges:
-                user.badges.append(self.reward_badge)
-            user.save()
-            
-            self.save()
+        """Mark challenge as completed by user if the rules are met"""
+        from apps.gamification.challenge_engine import complete_challenge
+        return complete_challenge(self, user)
     
     def to_dict(self):
         """Convert challenge to dictionary"""
@@ -147,16 +144,54 @@ class Challenge(Document):
             'reward_badge': self.reward_badge.to_dict() if self.reward_badge else None,
             'start_date': self.start_date.isoformat() if self.start_date else None,
             'end_date': self.end_date.isoformat() if self.end_date else None,
-            'participants_count': len(self.participants) if self.participants else 0,
-            'completers_count': len(self.completers) if self.completers else 0,
+            'participants_count': self.participants_count or 0,
+            'completers_count': self.completers_count or 0,
             'is_active': self.is_active,
             'is_ongoing': self.is_ongoing(),
+            'evaluated': self.evaluated_at is not None,
         }
     
     def __str__(self):
         return f"Challenge: {self.title}"
 
 
+class ChallengeParticipation(Document):
+    """One user's participation in a challenge"""
+    challenge = ReferenceField(Challenge, required=True)
+    user = ReferenceField('User', required=True)
+    status = StringField(choices=['joined', 'completed'], default='joined')
+    progress = IntField(default=0)  # Last evaluated metric value
+    rewarded = BooleanField(default=False)  # Rewards paid (set once, conditionally)
+    reward_claim = ObjectIdField()  # Run that set `rewarded`
+    
+    joined_at = DateTimeField(default=datetime.utcnow)
+    completed_at = DateTimeField()
+    updated_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'challenge_participation',
+        'indexes': [
+            {'fields': ['challenge', 'user'], 'unique': True},
+            ('challenge', 'status'),
+            ('user', '-joined_at')
+        ]
+    }
+    
+    def to_dict(self):
+        """Convert participation to dictionary"""
+        return {
+            'challenge_id': str(self.challenge.id),
+            'user_id': str(self.user.id),
+            'status': self.status,
+            'progress': self.progress,
+            'joined_at': self.joined_at.isoformat() if self.joined_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+        }
+    
+    def __str__(self):
+        return f"{self.user.id} in {self.challenge.id} ({self.status})"
+
+
 # XP reward constants
 XP_REWARDS = {
     'submit_recipe': 50,
@@ -194,9 +229,8 @@ def award_xp_for_action(user, action_type, target_id=None, metadata=None):
     )
     user_action.save()
     
-    # Add XP to user
-    user.add_xp(xp_amount)
-    user.save()
+    # Add XP to user (atomic $inc, never a save of the whole document)
+    user.add_xp(xp_amount, action_type=action_type)
     
     # Check for badge eligibility
     check_badge_eligibility(user, action_type)
@@ -0,0 +1,33 @@
+"""
+Django management command to move old unread notifications to the archive
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.gamification.notification_retention import archive_stale_notifications
+
+
+class Command(BaseCommand):
+    help = 'Archive unread notifications older than NOTIFICATION_ARCHIVE_AFTER_DAYS'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.NOTIFICATION_ARCHIVE_AFTER_DAYS,
+            help='Archive unread notifications older than this many days'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Notifications moved per insert_many/delete_many'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Archiving old unread notifications...')
+        result = archive_stale_notifications(
+            older_than_days=options['days'],
+            batch_size=options['batch_size']
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done! Archived {result['archived']} notifications in {result['batches']} batches."
+            )
+        )
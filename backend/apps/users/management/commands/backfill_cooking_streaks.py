@@ -0,0 +1,95 @@
+"""
+Django management command to rebuild cooking streaks and activity
+calendars from the full cooked_recipes history
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.gamification.models import CookedRecipe, CookingStreak, CookingActivityYear
+
+
+class Command(BaseCommand):
+    help = 'Recompute CookingStreak and CookingActivityYear for every user from cooked_recipes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Users per bulk write (default: 500)'
+        )
+    
+    def _streaks(self, days):
+        """(current streak, longest streak) over sorted distinct days"""
+        current = longest = 0
+        previous = None
+        for day in days:
+            current = current + 1 if previous and day - previous == timedelta(days=1) else 1
+            longest = max(longest, current)
+            previous = day
+        return current, longest
+    
+    def _flush(self, streak_operations, activity_operations):
+        if streak_operations:
+            CookingStreak._get_collection().bulk_write(streak_operations, ordered=False)
+        if activity_operations:
+            CookingActivityYear._get_collection().bulk_write(activity_operations, ordered=False)
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        # One row per user with their distinct UTC cooking days, oldest first
+        cursor = CookedRecipe.objects.aggregate([
+            {'$group': {
+                '_id': {
+                    'user': '$user',
+                    'day': {'$dateTrunc': {'date': '$cooked_at', 'unit': 'day'}},
+                },
+            }},
+            {'$group': {'_id': '$_id.user', 'days': {'$push': '$_id.day'}}},
+        ], allowDiskUse=True)
+        
+        now = datetime.utcnow()
+        users = 0
+        streak_operations = []
+        activity_operations = []
+        for row in cursor:
+            days = sorted(day for day in row['days'] if day)
+            if not days:
+                continue
+            current, longest = self._streaks(days)
+            
+            # cooked_recipes holds the full history, so it is authoritative
+            streak_operations.append(UpdateOne(
+                {'user': row['_id']},
+                {'$set': {
+                    'current_streak': current,
+                    'longest_streak': longest,
+                    'last_cooked_day': days[-1],
+                    'updated_at': now,
+                }},
+                upsert=True
+            ))
+            
+            months = {}
+            for day in days:
+                key = (day.year, day.month)
+                months[key] = months.get(key, 0) | (1 << (day.day - 1))
+            for (year, month), mask in months.items():
+                activity_operations.append(UpdateOne(
+                    {'user': row['_id'], 'year': year},
+                    {'$bit': {f'months.{month}': {'or': mask}}},
+                    upsert=True
+                ))
+            
+            users += 1
+            if users % batch_size == 0:
+                self._flush(streak_operations, activity_operations)
+                streak_operations, activity_operations = [], []
+        
+        self._flush(streak_operations, activity_operations)
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Backfilled streaks and activity of {users} users.')
+        )
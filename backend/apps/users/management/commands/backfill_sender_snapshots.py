@@ -0,0 +1,43 @@
+"""
+Django management command to add sender snapshots to older notifications
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateMany
+from apps.users.models import User
+from apps.gamification.notification_model import Notification, sender_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Store a sender snapshot on notifications created before snapshots existed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Senders loaded per query'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Backfilling notification sender snapshots...')
+        
+        collection = Notification._get_collection()
+        missing = {'sender': {'$ne': None}, 'sender_snapshot': {'$in': [None, {}]}}
+        sender_ids = collection.distinct('sender', missing)
+        batch_size = options['batch_size']
+        updated = 0
+        
+        for start in range(0, len(sender_ids), batch_size):
+            batch = sender_ids[start:start + batch_size]
+            users = User.objects(id__in=batch).only('username', 'avatar_url', 'level')
+            operations = [
+                UpdateMany(
+                    dict(missing, sender=user.id),
+                    {'$set': {'sender_snapshot': sender_snapshot(user)}}
+                )
+                for user in users
+            ]
+            if operations:
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Updated {updated} notifications from {len(sender_ids)} senders.')
+        )
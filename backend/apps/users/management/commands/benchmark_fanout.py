@@ -0,0 +1,94 @@
+"""
+Django management command to measure new-recipe fan-out throughput
+"""
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.users.models import User, Follow, HomeTimeline
+from apps.recipes.models import Recipe
+from apps.gamification.notification_model import Notification
+from apps.gamification.fanout import fan_out_new_recipe
+
+
+class Command(BaseCommand):
+    help = 'Benchmark follower fan-out on synthetic users (cleaned up afterwards)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--followers', type=int, default=10000,
+            help='Number of synthetic followers'
+        )
+        parser.add_argument(
+            '--chunk-sizes', default='100,500,1000,5000',
+            help='Comma separated chunk sizes to compare'
+        )
+    
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        prefix = f'bench_fanout_{run}'
+        chunk_sizes = [int(size) for size in options['chunk_sizes'].split(',') if size]
+        
+        # Stream messages go to a capped collection that cannot be cleaned
+        # up; keep them in-process for the benchmark
+        settings.NOTIFICATION_FANOUT = 'local'
+        
+        users = User._get_collection()
+        recipes = Recipe._get_collection()
+        now = datetime.utcnow()
+        
+        follower_ids = users.insert_many([
+            {
+                'username': f'{prefix}_{i}',
+                'email': f'{prefix}_{i}@example.com',
+                'password_hash': '!',
+                'unread_notifications': 0,
+                'created_at': now,
+            }
+            for i in range(options['followers'])
+        ], ordered=False).inserted_ids
+        author_id = users.insert_one({
+            'username': prefix,
+            'email': f'{prefix}@example.com',
+            'password_hash': '!',
+            'followers_count': len(follower_ids),
+            'created_at': now,
+        }).inserted_id
+        Follow._get_collection().insert_many([
+            {'follower': follower_id, 'followee': author_id, 'created_at': now}
+            for follower_id in follower_ids
+        ], ordered=False)
+        author = User.objects.get(id=author_id)
+        
+        recipe_ids = []
+        try:
+            self.stdout.write(f"Fan-out to {len(follower_ids)} followers:")
+            for chunk_size in chunk_sizes:
+                recipe_id = recipes.insert_one({
+                    'title': f'{prefix} {chunk_size}',
+                    'slug': f'{prefix}-{chunk_size}',
+                    'author': author_id,
+                    'is_published': True,
+                    'created_at': now,
+                }).inserted_id
+                recipe_ids.append(recipe_id)
+                recipe = Recipe.objects.get(id=recipe_id)
+                
+                started = time.perf_counter()
+                result = fan_out_new_recipe(recipe, author, chunk_size=chunk_size)
+                elapsed = time.perf_counter() - started
+                
+                self.stdout.write(
+                    f"  chunk {chunk_size:>6}: {result['sent']} notifications "
+                    f"in {elapsed:.2f}s ({result['sent'] / elapsed:,.0f}/s)"
+                )
+        finally:
+            Notification.objects(related_object_id__in=[str(r) for r in recipe_ids]).delete()
+            recipes.delete_many({'_id': {'$in': recipe_ids}})
+            Follow._get_collection().delete_many({'followee': author_id})
+            HomeTimeline._get_collection().delete_many({'user': {'$in': follower_ids}})
+            users.delete_many({'_id': {'$in': follower_ids + [author_id]}})
+        
+        self.stdout.write(self.style.SUCCESS('Benchmark data cleaned up.'))
@@ -0,0 +1,39 @@
+"""
+Django management command to build periodic notification digests
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.gamification.notification_digest import build_digests
+
+
+class Command(BaseCommand):
+    help = 'Roll up buffered digest-mode events into one digest per user'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period-hours', type=int, default=settings.NOTIFICATION_DIGEST_PERIOD_HOURS,
+            help='Digest period; events up to the end of the last complete period are included'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Users summarized per aggregation'
+        )
+        parser.add_argument(
+            '--delivery', choices=['in_app', 'email'], default=settings.NOTIFICATION_DIGEST_DELIVERY,
+            help='Deliver digests as notifications or emails'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Building notification digests...')
+        result = build_digests(
+            period_hours=options['period_hours'],
+            chunk_size=options['chunk_size'],
+            delivery=options['delivery']
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done! Delivered {result['delivered']} digests to {result['recipients']} users "
+                f"from {result['entries']} events (period end {result['period_end']})."
+            )
+        )
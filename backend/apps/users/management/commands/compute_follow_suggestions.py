@@ -0,0 +1,38 @@
+"""
+Django management command to precompute "cooks you may know" suggestions
+"""
+from django.core.management.base import BaseCommand
+from apps.users.suggestions import compute_follow_suggestions, DEFAULT_BLOCK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Score follow suggestions from the follow graph, cooks and cuisines and store the top K per user'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=None,
+            help='Suggestions stored per user (default: FOLLOW_SUGGESTIONS_TOP_K)'
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=DEFAULT_BLOCK_SIZE,
+            help=f'Users scored per sparse block (default: {DEFAULT_BLOCK_SIZE})'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Computing follow suggestions...')
+        
+        stats = compute_follow_suggestions(
+            top_k=options['top_k'],
+            block_size=options['block_size']
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done! Stored suggestions for {stats['users']} users "
+                f"({stats['with_suggestions']} with at least one)."
+            )
+        )
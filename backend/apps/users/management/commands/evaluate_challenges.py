@@ -0,0 +1,28 @@
+"""
+Django management command to score finished challenges and award rewards
+"""
+from django.core.management.base import BaseCommand
+from apps.gamification.challenge_engine import evaluate_due_challenges
+
+
+class Command(BaseCommand):
+    help = 'Evaluate all challenges past their end date and reward completers'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Evaluating finished challenges...')
+        
+        results = evaluate_due_challenges()
+        
+        for title, result in results:
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{title}: failed - {result['error']}"))
+                continue
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{title}: {result['completed']} of {result['participants']} participants completed"
+                )
+            )
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'\nDone! Evaluated {len(results)} challenges.')
+        )
@@ -0,0 +1,30 @@
+"""
+Django management command to replace the old sparse unique index on
+UserAction.event_id with the partial one declared on the model
+"""
+from django.core.management.base import BaseCommand
+from apps.gamification.models import UserAction
+
+
+class Command(BaseCommand):
+    help = 'Drop the sparse event_id index of user_actions and unset null event_ids'
+    
+    def handle(self, *args, **options):
+        collection = UserAction._get_collection()
+        
+        # The sparse index also indexed explicit nulls, so only one action
+        # without an outbox event could ever be stored
+        if 'event_id_1' in collection.index_information():
+            collection.drop_index('event_id_1')
+            self.stdout.write('Dropped index event_id_1')
+        
+        cleared = collection.update_many(
+            {'event_id': {'$type': 'null'}},
+            {'$unset': {'event_id': ''}}
+        ).modified_count
+        
+        UserAction.ensure_indexes()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Unset event_id on {cleared} actions.')
+        )
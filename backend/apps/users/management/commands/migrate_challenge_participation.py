@@ -0,0 +1,65 @@
+"""
+Django management command to move embedded challenge participant arrays
+into the challenge_participation collection
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.users.gamification import Challenge, ChallengeParticipation
+
+
+class Command(BaseCommand):
+    help = 'Migrate Challenge.participants/completers arrays to challenge_participation'
+    
+    def handle(self, *args, **options):
+        challenges = Challenge._get_collection()
+        participation = ChallengeParticipation._get_collection()
+        
+        legacy = challenges.find(
+            {'$or': [{'participants': {'$exists': True}}, {'completers': {'$exists': True}}]},
+            {'participants': 1, 'completers': 1, 'created_at': 1}
+        )
+        
+        migrated = 0
+        for challenge in legacy:
+            completers = set(challenge.get('completers') or [])
+            participants = set(challenge.get('participants') or []) | completers
+            now = datetime.utcnow()
+            
+            operations = []
+            for user_id in participants:
+                fields = {
+                    'status': 'completed' if user_id in completers else 'joined',
+                    'progress': 0,
+                    'joined_at': challenge.get('created_at') or now,
+                    'updated_at': now,
+                }
+                if user_id in completers:
+                    # Paid by the embedded-array code; never reward again
+                    fields['completed_at'] = now
+                    fields['rewarded'] = True
+                operations.append(UpdateOne(
+                    {'challenge': challenge['_id'], 'user': user_id},
+                    {'$setOnInsert': fields},
+                    upsert=True
+                ))
+            if operations:
+                participation.bulk_write(operations, ordered=False)
+            
+            challenges.update_one(
+                {'_id': challenge['_id']},
+                {
+                    '$set': {
+                        'participants_count': len(participants),
+                        'completers_count': len(completers),
+                    },
+                    '$unset': {'participants': '', 'completers': ''},
+                }
+            )
+            migrated += 1
+            self.stdout.write(f"Migrated {len(participants)} participants of {challenge['_id']}")
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'\nDone! Migrated {migrated} challenges.')
+        )
@@ -0,0 +1,48 @@
+"""
+Django management command to move embedded comment like arrays
+into the comment_likes collection
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.gamification.models import Comment, CommentLike
+
+
+class Command(BaseCommand):
+    help = 'Migrate Comment.likes arrays to comment_likes and set likes_count'
+    
+    def handle(self, *args, **options):
+        comments = Comment._get_collection()
+        likes = CommentLike._get_collection()
+        
+        legacy = comments.find({'likes': {'$type': 'array'}}, {'likes': 1, 'created_at': 1})
+        
+        migrated = 0
+        for comment in legacy:
+            user_ids = {like.id if hasattr(like, 'id') else like for like in comment['likes']}
+            now = datetime.utcnow()
+            
+            operations = [
+                UpdateOne(
+                    {'comment': comment['_id'], 'user': user_id},
+                    {'$setOnInsert': {'created_at': comment.get('created_at') or now}},
+                    upsert=True
+                )
+                for user_id in user_ids
+            ]
+            if operations:
+                likes.bulk_write(operations, ordered=False)
+            
+            comments.update_one(
+                {'_id': comment['_id']},
+                {
+                    '$set': {'likes_count': likes.count_documents({'comment': comment['_id']})},
+                    '$unset': {'likes': ''}
+                }
+            )
+            migrated += 1
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Migrated likes of {migrated} comments.')
+        )
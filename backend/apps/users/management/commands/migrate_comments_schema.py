@@ -0,0 +1,101 @@
+"""
+Django management command to merge both legacy comment shapes into the
+single threaded Comment schema
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.gamification.models import Comment, MAX_COMMENT_DEPTH
+
+
+class Command(BaseCommand):
+    help = 'Convert comments to content/likes_count with materialized thread paths'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Comments updated per bulk write'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Migrating comments to the threaded schema...')
+        self.stdout.write('(Run migrate_comment_likes first so like arrays are preserved.)')
+        
+        collection = Comment._get_collection()
+        threads = {}  # comment id -> (path, depth, root) of already placed comments
+        
+        def place(comment_id, seen=()):
+            """Path, depth and root of a comment, resolving ancestors first"""
+            if comment_id in threads:
+                return threads[comment_id]
+            document = collection.find_one(
+                {'_id': comment_id}, {'parent': 1, 'path': 1, 'depth': 1, 'root': 1}
+            )
+            if document and document.get('path'):
+                placed = (document['path'], document.get('depth', 0), document.get('root'))
+            else:
+                parent_id = (document or {}).get('parent')
+                parent_id = getattr(parent_id, 'id', parent_id)
+                if parent_id and parent_id not in seen and collection.count_documents({'_id': parent_id}):
+                    parent_path, parent_depth, root = place(parent_id, seen + (comment_id,))
+                    if parent_depth >= MAX_COMMENT_DEPTH:
+                        parent_path = parent_path.rsplit('/', 1)[0]
+                        parent_depth -= 1
+                    placed = (f'{parent_path}/{comment_id}', parent_depth + 1, root)
+                else:
+                    placed = (str(comment_id), 0, comment_id)
+            threads[comment_id] = placed
+            return placed
+        
+        legacy = collection.find(
+            {'$or': [
+                {'path': {'$exists': False}},
+                {'text': {'$exists': True}},
+                {'likes': {'$type': 'number'}},
+            ]},
+            {'text': 1, 'content': 1, 'likes': 1, 'likes_count': 1, 'parent': 1}
+        ).sort('_id', 1)
+        
+        operations = []
+        migrated = 0
+        for document in legacy:
+            path, depth, root = place(document['_id'])
+            update = {'$set': {'path': path, 'depth': depth, 'root': root}, '$unset': {}}
+            
+            if 'text' in document:
+                if not document.get('content'):
+                    update['$set']['content'] = document['text']
+                update['$unset']['text'] = ''
+            if isinstance(document.get('likes'), (int, float)):
+                update['$set']['likes_count'] = max(int(document['likes']), document.get('likes_count') or 0)
+                update['$unset']['likes'] = ''
+            if depth == 0 and document.get('parent'):
+                update['$unset']['parent'] = ''  # Dangling parent
+            if not update['$unset']:
+                del update['$unset']
+            
+            operations.append(UpdateOne({'_id': document['_id']}, update))
+            if len(operations) >= options['batch_size']:
+                collection.bulk_write(operations, ordered=False)
+                migrated += len(operations)
+                operations = []
+        
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+        
+        # Direct reply counts
+        reply_counts = [
+            UpdateOne({'_id': row['_id']}, {'$set': {'reply_count': row['count']}})
+            for row in collection.aggregate([
+                {'$match': {'parent': {'$ne': None}}},
+                {'$group': {'_id': '$parent', 'count': {'$sum': 1}}},
+            ])
+        ]
+        if reply_counts:
+            collection.bulk_write(reply_counts, ordered=False)
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Done! Migrated {migrated} comments, set reply counts on {len(reply_counts)}.'
+            )
+        )
@@ -0,0 +1,93 @@
+"""
+Django management command to move embedded follower/following arrays
+into the follows edge collection
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.users.models import User, Follow
+
+
+class Command(BaseCommand):
+    help = 'Migrate User.followers/following arrays to follows and set the counters'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Edges per bulk write (default: 1000)'
+        )
+    
+    def _flush(self, edges, operations):
+        if operations:
+            edges.bulk_write(operations, ordered=False)
+        return []
+    
+    def _counts(self, edges, group_field):
+        return {
+            row['_id']: row['count']
+            for row in edges.aggregate([
+                {'$group': {'_id': f'${group_field}', 'count': {'$sum': 1}}}
+            ], allowDiskUse=True)
+        }
+    
+    def handle(self, *args, **options):
+        users = User._get_collection()
+        edges = Follow._get_collection()
+        batch_size = options['batch_size']
+        
+        legacy = users.find(
+            {'$or': [{'followers': {'$exists': True}}, {'following': {'$exists': True}}]},
+            {'followers': 1, 'following': 1, 'created_at': 1}
+        )
+        
+        # Both arrays describe the same edges; upserting from both sides
+        # also repairs pairs where only one side was recorded
+        migrated = 0
+        operations = []
+        now = datetime.utcnow()
+        for user in legacy:
+            pairs = [(user['_id'], followee) for followee in user.get('following') or []]
+            pairs += [(follower, user['_id']) for follower in user.get('followers') or []]
+            for follower_id, followee_id in pairs:
+                if follower_id == followee_id:
+                    continue
+                operations.append(UpdateOne(
+                    {'follower': follower_id, 'followee': followee_id},
+                    {'$setOnInsert': {'created_at': now}},
+                    upsert=True
+                ))
+                if len(operations) >= batch_size:
+                    operations = self._flush(edges, operations)
+            migrated += 1
+        self._flush(edges, operations)
+        
+        # Recompute both counters from the edges
+        followers = self._counts(edges, 'followee')
+        following = self._counts(edges, 'follower')
+        operations = []
+        for user in users.find({}, {'_id': 1}):
+            operations.append(UpdateOne(
+                {'_id': user['_id']},
+                {
+                    '$set': {
+                        'followers_count': followers.get(user['_id'], 0),
+                        'following_count': following.get(user['_id'], 0),
+                    },
+                    '$unset': {'followers': '', 'following': ''}
+                }
+            ))
+            if len(operations) >= batch_size:
+                users.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            users.bulk_write(operations, ordered=False)
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Done! Migrated follows of {migrated} users '
+                f'({edges.estimated_document_count()} edges).'
+            )
+        )
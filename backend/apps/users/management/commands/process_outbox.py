@@ -0,0 +1,60 @@
+"""
+Django management command to apply queued gamification side effects
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.gamification.outbox import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Process outbox events (XP, badges and notifications) in batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+            help='Maximum number of events claimed per batch'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.OUTBOX_WORKERS,
+            help='Number of worker threads per batch'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+            help='Seconds to sleep when the outbox is empty'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the outbox and exit instead of polling forever'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = options['workers']
+        
+        self.stdout.write(
+            f'Processing outbox (batch size {batch_size}, {workers} workers)...'
+        )
+        
+        try:
+            while True:
+                stats = process_pending(batch_size=batch_size, max_workers=workers)
+                
+                if stats['claimed']:
+                    message = f"Processed {stats['done']}/{stats['claimed']} events"
+                    if stats['failed']:
+                        self.stdout.write(self.style.WARNING(
+                            f"{message} ({stats['failed']} failed, will retry)"
+                        ))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(message))
+                    continue
+                
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        
+        self.stdout.write(self.style.SUCCESS('Outbox worker stopped.'))
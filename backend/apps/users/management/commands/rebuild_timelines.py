@@ -0,0 +1,43 @@
+"""
+Django management command to rebuild home timelines from the follow graph
+"""
+from django.core.management.base import BaseCommand
+from apps.recipes.models import Recipe
+from apps.users.models import User
+from apps.users.timeline import rebuild_timeline, mark_legacy_pulled_recipes
+
+
+class Command(BaseCommand):
+    help = 'Backfill Recipe.published_at and timeline_pull and rebuild every home timeline'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Only rebuild the timeline of this username'
+        )
+    
+    def handle(self, *args, **options):
+        # Timelines and the feed are ordered by published_at
+        backfilled = Recipe._get_collection().update_many(
+            {'is_published': True, 'published_at': None},
+            [{'$set': {'published_at': '$created_at'}}]
+        ).modified_count
+        if backfilled:
+            self.stdout.write(f'Set published_at on {backfilled} recipes')
+        
+        marked = mark_legacy_pulled_recipes()
+        if marked:
+            self.stdout.write(f'Marked {marked} recipes of high-fanout authors as pulled')
+        
+        users = User.objects(username=options['user']) if options['user'] else User.objects
+        
+        rebuilt = 0
+        entries = 0
+        for user in users.only('id').no_cache():
+            entries += rebuild_timeline(user)
+            rebuilt += 1
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Rebuilt {rebuilt} timelines ({entries} entries).')
+        )
@@ -0,0 +1,48 @@
+"""
+Django management command to repair denormalized unread notification counters
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.users.models import User
+from apps.gamification.notification_model import NOTIFICATION_DOCUMENTS
+
+
+class Command(BaseCommand):
+    help = 'Recompute User.unread_notifications from the notifications collection'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Reconciling unread notification counters...')
+        
+        actual = {}
+        for document in NOTIFICATION_DOCUMENTS:  # Live and archived
+            is_read = document._fields['is_read'].db_field
+            recipient = document._fields['recipient'].db_field
+            pipeline = [
+                {'$match': {is_read: False}},
+                {'$group': {'_id': f'${recipient}', 'unread': {'$sum': 1}}},
+            ]
+            for row in document.objects.aggregate(pipeline):
+                actual[row['_id']] = actual.get(row['_id'], 0) + row['unread']
+        
+        operations = []
+        stored = User.objects(
+            __raw__={'$or': [
+                {'_id': {'$in': list(actual.keys())}},
+                {'unread_notifications': {'$gt': 0}},
+            ]}
+        ).only('unread_notifications').as_pymongo()
+        
+        for row in stored:
+            expected = actual.get(row['_id'], 0)
+            if row.get('unread_notifications', 0) != expected:
+                operations.append(UpdateOne(
+                    {'_id': row['_id']},
+                    {'$set': {'unread_notifications': expected}}
+                ))
+        
+        if operations:
+            User._get_collection().bulk_write(operations, ordered=False)
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'\nDone! Corrected {len(operations)} counters.')
+        )
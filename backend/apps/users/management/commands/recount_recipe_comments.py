@@ -0,0 +1,49 @@
+"""
+Django management command to recompute denormalized recipe comment counters
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from apps.recipes.models import Recipe
+from apps.gamification.models import Comment
+
+
+class Command(BaseCommand):
+    help = 'Recompute Recipe.comment_count and thread_count from the comments collection'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Recounting recipe comments...')
+        
+        counts = {
+            row['_id']: row
+            for row in Comment.objects.aggregate([
+                {'$group': {
+                    '_id': '$recipe',
+                    'comments': {'$sum': 1},
+                    'threads': {'$sum': {'$cond': [{'$gt': ['$depth', 0]}, 0, 1]}},
+                }},
+            ])
+        }
+        
+        operations = []
+        stored = Recipe.objects(
+            __raw__={'$or': [
+                {'_id': {'$in': list(counts.keys())}},
+                {'comment_count': {'$gt': 0}},
+            ]}
+        ).only('comment_count', 'thread_count').as_pymongo()
+        
+        for row in stored:
+            expected = counts.get(row['_id'], {})
+            comments, threads = expected.get('comments', 0), expected.get('threads', 0)
+            if row.get('comment_count') != comments or row.get('thread_count') != threads:
+                operations.append(UpdateOne(
+                    {'_id': row['_id']},
+                    {'$set': {'comment_count': comments, 'thread_count': threads}}
+                ))
+        
+        if operations:
+            Recipe._get_collection().bulk_write(operations, ordered=False)
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Updated {len(operations)} recipes.')
+        )
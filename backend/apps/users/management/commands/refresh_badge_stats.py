@@ -0,0 +1,20 @@
+"""
+Django management command to materialize badge ownership statistics
+"""
+from django.core.management.base import BaseCommand
+from apps.gamification.badge_engine import refresh_badge_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute how many users hold each badge (run on a schedule)'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Refreshing badge statistics...')
+        
+        snapshot = refresh_badge_stats()
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Done! {len(snapshot.holders)} badges held across {snapshot.total_users} users.'
+            )
+        )
@@ -0,0 +1,35 @@
+"""
+Django management command to compact old user actions into daily rollups
+and delete rolled-up raw actions older than USER_ACTION_TTL_DAYS
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.gamification.action_rollups import rollup_user_actions
+
+
+class Command(BaseCommand):
+    help = 'Roll up user actions older than the retention window into daily summaries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.USER_ACTION_ROLLUP_AFTER_DAYS,
+            help='Roll up complete days older than this many days'
+        )
+    
+    def handle(self, *args, **options):
+        if options['days'] >= settings.USER_ACTION_TTL_DAYS:
+            self.stdout.write(self.style.WARNING(
+                f"--days {options['days']} is not below USER_ACTION_TTL_DAYS "
+                f"({settings.USER_ACTION_TTL_DAYS}); raw actions are kept until they are rolled up"
+            ))
+        
+        self.stdout.write('Rolling up user actions...')
+        result = rollup_user_actions(older_than_days=options['days'])
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done! Rolled up {result['days']} days into {result['rollups']} "
+                f"rollups and deleted {result['expired']} expired raw actions "
+                f"(watermark: {result['watermark']})."
+            )
+        )
@@ -0,0 +1,22 @@
+"""
+Django management command to remove the processed_events arrays from users
+
+XP idempotency for outbox events now relies on the unique event_id index
+of user_actions, so the per-user window of event ids is no longer read.
+"""
+from django.core.management.base import BaseCommand
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Unset User.processed_events (replaced by the unique UserAction.event_id index)'
+    
+    def handle(self, *args, **options):
+        cleared = User._get_collection().update_many(
+            {'processed_events': {'$exists': True}},
+            {'$unset': {'processed_events': ''}}
+        ).modified_count
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Done! Unset processed_events on {cleared} users.')
+        )
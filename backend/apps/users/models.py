@@ -2,8 +2,9 @@
 User model for MongoDB using MongoEngine
 """
 from mongoengine import (
-    Document, StringField, EmailField, ListField, 
-    ReferenceField, IntField, DictField, DateTimeField, BooleanField
+    Document, EmbeddedDocument, StringField, EmailField, ListField, 
+    ReferenceField, IntField, DictField, DateTimeField, BooleanField,
+    ObjectIdField, FloatField, EmbeddedDocumentListField
 )
 from datetime import datetime
 import bcrypt
@@ -36,10 +37,15 @@ class User(Document):
     xp = IntField(default=0)
     level = IntField(default=1)
     badges = ListField(StringField())  # Store badge IDs as strings
+    last_daily_login = DateTimeField()  # UTC time of the last daily-login XP award
     
-    # Social
-    followers = ListField(ReferenceField('self'))
-    following = ListField(ReferenceField('self'))
+    # Notifications
+    unread_notifications = IntField(default=0)  # Maintained with $inc
+    notification_preferences = DictField()  # notification type -> 'in_app' | 'digest' | 'off'
+    
+    # Social - edges live in the `follows` collection (see Follow)
+    followers_count = IntField(default=0)  # Maintained with $inc
+    following_count = IntField(default=0)  # Maintained with $inc
     
     # Preferences
     preferences = DictField(default={
@@ -60,8 +66,10 @@ class User(Document):
             'username',
             'email',
             '-created_at',
-            '-xp'
-        ]
+            '-xp',
+            '-followers_count',  # High-fanout authors (see timeline.py)
+        ],
+        'strict': False  # Pre-migration documents still carry follower arrays
     }
     
     def set_password(self, password):
@@ -82,7 +90,11 @@ class User(Document):
     
     def add_xp(self, amount, action_type=None):
         """
-        Add XP and recalculate level
+        Atomically add XP and raise the level if needed
+        
+        XP is only ever changed with $inc, never by saving the in-memory
+        value, so concurrent grants (outbox worker, badges, daily login)
+        cannot overwrite each other.
         
         Args:
             amount (int): XP points to add
@@ -96,27 +108,63 @@ class User(Document):
                 'level_up': dict or None (if leveled up)
             }
         """
-        old_xp = self.xp
-        old_level = self.level
+        from pymongo import ReturnDocument
         
-        self.xp += amount
-        self.level = self.calculate_level()
-        self.updated_at = datetime.utcnow()
+        updated = User._get_collection().find_one_and_update(
+            {'_id': self.id},
+            {
+                '$inc': {'xp': amount},
+                '$set': {'updated_at': datetime.utcnow()},
+            },
+            projection={'xp': 1, 'level': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            raise User.DoesNotExist(f'User {self.id} not found')
         
-        # Check if user leveled up
-        level_up_info = check_level_up(old_xp, self.xp)
+        return self._apply_atomic_xp(updated, amount, action_type=action_type)
+    
+    def _apply_atomic_xp(self, updated, amount, action_type=None):
+        """
+        Finish an atomic XP increment: raise the stored level if needed,
+        notify on level-up and refresh the in-memory values
+        
+        Args:
+            updated (dict): User document after the $inc (xp and level)
+            amount (int): XP that was added
+            action_type (str, optional): Type of action that triggered XP gain
+            
+        Returns:
+            dict: Same shape as add_xp()
+        """
+        collection = User._get_collection()
+        new_xp = updated.get('xp', 0)
+        old_level = updated.get('level', 1)
+        new_level = calculate_level_from_xp(new_xp)
+        level_up_info = check_level_up(new_xp - amount, new_xp)
         
-        # Send level-up notification
-        if level_up_info and self.level > old_level:
+        if new_level > old_level:
+            # Only ever raise the stored level, even if events race
+            collection.update_one(
+                {'_id': self.id, 'level': {'$lt': new_level}},
+                {'$set': {'level': new_level}}
+            )
             try:
                 from apps.gamification.notification_helpers import notify_level_up
-                notify_level_up(self, self.level)
+                notify_level_up(self, new_level)
             except Exception as e:
                 pass  # Don't fail if notification fails
         
+        self.xp = new_xp
+        self.level = max(old_level, new_level)
+        # Already stored atomically; a later save() must not $set them again
+        self._changed_fields = [
+            field for field in self._changed_fields if field not in ('xp', 'level')
+        ]
+        
         return {
             'xp_gained': amount,
-            'new_xp': self.xp,
+            'new_xp': new_xp,
             'old_level': old_level,
             'new_level': self.level,
             'level_up': level_up_info,
@@ -156,11 +204,80 @@ class User(Document):
             'level_title': self.get_level_title(),
             'xp_progress': xp_progress,
             'badges': self.badges if self.badges else [],
-            'followers_count': len(self.followers) if self.followers else 0,
-            'following_count': len(self.following) if self.following else 0,
+            'followers_count': self.followers_count or 0,
+            'following_count': self.following_count or 0,
             'preferences': self.preferences,
             'created_at': self.created_at.isoformat() if self.created_at else None,
         }
     
     def __str__(self):
         return f"User: {self.username}"
+
+
+class Follow(Document):
+    """A follow edge: ``follower`` follows ``followee``"""
+    
+    follower = ReferenceField('User', required=True)
+    followee = ReferenceField('User', required=True)
+    created_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'follows',
+        'indexes': [
+            {'fields': ['follower', 'followee'], 'unique': True},  # Following lists, is_following
+            ('followee', 'follower'),  # Follower lists and fan-out in follower id order
+            ('followee', '-created_at'),
+            ('follower', '-created_at'),
+        ]
+    }
+
+
+class TimelineEntry(EmbeddedDocument):
+    """A recipe in a home timeline"""
+    
+    recipe = ObjectIdField(required=True)
+    author = ObjectIdField(required=True)
+    published_at = DateTimeField(required=True)
+
+
+class HomeTimeline(Document):
+    """
+    Capped, newest-first list of recipes published by the users someone follows
+    
+    Written on publish by the follower fan-out; see apps/users/timeline.py.
+    """
+    
+    user = ReferenceField('User', required=True, unique=True)
+    entries = EmbeddedDocumentListField(TimelineEntry)
+    updated_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'home_timelines',
+    }
+
+
+class SuggestedUser(EmbeddedDocument):
+    """A suggested user with the signals behind the score"""
+    
+    user = ObjectIdField(required=True)
+    score = FloatField(default=0.0)
+    mutual_follows = IntField(default=0)  # People you follow who follow them
+    co_cooked = IntField(default=0)  # Recipes you both cooked
+    shared_cuisines = IntField(default=0)  # Cuisines in both preference lists
+
+
+class FollowSuggestions(Document):
+    """
+    Precomputed top-K "cooks you may know" for a user, best first
+    
+    Written by the compute_follow_suggestions batch job; see
+    apps/users/suggestions.py.
+    """
+    
+    user = ReferenceField('User', required=True, unique=True)
+    suggestions = EmbeddedDocumentListField(SuggestedUser)
+    computed_at = DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        'collection': 'follow_suggestions',
+    }
@@ -0,0 +1,249 @@
+"""
+"Cooks you may know" follow suggestions
+
+Suggestions are computed offline by compute_follow_suggestions() (the
+compute_follow_suggestions management command) and stored as a top-K list
+per user in FollowSuggestions, so the API only does a point read.
+
+The job builds three sparse matrices over active users:
+
+- F: follow graph, F[a, b] = 1 if a follows b
+- C: co-cook matrix rows, C[a, r] = 1 if a cooked recipe r
+- P: cuisine preferences, P[a, c] = 1 if c is in a's preferences
+
+and, one block of rows at a time, finds candidates through
+
+    MUTUAL_WEIGHT * (F @ F) + CO_COOK_WEIGHT * (C @ C.T)
+
+i.e. people followed by the people you follow and people who cooked the
+same recipes. Both products stay sparse. Shared cuisines only re-rank
+those candidates (CUISINE_WEIGHT per shared cuisine): P @ P.T is nearly
+dense, since one popular cuisine links most users, so it is only evaluated
+on the candidate pairs. Yourself and users you already follow are excluded.
+
+numpy and scipy are only needed by the batch job.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import UpdateOne
+
+from .follows import following_among
+from .models import User, Follow, FollowSuggestions, SuggestedUser
+
+
+MUTUAL_WEIGHT = 1.0
+CO_COOK_WEIGHT = 0.5
+CUISINE_WEIGHT = 0.25
+
+# Rows scored per block (bounds memory of the block products)
+DEFAULT_BLOCK_SIZE = 512
+
+
+def _top_k():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_TOP_K', 50)
+
+
+def _load_users():
+    """Active users: (list of ids, id -> row, list of cuisine lists)"""
+    ids = []
+    cuisines = []
+    for row in User.objects(is_active=True).only('id', 'preferences').as_pymongo():
+        ids.append(row['_id'])
+        cuisines.append((row.get('preferences') or {}).get('cuisines') or [])
+    return ids, {user_id: i for i, user_id in enumerate(ids)}, cuisines
+
+
+def _binary_matrix(pairs, shape):
+    """CSR matrix with a 1 at every distinct (row, column) pair"""
+    import numpy as np
+    from scipy import sparse
+
+    if not pairs:
+        return sparse.csr_matrix(shape, dtype=np.float32)
+    rows, cols = zip(*pairs)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape
+    )
+    matrix.data[:] = 1  # Duplicate pairs were summed
+    return matrix
+
+
+def _follow_matrix(index):
+    pairs = []
+    for row in Follow.objects.only('follower', 'followee').as_pymongo():
+        follower, followee = index.get(row['follower']), index.get(row['followee'])
+        if follower is not None and followee is not None:
+            pairs.append((follower, followee))
+    return _binary_matrix(pairs, (len(index), len(index)))
+
+
+def _co_cook_matrix(index):
+    from apps.gamification.models import CookedRecipe
+
+    recipes = {}
+    pairs = []
+    for row in CookedRecipe.objects.only('user', 'recipe').as_pymongo():
+        user = index.get(row['user'])
+        if user is None:
+            continue
+        pairs.append((user, recipes.setdefault(row['recipe'], len(recipes))))
+    return _binary_matrix(pairs, (len(index), max(len(recipes), 1)))
+
+
+def _cuisine_matrix(cuisines):
+    vocabulary = {}
+    pairs = [
+        (i, vocabulary.setdefault(str(cuisine).strip().lower(), len(vocabulary)))
+        for i, user_cuisines in enumerate(cuisines)
+        for cuisine in user_cuisines
+        if str(cuisine).strip()
+    ]
+    return _binary_matrix(pairs, (len(cuisines), max(len(vocabulary), 1)))
+
+
+def _row(matrix, i):
+    start, end = matrix.indptr[i], matrix.indptr[i + 1]
+    return matrix.indices[start:end], matrix.data[start:end]
+
+
+def _lookup(matrix, i, columns):
+    """Values of row i of a CSR matrix (sorted indices) at the given columns, 0 if absent"""
+    import numpy as np
+
+    indices, data = _row(matrix, i)
+    if not len(indices):
+        return np.zeros(len(columns), dtype=matrix.dtype)
+    at = np.minimum(np.searchsorted(indices, columns), len(indices) - 1)
+    return np.where(indices[at] == columns, data[at], 0)
+
+
+def _shared_cuisines(preferences, candidates, start):
+    """Shared cuisine counts of every candidate pair, aligned with candidates.data"""
+    import numpy as np
+
+    rows = np.repeat(np.arange(candidates.shape[0]), np.diff(candidates.indptr)) + start
+    if not len(rows):
+        return np.zeros(0, dtype=np.float32)
+    shared = preferences[rows].multiply(preferences[candidates.indices]).sum(axis=1)
+    return np.asarray(shared, dtype=np.float32).ravel()
+
+
+def _best(scores, i, row_index, followed, top_k):
+    """Top-K (column, score) of one score row, excluding self and followed users"""
+    import numpy as np
+
+    columns, values = _row(scores, i)
+    keep = (columns != row_index) & ~np.isin(columns, followed)
+    columns, values = columns[keep], values[keep]
+    if len(values) > top_k:
+        chosen = np.argpartition(-values, top_k)[:top_k]
+        columns, values = columns[chosen], values[chosen]
+    order = np.lexsort((columns, -values))  # Best first, ties by column for stability
+    return columns[order], values[order]
+
+
+def compute_follow_suggestions(top_k=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Recompute and store the top-K suggestions of every active user
+
+    Returns:
+        dict: {'users': int, 'with_suggestions': int}
+    """
+    top_k = top_k or _top_k()
+    ids, index, cuisines = _load_users()
+    if not ids:
+        return {'users': 0, 'with_suggestions': 0}
+
+    follows = _follow_matrix(index)
+    cooks = _co_cook_matrix(index)
+    preferences = _cuisine_matrix(cuisines)
+    cooks_t = cooks.T.tocsc()
+
+    collection = FollowSuggestions._get_collection()
+    computed_at = datetime.utcnow()
+    with_suggestions = 0
+
+    for start in range(0, len(ids), block_size):
+        end = min(start + block_size, len(ids))
+        mutual = (follows[start:end] @ follows).tocsr()
+        co_cooked = (cooks[start:end] @ cooks_t).tocsr()
+        scores = (MUTUAL_WEIGHT * mutual + CO_COOK_WEIGHT * co_cooked).tocsr()
+        for matrix in (mutual, co_cooked, scores):
+            matrix.sort_indices()
+
+        # Re-rank the candidates by shared cuisines (same sparsity pattern)
+        shared = scores.copy()
+        shared.data = _shared_cuisines(preferences, scores, start)
+        scores.data = scores.data + CUISINE_WEIGHT * shared.data
+
+        operations = []
+        for i in range(end - start):
+            followed, _ = _row(follows, start + i)
+            columns, values = _best(scores, i, start + i, followed, top_k)
+            signals = [_lookup(matrix, i, columns) for matrix in (mutual, co_cooked, shared)]
+
+            suggestions = [
+                SuggestedUser(
+                    user=ids[column],
+                    score=round(float(value), 4),
+                    mutual_follows=int(signals[0][n]),
+                    co_cooked=int(signals[1][n]),
+                    shared_cuisines=int(signals[2][n]),
+                ).to_mongo().to_dict()
+                for n, (column, value) in enumerate(zip(columns, values))
+            ]
+            with_suggestions += bool(suggestions)
+            operations.append(UpdateOne(
+                {'user': ids[start + i]},
+                {'$set': {'suggestions': suggestions, 'computed_at': computed_at}},
+                upsert=True
+            ))
+
+        collection.bulk_write(operations, ordered=False)
+
+    return {'users': len(ids), 'with_suggestions': with_suggestions}
+
+
+def get_suggestions(user, limit=10):
+    """
+    Read a user's stored suggestions, dropping anyone followed since
+
+    One point read, one follows $in for the stored ids and one batched
+    user fetch.
+
+    Returns:
+        tuple: (list of suggestion dicts, computed_at or None)
+    """
+    stored = FollowSuggestions.objects(user=user.id).only('suggestions', 'computed_at').as_pymongo().first()
+    if not stored:
+        return [], None
+
+    entries = stored.get('suggestions') or []
+    followed = following_among(user, [entry['user'] for entry in entries])
+    entries = [entry for entry in entries if entry['user'] not in followed][:limit]
+
+    users = {
+        u.id: u
+        for u in User.objects(id__in=[entry['user'] for entry in entries], is_active=True)
+        .only('username', 'avatar_url', 'level', 'xp', 'followers_count')
+    } if entries else {}
+
+    results = []
+    for entry in entries:
+        suggested = users.get(entry['user'])
+        if not suggested:
+            continue
+        results.append({
+            'id': str(suggested.id),
+            'username': suggested.username,
+            'avatar_url': suggested.avatar_url,
+            'level': suggested.level,
+            'xp': suggested.xp,
+            'followers_count': suggested.followers_count or 0,
+            'score': entry.get('score', 0.0),
+            'mutual_follows': entry.get('mutual_follows', 0),
+            'co_cooked': entry.get('co_cooked', 0),
+            'shared_cuisines': entry.get('shared_cuisines', 0),
+        })
+    return results, stored.get('computed_at')
@@ -1,3 +1,213 @@
-from django.test import TestCase
+import importlib.util
+import unittest
+from datetime import datetime, timedelta
 
-# Create your tests here.
+from django.test import override_settings
+
+from apps.testing import MongoTestCase
+from apps.recipes.models import Recipe
+from apps.gamification.fanout import fan_out_new_recipe
+from apps.gamification.models import Comment, CookedRecipe
+from . import timeline
+from .activity_feed import read_feed, InvalidFeedCursor
+from .follows import follow, unfollow
+from .models import User
+from .timeline import iter_timeline, mark_legacy_pulled_recipes
+
+
+def make_user(username, **fields):
+    return User(
+        username=username, email=f'{username}@example.com', password_hash='x', **fields
+    ).save()
+
+
+class TimelineTestCase(MongoTestCase):
+
+    def setUp(self):
+        # Pulled authors are cached per process
+        timeline._pulled_authors_cache['expires_at'] = 0
+        # Whole seconds: Mongo keeps milliseconds and isoformat() must sort
+        self.start = datetime.utcnow().replace(microsecond=0) - timedelta(days=1)
+        self.published = 0
+
+    def publish(self, author, title):
+        """Publish a recipe a minute after the previous one and fan it out"""
+        self.published += 1
+        recipe = Recipe(
+            title=title,
+            author=author,
+            is_published=True,
+            published_at=self.start + timedelta(minutes=self.published)
+        ).save()
+        fan_out_new_recipe(recipe, User.objects.get(id=author.id))
+        timeline._pulled_authors_cache['expires_at'] = 0
+        return recipe
+
+    def timeline_ids(self, user, **kwargs):
+        return [recipe_id for _, recipe_id, _ in iter_timeline(user, **kwargs)]
+
+
+@override_settings(NOTIFICATION_FANOUT='local', TIMELINE_PUSH_MAX_FOLLOWERS=2)
+class TimelineTests(TimelineTestCase):
+    """Push and pull sources of the home timeline merge into one ordering"""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user('reader')
+        self.other = make_user('other')
+        self.small = make_user('small')
+        self.big = make_user('big')
+        follow(self.reader, self.small)
+        follow(self.reader, self.big)
+        follow(self.other, self.big)  # Two followers: high fanout
+
+    def test_pushed_and_pulled_recipes_merge_newest_first(self):
+        first = self.publish(self.small, 'First')
+        second = self.publish(self.big, 'Second')
+        third = self.publish(self.small, 'Third')
+
+        self.assertFalse(Recipe.objects.get(id=first.id).timeline_pull)
+        self.assertTrue(Recipe.objects.get(id=second.id).timeline_pull)
+        self.assertEqual(self.timeline_ids(self.reader), [third.id, second.id, first.id])
+
+    def test_paging_resumes_after_a_position(self):
+        recipes = [self.publish(author, f'Recipe {n}') for n, author in enumerate(
+            [self.small, self.big, self.small, self.big]
+        )]
+        newest_first = [recipe.id for recipe in reversed(recipes)]
+
+        page = list(iter_timeline(self.reader, limit=2))
+        published_at, recipe_id, _ = page[-1]
+        rest = self.timeline_ids(self.reader, before=(published_at, recipe_id), limit=10)
+
+        self.assertEqual([item[1] for item in page] + rest, newest_first)
+
+    def test_author_crossing_the_threshold_never_duplicates_or_drops_recipes(self):
+        pushed = self.publish(self.small, 'Pushed')
+        follow(self.other, self.small)  # Now high fanout
+        pulled = self.publish(self.small, 'Pulled')
+        unfollow(self.other, self.small)  # Back below the threshold
+        pushed_again = self.publish(self.small, 'Pushed again')
+
+        self.assertEqual(
+            self.timeline_ids(self.reader), [pushed_again.id, pulled.id, pushed.id]
+        )
+
+    def test_recipe_in_both_sources_is_yielded_once(self):
+        recipe = self.publish(self.big, 'Big')
+        # A legacy recipe pushed before its author crossed the threshold
+        Recipe.objects(id=recipe.id).update_one(unset__timeline_pull=True)
+        timeline.push_recipe(Recipe.objects.get(id=recipe.id), [self.reader.id])
+        self.assertEqual(mark_legacy_pulled_recipes(), 1)
+        timeline._pulled_authors_cache['expires_at'] = 0
+
+        self.assertEqual(self.timeline_ids(self.reader), [recipe.id])
+
+
+@override_settings(NOTIFICATION_FANOUT='local', TIMELINE_PUSH_MAX_FOLLOWERS=2)
+class ActivityFeedTests(TimelineTestCase):
+    """Cursor paging of the mixed activity feed"""
+
+    def setUp(self):
+        super().setUp()
+        self.reader = make_user('reader')
+        self.author = make_user('author')
+        follow(self.reader, self.author)
+
+        recipes = [self.publish(self.author, f'Recipe {n}') for n in range(4)]
+        for n, recipe in enumerate(recipes[:3]):
+            CookedRecipe(
+                user=self.author, recipe=recipe, photo_url='photo.jpg',
+                cooked_at=self.start + timedelta(minutes=10 + n)
+            ).save()
+        for n, recipe in enumerate(recipes[:2]):
+            comment = Comment(
+                user=self.author, recipe=recipe, content='Tasty',
+                created_at=self.start + timedelta(minutes=20 + n)
+            )
+            comment.assign_thread()
+            comment.save(force_insert=True)
+
+    def read_all(self, limit):
+        events = []
+        cursor = None
+        for _ in range(20):
+            page, cursor = read_feed(self.reader, cursor=cursor, limit=limit)
+            events.extend(page)
+            if cursor is None:
+                return events
+        self.fail('Feed paging did not terminate')
+
+    def test_pages_cover_every_event_once_newest_first(self):
+        for limit in (1, 3, 4, 20):
+            events = self.read_all(limit)
+            keys = [(event['type'], event['id']) for event in events]
+            times = [event['created_at'] for event in events]
+
+            self.assertEqual(len(keys), 9, limit)
+            self.assertEqual(len(set(keys)), 9, limit)
+            self.assertEqual(times, sorted(times, reverse=True), limit)
+
+    def test_types_filter(self):
+        events, _ = read_feed(self.reader, limit=20, types=['cook'])
+
+        self.assertEqual([event['type'] for event in events], ['cook'] * 3)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidFeedCursor):
+            read_feed(self.reader, cursor='not-a-cursor')
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec('numpy') and importlib.util.find_spec('scipy'),
+    'numpy and scipy are needed to compute follow suggestions'
+)
+@override_settings(NOTIFICATION_FANOUT='local')
+class FollowSuggestionTests(MongoTestCase):
+    """Suggestion scoring on a small fixed graph"""
+
+    def setUp(self):
+        def user(name, cuisines=()):
+            return make_user(name, preferences={'cuisines': list(cuisines)})
+
+        self.ann = user('ann', ['Italian'])
+        self.ben = user('ben')
+        self.cat = user('cat')
+        self.dan = user('dan', ['italian'])
+        self.eve = user('eve')
+        self.fay = user('fay', ['italian'])  # Shares a cuisine only
+
+        # ann -> ben -> {cat, dan}: cat and dan are followed by someone ann follows
+        follow(self.ann, self.ben)
+        follow(self.ben, self.cat)
+        follow(self.ben, self.dan)
+        # ann and eve cooked the same recipe
+        recipe = Recipe(title='Risotto', author=self.ben, is_published=True).save()
+        for cook in (self.ann, self.eve):
+            CookedRecipe(user=cook, recipe=recipe).save()
+
+    def test_scores_and_signals(self):
+        from .suggestions import compute_follow_suggestions, get_suggestions
+
+        compute_follow_suggestions(top_k=10, block_size=2)
+        suggestions, computed_at = get_suggestions(self.ann)
+
+        self.assertIsNotNone(computed_at)
+        self.assertEqual(
+            [(s['username'], s['score'], s['mutual_follows'], s['co_cooked'], s['shared_cuisines'])
+             for s in suggestions],
+            [
+                ('dan', 1.25, 1, 0, 1),  # Mutual follow plus a shared cuisine
+                ('cat', 1.0, 1, 0, 0),
+                ('eve', 0.5, 0, 1, 0),
+            ]
+        )
+
+    def test_followed_users_are_dropped_on_read(self):
+        from .suggestions import compute_follow_suggestions, get_suggestions
+
+        compute_follow_suggestions(top_k=10)
+        follow(self.ann, self.dan)
+        suggestions, _ = get_suggestions(self.ann)
+
+        self.assertEqual([s['username'] for s in suggestions], ['cat', 'eve'])
@@ -0,0 +1,320 @@
+"""
+Home timelines for the activity feed (fan-out on write)
+
+Publishing a recipe pushes one small entry into the HomeTimeline document
+of every follower, capped to the newest TIMELINE_MAX_ENTRIES. Reading the
+recipes of the feed is then one point read of the timeline plus one
+batched fetch of the recipe cards, however many people the reader follows.
+
+Authors with at least TIMELINE_PUSH_MAX_FOLLOWERS followers are not pushed
+(hybrid fan-out): their recipes are pulled at read time and merged with the
+pushed entries. The choice is made once per recipe, when it is fanned out,
+and stored as Recipe.timeline_pull; reads pull exactly the recipes marked
+that way, so an author crossing the threshold in either direction never
+makes a recipe appear twice or disappear.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .models import User, Follow, HomeTimeline, TimelineEntry
+
+
+_pulled_authors_cache = {'expires_at': 0, 'ids': frozenset()}
+_pulled_authors_lock = threading.Lock()
+
+# Fields needed to render a recipe card
+CARD_FIELDS = (
+    'id', 'slug', 'title', 'description', 'author', 'images', 'difficulty',
+    'prep_time', 'cook_time', 'rating_stats', 'created_at', 'published_at',
+)
+
+
+def _max_entries():
+    return getattr(settings, 'TIMELINE_MAX_ENTRIES', 500)
+
+
+def _push_max_followers():
+    return getattr(settings, 'TIMELINE_PUSH_MAX_FOLLOWERS', 10000)
+
+
+def is_high_fanout(author):
+    """Whether a recipe published now by an author is pulled instead of pushed"""
+    return (author.followers_count or 0) >= _push_max_followers()
+
+
+def pulled_author_ids():
+    """
+    Ids of the authors with recipes marked timeline_pull, cached for
+    TIMELINE_HIGH_FANOUT_CACHE_SECONDS
+    """
+    from apps.recipes.models import Recipe
+
+    now = time.monotonic()
+    with _pulled_authors_lock:
+        if _pulled_authors_cache['expires_at'] > now:
+            return _pulled_authors_cache['ids']
+
+    ids = frozenset(Recipe._get_collection().distinct('author', {'timeline_pull': True}))
+    with _pulled_authors_lock:
+        _pulled_authors_cache['ids'] = ids
+        _pulled_authors_cache['expires_at'] = now + getattr(
+            settings, 'TIMELINE_HIGH_FANOUT_CACHE_SECONDS', 300
+        )
+    return ids
+
+
+def _entry(recipe_id, author_id, published_at):
+    return TimelineEntry(
+        recipe=recipe_id, author=author_id, published_at=published_at
+    ).to_mongo().to_dict()
+
+
+def _push(entries):
+    """Update that merges entries into a timeline, newest first, capped"""
+    return {
+        '$push': {'entries': {
+            '$each': entries,
+            '$sort': {'published_at': -1, 'recipe': -1},  # The read merge key
+            '$slice': _max_entries(),
+        }},
+        '$set': {'updated_at': datetime.utcnow()},
+    }
+
+
+def push_recipe(recipe, follower_ids):
+    """
+    Push a published recipe into the timelines of a chunk of followers
+
+    One bulk_write per call. The filter skips timelines that already hold
+    the recipe, so re-running an interrupted chunk is safe (the upsert of
+    an existing timeline then fails with a duplicate key, which is ignored).
+
+    Returns:
+        int: Number of timelines written
+    """
+    if not follower_ids:
+        return 0
+
+    author_id = recipe._data['author'].id  # DBRef or User, without dereferencing
+    update = _push([_entry(recipe.id, author_id, recipe.published_at or recipe.created_at)])
+    operations = [
+        UpdateOne({'user': follower_id, 'entries.recipe': {'$ne': recipe.id}}, update, upsert=True)
+        for follower_id in follower_ids
+    ]
+    try:
+        result = HomeTimeline._get_collection().bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+        return e.details.get('nModified', 0) + e.details.get('nUpserted', 0)
+    return result.modified_count + result.upserted_count
+
+
+def backfill_followee(follower, followee):
+    """Merge a newly followed author's latest pushed recipes into the follower's timeline"""
+    from apps.recipes.models import Recipe
+
+    recipes = (
+        Recipe.objects(author=followee.id, is_published=True, timeline_pull__ne=True)
+        .order_by('-published_at', '-created_at')
+        .limit(_max_entries())
+        .only('id', 'published_at', 'created_at')
+        .as_pymongo()
+    )
+    entries = [
+        _entry(row['_id'], followee.id, row.get('published_at') or row['created_at'])
+        for row in recipes
+    ]
+    if not entries:
+        return
+
+    collection = HomeTimeline._get_collection()
+    remove_followee(follower.id, followee.id)  # Never duplicate entries
+    collection.update_one({'user': follower.id}, _push(entries), upsert=True)
+
+
+def remove_followee(follower_id, followee_id):
+    """Drop an author's entries from a timeline (on unfollow)"""
+    HomeTimeline._get_collection().update_one(
+        {'user': follower_id},
+        {'$pull': {'entries': {'author': followee_id}}}
+    )
+
+
+def mark_legacy_pulled_recipes():
+    """
+    Mark published recipes of current high-fanout authors that predate
+    Recipe.timeline_pull as pulled (they were never pushed)
+
+    A copy pushed before the author crossed the threshold is deduplicated
+    on read.
+
+    Returns:
+        int: Number of recipes marked
+    """
+    from apps.recipes.models import Recipe
+
+    authors = [
+        row['_id']
+        for row in User.objects(followers_count__gte=_push_max_followers()).only('id').as_pymongo()
+    ]
+    if not authors:
+        return 0
+    return Recipe._get_collection().update_many(
+        {'author': {'$in': authors}, 'is_published': True, 'timeline_pull': None},
+        {'$set': {'timeline_pull': True}}
+    ).modified_count
+
+
+def rebuild_timeline(user):
+    """
+    Rebuild a user's timeline from scratch from the authors they follow
+
+    Returns:
+        int: Number of entries written
+    """
+    from apps.recipes.models import Recipe
+
+    authors = [
+        row['followee']
+        for row in Follow.objects(follower=user.id).only('followee').as_pymongo()
+    ]
+    entries = []
+    if authors:
+        recipes = (
+            Recipe.objects(author__in=authors, is_published=True, timeline_pull__ne=True)
+            .order_by('-published_at', '-created_at')
+            .limit(_max_entries())
+            .only('id', 'author', 'published_at', 'created_at')
+            .as_pymongo()
+        )
+        entries = [
+            _entry(row['_id'], row['author'], row.get('published_at') or row['created_at'])
+            for row in recipes
+        ]
+
+    HomeTimeline._get_collection().update_one(
+        {'user': user.id},
+        {'$set': {'entries': entries, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return len(entries)
+
+
+def _followed_pulled_author_ids(user):
+    """Authors with pulled recipes the user follows (no query if there are none)"""
+    candidates = pulled_author_ids()
+    if not candidates:
+        return []
+    return [
+        row['followee']
+        for row in Follow.objects(follower=user.id, followee__in=list(candidates))
+        .only('followee').as_pymongo()
+    ]
+
+
+def recipe_card(recipe, author):
+    """Feed card for a recipe, given its author (a User or None)"""
+    return {
+        'id': str(recipe.id),
+        'slug': recipe.slug,
+        'title': recipe.title,
+        'description': recipe.description,
+        'author': {
+            'id': str(author.id),
+            'username': author.username,
+            'level': author.level,
+        } if author else None,
+        'images': recipe.images,
+        'difficulty': recipe.difficulty,
+        'total_time': recipe.total_time,
+        'rating_stats': {
+            'average': recipe.rating_stats.average if recipe.rating_stats else 0.0,
+            'count': recipe.rating_stats.count if recipe.rating_stats else 0,
+        },
+        'created_at': recipe.created_at.isoformat() if recipe.created_at else None,
+        'published_at': recipe.published_at.isoformat() if recipe.published_at else None,
+    }
+
+
+def recipe_cards(recipes):
+    """Cards for a list of recipes, loading their authors with one query"""
+    author_ids = {recipe._data['author'].id for recipe in recipes if recipe._data.get('author')}
+    authors = {
+        user.id: user
+        for user in User.objects(id__in=list(author_ids)).only('username', 'level')
+    } if author_ids else {}
+    return [
+        recipe_card(recipe, authors.get(recipe._data['author'].id) if recipe._data.get('author') else None)
+        for recipe in recipes
+    ]
+
+
+def iter_timeline(user, before=None, limit=20, batch_size=None):
+    """
+    Iterate a user's home timeline newest first, starting after a position
+
+    Pushed entries come from one point read of the timeline; recipes marked
+    timeline_pull of followed authors are pulled with a lazy cursor and
+    merged in. A recipe is yielded once even if it is in both sources.
+
+    Args:
+        user: Reader (User)
+        before (tuple, optional): (published_at, recipe id) to continue after
+        limit (int): Maximum number of recipes to yield
+        batch_size (int, optional): Cursor batch size of the pulled recipes
+
+    Yields:
+        tuple: (published_at, recipe id, author id)
+    """
+    from apps.recipes.models import Recipe
+
+    timeline = HomeTimeline.objects(user=user.id).only('entries').as_pymongo().first()
+    pushed = (
+        (entry['published_at'], entry['recipe'], entry['author'])
+        for entry in (timeline or {}).get('entries', [])
+        if before is None or (entry['published_at'], entry['recipe']) < before
+    )
+    sources = [pushed]
+
+    pulled_authors = _followed_pulled_author_ids(user)
+    if pulled_authors:
+        # Only recipes with a publication time can be ordered and resumed by
+        # it; rebuild_timelines backfills it for legacy published recipes
+        query = Q(
+            author__in=pulled_authors, timeline_pull=True, is_published=True,
+            published_at__ne=None
+        )
+        if before is not None:
+            query &= Q(published_at__lt=before[0]) | Q(published_at=before[0], id__lt=before[1])
+        cursor = (
+            Recipe.objects(query)
+            .order_by('-published_at', '-id')
+            .limit(limit)
+            .batch_size(batch_size or limit)
+            .only('id', 'author', 'published_at')
+            .as_pymongo()
+        )
+        sources.append(
+            (row['published_at'], row['_id'], row['author']) for row in cursor
+        )
+
+    merged = heapq.merge(*sources, key=lambda item: (item[0], item[1]), reverse=True)
+    return islice(_unique_recipes(merged), limit)
+
+
+def _unique_recipes(items):
+    """Drop repeated recipe ids from a merged (published_at, recipe, author) stream"""
+    seen = set()
+    for item in items:
+        if item[1] not in seen:
+            seen.add(item[1])
+            yield item
@@ -23,4 +23,5 @@ urlpatterns = [
     path('<str:user_id>/followers/', follow_views.get_followers, name='get_followers'),
     path('<str:user_id>/following/', follow_views.get_following, name='get_following'),
     path('feed/', follow_views.get_activity_feed, name='activity_feed'),
+    path('suggestions/', follow_views.get_follow_suggestions, name='follow_suggestions'),
 ]
@@ -13,6 +13,8 @@ from apps.recipes.models import Recipe
 from apps.gamification.models import CookedRecipe, UserAction
 from apps.gamification.badge_engine import get_user_badges
 from apps.gamification.action_tracker import get_recent_activity, get_action_stats
+from apps.gamification.streaks import get_streak
+from apps.gamification.notification_model import refresh_sender_snapshots
 
 
 @api_view(['GET'])
@@ -29,6 +31,7 @@ def get_user_stats(request, user_id):
     - social: Followers and following counts
     - join_date: Account creation date
     - recent_activity: Last 7 days of user actions
+    - streak: Current and longest daily cooking streak
     """
     try:
         user = User.objects.get(id=user_id)
@@ -52,8 +55,8 @@ def get_user_stats(request, user_id):
     badges_count = len(user_badges)
     
     # Get social stats (from User model)
-    followers_count = len(user.followers) if user.followers else 0
-    following_count = len(user.following) if user.following else 0
+    followers_count = user.followers_count or 0
+    following_count = user.following_count or 0
     
     # Get recent activity (last 7 days)
     recent_activity = get_recent_activity(user, days=7)
@@ -61,6 +64,9 @@ def get_user_stats(request, user_id):
     # Get action statistics
     action_stats = get_action_stats(user)
     
+    # Get cooking streak (single point read)
+    streak = get_streak(user)
+    
     # Build response
     stats = {
         'user': {
@@ -85,6 +91,7 @@ def get_user_stats(request, user_id):
             'created': recipes_created,
             'cooked': recipes_cooked,
         },
+        'streak': streak,
         'badges': {
             'total_earned': badges_count,
             'badges': user_badges  # get_user_badges already returns formatted dicts
@@ -247,9 +254,14 @@ def update_profile(request):
     # Update timestamp
     user.updated_at = timezone.now()
     
+    # Notifications carry a copy of the sender's username and avatar
+    snapshot_changed = any(field in user._get_changed_fields() for field in ('username', 'avatar_url'))
+    
     # Save changes
     try:
         user.save()
+        if snapshot_changed:
+            refresh_sender_snapshots(user)
     except Exception as e:
         return Response(
             {'error': f'Failed to update profile: {str(e)}'},
@@ -2,6 +2,9 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with ``uvicorn config.asgi:application`` - the notification stream
+(/api/notifications/stream/) is an async view that holds connections open
+and needs an ASGI server.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
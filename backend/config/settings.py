@@ -226,6 +226,77 @@ CORS_ALLOW_METHODS = [
     'PUT',
 ]
 
+# Gamification Outbox
+# XP, badges and notifications for user actions are applied by
+# `python manage.py process_outbox`. OUTBOX_SYNC=True processes them inline
+# instead (tests and single-process setups).
+OUTBOX_SYNC = config('OUTBOX_SYNC', default=False, cast=bool)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_WORKERS = config('OUTBOX_WORKERS', default=4, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=60, cast=int)
+OUTBOX_POLL_INTERVAL = config('OUTBOX_POLL_INTERVAL', default=1.0, cast=float)
+
+# UserAction Retention
+# Raw actions are rolled up into per-user daily summaries after
+# USER_ACTION_ROLLUP_AFTER_DAYS (`python manage.py rollup_user_actions`)
+# and are deleted by the same command after USER_ACTION_TTL_DAYS, never
+# before they are rolled up.
+USER_ACTION_ROLLUP_AFTER_DAYS = config('USER_ACTION_ROLLUP_AFTER_DAYS', default=30, cast=int)
+USER_ACTION_TTL_DAYS = config('USER_ACTION_TTL_DAYS', default=90, cast=int)
+
+# Badge ownership statistics are materialized by
+# `python manage.py refresh_badge_stats` and cached for this long
+BADGE_STATS_CACHE_SECONDS = config('BADGE_STATS_CACHE_SECONDS', default=300, cast=int)
+
+# Real-time Notifications
+# Served as Server-Sent Events at /api/notifications/stream/ (ASGI only).
+# 'mongo' fans messages out through a capped collection so every worker
+# process - and the outbox worker - reaches every client; 'local' keeps
+# them in-process (single worker setups).
+NOTIFICATION_FANOUT = config('NOTIFICATION_FANOUT', default='mongo')
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = config('NOTIFICATION_STREAM_HEARTBEAT_SECONDS', default=15, cast=int)
+
+# Likes, cooks and follows on the same target within this window are folded
+# into one notification ("Alice and 12 others liked your comment")
+NOTIFICATION_COALESCE_WINDOW_SECONDS = config('NOTIFICATION_COALESCE_WINDOW_SECONDS', default=86400, cast=int)
+
+# Followers notified per insert_many when a recipe is published
+NOTIFICATION_FANOUT_CHUNK_SIZE = config('NOTIFICATION_FANOUT_CHUNK_SIZE', default=1000, cast=int)
+
+# Per-user notification preferences are cached in process for this long
+NOTIFICATION_PREFERENCES_CACHE_SECONDS = config('NOTIFICATION_PREFERENCES_CACHE_SECONDS', default=60, cast=int)
+
+# Notification Digests
+# `python manage.py build_notification_digests` rolls up digest-mode events
+# into one notification (or email, via EMAIL_BACKEND) per user per period
+NOTIFICATION_DIGEST_PERIOD_HOURS = config('NOTIFICATION_DIGEST_PERIOD_HOURS', default=24, cast=int)
+NOTIFICATION_DIGEST_DELIVERY = config('NOTIFICATION_DIGEST_DELIVERY', default='in_app')  # in_app | email
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@recipewebsite.com')
+
+# Notification Retention
+# Read notifications expire through a TTL index on read_at; unread ones older
+# than NOTIFICATION_ARCHIVE_AFTER_DAYS are moved to `notifications_archive`
+# by `python manage.py archive_notifications`.
+NOTIFICATION_READ_TTL_DAYS = config('NOTIFICATION_READ_TTL_DAYS', default=30, cast=int)
+NOTIFICATION_ARCHIVE_AFTER_DAYS = config('NOTIFICATION_ARCHIVE_AFTER_DAYS', default=180, cast=int)
+
+# Home Timelines
+# Publishing a recipe pushes it into a capped timeline document per follower.
+# Recipes published while their author has at least TIMELINE_PUSH_MAX_FOLLOWERS
+# followers are not pushed (Recipe.timeline_pull); they are pulled when a
+# follower reads the feed.
+TIMELINE_MAX_ENTRIES = config('TIMELINE_MAX_ENTRIES', default=500, cast=int)
+TIMELINE_PUSH_MAX_FOLLOWERS = config('TIMELINE_PUSH_MAX_FOLLOWERS', default=10000, cast=int)
+TIMELINE_HIGH_FANOUT_CACHE_SECONDS = config('TIMELINE_HIGH_FANOUT_CACHE_SECONDS', default=300, cast=int)
+
+# Follow Suggestions
+# `python manage.py compute_follow_suggestions` scores candidates from the
+# follow graph, co-cooked recipes and cuisine preferences and stores the
+# best FOLLOW_SUGGESTIONS_TOP_K per user for /api/users/suggestions/.
+FOLLOW_SUGGESTIONS_TOP_K = config('FOLLOW_SUGGESTIONS_TOP_K', default=50, cast=int)
+
 # Media Files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -68,11 +68,12 @@ urlpatterns = [
 ]
 
 # Import gamification views for direct routes
-from apps.gamification.comments_views import update_comment, delete_comment, toggle_comment_like
+from apps.gamification.comments_views import update_comment, delete_comment, toggle_comment_like, comment_replies
 from apps.gamification.leaderboard_views import leaderboard_by_xp, leaderboard_by_recipes, leaderboard_by_cooked
 from apps.gamification.notification_views import (
     list_notifications, mark_notification_read, mark_all_read, 
-    delete_notification, unread_count
+    delete_notification, unread_count, bulk_notifications,
+    notification_stream, notification_preferences
 )
 
 # Add comment action routes
@@ -80,6 +81,7 @@ urlpatterns += [
     path('api/comments/<str:comment_id>/', update_comment, name='comment-update-put'),
     path('api/comments/<str:comment_id>/', delete_comment, name='comment-delete'),
     path('api/comments/<str:comment_id>/like/', toggle_comment_like, name='comment-like'),
+    path('api/comments/<str:comment_id>/replies/', comment_replies, name='comment-replies'),
 ]
 
 # Add leaderboard routes
@@ -94,6 +96,9 @@ urlpatterns += [
     path('api/notifications/', list_notifications, name='notifications-list'),
     path('api/notifications/unread-count/', unread_count, name='notifications-unread-count'),
     path('api/notifications/mark-all-read/', mark_all_read, name='notifications-mark-all-read'),
+    path('api/notifications/bulk/', bulk_notifications, name='notifications-bulk'),
+    path('api/notifications/stream/', notification_stream, name='notifications-stream'),
+    path('api/notifications/preferences/', notification_preferences, name='notifications-preferences'),
     path('api/notifications/<str:notification_id>/read/', mark_notification_read, name='notification-mark-read'),
     path('api/notifications/<str:notification_id>/', delete_notification, name='notification-delete'),
 ]
@@ -32,9 +32,28 @@ const Header = () => {
 
     fetchUnreadCount();
 
-    // Poll every 30 seconds
-    const interval = setInterval(fetchUnreadCount, 30000);
-    return () => clearInterval(interval);
+    // Live updates over SSE; fall back to polling every 30 seconds
+    let interval: ReturnType<typeof setInterval> | undefined;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(fetchUnreadCount, 30000);
+    };
+
+    const stream = notificationService.openStream({
+      onUnreadCount: setUnreadCount,
+      onNotification: (notification, counted) => {
+        setNotifications((current) => [notification, ...current.filter((n) => n.id !== notification.id)]);
+        if (counted) setUnreadCount((count) => count + 1);
+      },
+      onError: () => {
+        if (stream && stream.readyState === EventSource.CLOSED) startPolling();
+      },
+    });
+    if (!stream) startPolling();
+
+    return () => {
+      stream?.close();
+      if (interval) clearInterval(interval);
+    };
   }, [isAuthenticated]);
 
   // Fetch notifications when dropdown opens
@@ -26,7 +26,7 @@ export interface FeedRecipe {
     id: string;
     username: string;
     level: number;
-  };
+  } | null;
   images: string[];
   difficulty: string;
   total_time: number;
@@ -35,14 +35,43 @@ export interface FeedRecipe {
     count: number;
   };
   created_at: string;
+  published_at: string | null;
+}
+
+export type FeedEventType = 'recipe' | 'cook' | 'comment' | 'badge';
+
+export interface FeedEvent {
+  type: FeedEventType;
+  id: string;
+  created_at: string;
+  actor: {
+    id: string;
+    username: string;
+    avatar_url?: string;
+    level: number;
+  } | null;
+  recipe?: FeedRecipe;
+  cook?: {
+    photo_url: string;
+    rating?: number;
+    notes?: string;
+  };
+  comment?: {
+    content: string;
+    is_reply: boolean;
+  };
+  badge?: {
+    id: string;
+    name: string;
+    icon: string;
+    rarity: string;
+  };
 }
 
 export interface FeedResponse {
-  count: number;
-  page: number;
   limit: number;
-  total_pages: number;
-  results: FeedRecipe[];
+  next_cursor: string | null;
+  results: FeedEvent[];
 }
 
 export const followService = {
@@ -65,9 +94,13 @@ export const followService = {
     return response.data;
   },
 
-  async getActivityFeed(page: number = 1): Promise<FeedResponse> {
+  async getActivityFeed(cursor?: string | null, types?: FeedEventType[]): Promise<FeedResponse> {
     const response = await apiClient.get<FeedResponse>('/api/users/feed/', {
-      params: { page, limit: 20 }
+      params: {
+        limit: 20,
+        ...(cursor ? { cursor } : {}),
+        ...(types && types.length ? { types: types.join(',') } : {}),
+      }
     });
     return response.data;
   },
@@ -13,6 +13,8 @@ export interface Notification {
     username: string;
     avatar_url?: string;
   };
+  actor_count?: number;
+  actors?: { id: string; username: string }[];
 }
 
 export interface NotificationsResponse {
@@ -23,6 +25,8 @@ export interface NotificationsResponse {
   results: Notification[];
 }
 
+const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+
 export const notificationService = {
   async getNotifications(page: number = 1, unread_only: boolean = false): Promise<NotificationsResponse> {
     const response = await apiClient.get<NotificationsResponse>('/api/notifications/', {
@@ -47,4 +51,30 @@ export const notificationService = {
   async deleteNotification(notificationId: string): Promise<void> {
     await apiClient.delete(`/api/notifications/${notificationId}/`);
   },
+
+  /**
+   * Open the live notification stream (Server-Sent Events).
+   * Returns null when EventSource is unavailable or there is no token.
+   */
+  openStream(handlers: {
+    onUnreadCount?: (count: number) => void;
+    onNotification?: (notification: Notification, counted: boolean) => void;
+    onError?: () => void;
+  }): EventSource | null {
+    const token = localStorage.getItem('access_token');
+    if (!token || typeof EventSource === 'undefined') return null;
+
+    const source = new EventSource(
+      `${API_BASE_URL}/api/notifications/stream/?token=${encodeURIComponent(token)}`
+    );
+    source.addEventListener('unread_count', (event) => {
+      handlers.onUnreadCount?.(JSON.parse((event as MessageEvent).data).unread_count);
+    });
+    source.addEventListener('notification', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      handlers.onNotification?.(data.notification, Boolean(data.counted));
+    });
+    source.onerror = () => handlers.onError?.();
+    return source;
+  },
 };